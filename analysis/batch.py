@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run several datasets side by side in one process pool.
+
+Each dataset config names its folders and (optionally) its own settings:
+
+    [
+      {"name": "main",  "cleaned_dir": "cleaned",    "preprocessed_dir": "preprocessed",
+       "results_dir": "results"},
+      {"name": "explo", "cleaned_dir": "explo_data", "preprocessed_dir": "processed_explo",
+       "results_dir": "results_explo", "preprocess_args": ["--z_threshold", "2.5"]}
+    ]
+
+Optional keys: data_dir (raw jsPsych CSVs, cleaned into cleaned_dir
+first), preprocess_args, steps ("1,2"), n_bootstraps, seed,
+semantic_file, sem_all_cols, sem_sig_cols.
+
+The word registry, trial index templates and ISC kernels are imported
+and warmed once in the parent; workers are forked from it, so every
+dataset starts with them loaded. Each dataset runs in-process in its
+worker (preprocessing -> analysis steps), logs to
+cache/batch/<name>.log (run reports: <name>_<step>.json), and one row per dataset goes to
+<summary_dir>/batch_summary.csv (+ .json).
+
+Usage:
+    python analysis/batch.py analysis/batch_datasets.json [--jobs 3] [--n_bootstraps 10000]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+LOG_DIR = "cache/batch"
+SUMMARY_DIR = "batch_results"
+
+
+def warm_shared_state():
+    """
+    Import and warm everything datasets share, before the pool forks:
+    word registry tables, per-trial-size index templates, ISC kernels
+    (resolving "auto" runs the numba first-use check, which compiles the
+    kernel, so workers inherit the verdict instead of each re-checking).
+    """
+    import word_registry                       # noqa: F401  (tables built at import)
+    import masked_isc                          # noqa: F401
+    import data_analysis_multiarrangement      # noqa: F401
+    import isc_kernels
+    import preprocessing_multiarrangement as pm
+
+    isc_kernels.resolve_engine("auto")
+
+    for words in word_registry.CATEGORY_WORDS.values():
+        pm._triu(len(words))
+    pm._triu(word_registry.N_WORDS)
+
+
+def _as_args(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.split()
+    return [str(v) for v in value]
+
+
+def run_dataset(cfg, defaults, log_dir=LOG_DIR):
+    """
+    Clean (optional) -> preprocess -> analysis for one dataset config.
+    Returns a summary dict; failures are reported, not raised.
+    """
+    import preprocessing
+    import preprocessing_multiarrangement
+    import data_analysis_multiarrangement
+
+    name = cfg["name"]
+    cfg = {**defaults, **cfg}
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"{name}.log")
+
+    def report_path(step):
+        return os.path.join(log_dir, f"{name}_{step}.json")
+
+    summary = {"dataset": name, "status": "ok", "log": log_path}
+
+    t0, c0 = time.perf_counter(), time.process_time()
+    with open(log_path, "w", encoding="utf-8") as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            if cfg.get("data_dir"):
+                preprocessing.main(["--data_dir", cfg["data_dir"],
+                                    "--output_dir", cfg["cleaned_dir"],
+                                    "--report", report_path("clean")])
+
+            preprocessing_multiarrangement.main(
+                [cfg["cleaned_dir"], cfg["preprocessed_dir"]] + _as_args(cfg.get("preprocess_args"))
+                + ["--report", report_path("preprocess")]
+            )
+
+            analysis_argv = [
+                "--preprocessed_file", os.path.join(cfg["preprocessed_dir"], "all_rdms.npy"),
+                "--output_folder", cfg["results_dir"],
+                "--n_bootstraps", str(cfg["n_bootstraps"]),
+                "--steps", str(cfg.get("steps", "1,2,3")),
+                "--report", report_path("analysis"),
+            ]
+            if cfg.get("seed") is not None:
+                analysis_argv += ["--seed", str(cfg["seed"])]
+            for key in ("semantic_file", "sem_all_cols", "sem_sig_cols"):
+                if cfg.get(key):
+                    analysis_argv += [f"--{key}", str(cfg[key])]
+            data_analysis_multiarrangement.main(analysis_argv)
+        except BaseException as e:      # SystemExit from argparse included
+            print(f"\nFAILED: {type(e).__name__}: {e}")
+            summary["status"] = f"failed: {type(e).__name__}: {e}"
+
+    summary["wall_s"] = round(time.perf_counter() - t0, 3)
+    summary["cpu_s"] = round(time.process_time() - c0, 3)
+    summary.update(_dataset_results(cfg))
+    return summary
+
+
+def _dataset_results(cfg):
+    """Headline numbers from a dataset's output folders (missing files -> NaN)."""
+    out = {"preprocessed_dir": cfg["preprocessed_dir"], "results_dir": cfg["results_dir"]}
+    mpd_file = os.path.join(cfg["preprocessed_dir"], "mpd_values_all.csv")
+    if os.path.exists(mpd_file):
+        mpd = pd.read_csv(mpd_file)
+        out["n_participants"] = int((~mpd["excluded"]).sum())
+        out["n_excluded"] = int(mpd["excluded"].sum())
+    step1_file = os.path.join(cfg["results_dir"], "step1_subject_bootstrap_stats.csv")
+    if os.path.exists(step1_file):
+        step1 = pd.read_csv(step1_file)
+        out["mean_word_isc"] = float(np.nanmean(step1["mean"]))
+        out["n_words_p05"] = int((step1["p_value"] < 0.05).sum())
+    return out
+
+
+def run_batch(datasets, defaults, jobs=None, log_dir=LOG_DIR):
+    """Run all dataset configs in one process pool; returns one summary dict per dataset."""
+    warm_shared_state()
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(datasets)))
+
+    if jobs == 1:
+        rows = [run_dataset(cfg, defaults, log_dir) for cfg in datasets]
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as ex:
+            futures = [ex.submit(run_dataset, cfg, defaults, log_dir) for cfg in datasets]
+            rows = [f.result() for f in futures]
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preprocess and analyze several datasets in one process pool.")
+    parser.add_argument('config', type=str, help="JSON list of dataset configs")
+    parser.add_argument('--summary_dir', type=str, default=SUMMARY_DIR)
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Datasets processed at the same time (default: all cores)")
+    parser.add_argument('--n_bootstraps', type=int, default=10000,
+                        help="Default for datasets that do not set n_bootstraps")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Default analysis seed for datasets that do not set one")
+    args = parser.parse_args(argv)
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        datasets = json.load(f)
+    names = [d["name"] for d in datasets]
+    if len(set(names)) != len(names):
+        parser.error("Dataset names must be unique")
+
+    defaults = {"n_bootstraps": args.n_bootstraps, "seed": args.seed}
+    t0 = time.perf_counter()
+    rows = run_batch(datasets, defaults, jobs=args.jobs)
+    elapsed = time.perf_counter() - t0
+    summary = pd.DataFrame(rows)
+
+    os.makedirs(args.summary_dir, exist_ok=True)
+    csv_path = os.path.join(args.summary_dir, "batch_summary.csv")
+    summary.to_csv(csv_path, index=False)
+    with open(os.path.join(args.summary_dir, "batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"wall_s": round(elapsed, 3), "datasets": rows}, f, indent=1)
+
+    print(summary.to_string(index=False))
+    print(f"\n{len(summary)} datasets in {elapsed:.1f}s; summary saved to {csv_path}")
+    if (summary["status"] != "ok").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
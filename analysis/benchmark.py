@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite on synthetic cohorts (synthetic.py).
+
+For every cell of the grid (participants x vocabulary size x missing
+fraction) a cohort is generated in a temporary folder and these are
+timed (best and median of --repeat runs):
+
+  clean_file                               all raw exports (90 words, no missing pairs only)
+  combine_trials_for_participant           every participant's cleaned rows
+  load_and_combine_multiarrangement_trials the cleaned folder
+  calculate_word_iscs                      all subjects of the RDM tensor
+  step1 / step2 / step3                    run_step*_... with --n_bootstraps
+
+Each run appends one row per (benchmark, grid cell) to the history file
+(benchmarks/history.csv: run id, time, git commit, versions, grid
+parameters, timings), and the timings are compared with the previous
+run of the same cell.
+
+Usage:
+    python analysis/benchmark.py
+    python analysis/benchmark.py --participants 30 100 300 --words 90 180 --missing 0 0.2
+    python analysis/benchmark.py --only step1 step2 --n_bootstraps 50
+    python analysis/benchmark.py --only step1 --engine reference numpy    # compare ISC engines
+"""
+
+import os
+import io
+import sys
+import time
+import tempfile
+import argparse
+import platform
+import subprocess
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+import preprocessing
+import preprocessing_multiarrangement as pm
+import data_analysis_multiarrangement as da
+import isc_kernels
+
+HISTORY_FILE = "benchmarks/history.csv"
+BENCHMARKS = [
+    "clean_file",
+    "combine_trials_for_participant",
+    "load_and_combine_multiarrangement_trials",
+    "calculate_word_iscs",
+    "step1",
+    "step2",
+    "step3",
+]
+N_SEMANTIC_DIMS = 14     # columns of the synthetic semantic table (Step 3)
+
+
+def _timed(fn, repeat):
+    """Run fn() repeat times with output suppressed; returns the durations."""
+    times = []
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+    return times
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() if out.returncode == 0 else ""
+    except OSError:
+        return ""
+
+
+def _cleaned_rows(folder):
+    return [rows for _, rows, _ in pm.iter_participant_rows(folder)]
+
+
+def _semantic_table(n_words, rng):
+    cols = [f"dim{i + 1}" for i in range(N_SEMANTIC_DIMS)]
+    return pd.DataFrame(rng.normal(size=(n_words, N_SEMANTIC_DIMS)), columns=cols)
+
+
+def cell_benchmarks(n_participants, n_words, missing, noise, n_bootstraps, seed, only, workdir,
+                    engine="auto"):
+    """
+    {benchmark: (fn, n_items)} for one grid cell; generates the cohorts it needs.
+    """
+    wanted = set(only)
+    jobs = {}
+
+    raw_dir = os.path.join(workdir, "raw")
+    cleaned_dir = os.path.join(workdir, "cleaned")
+    if "clean_file" in wanted and n_words == synthetic.N_WORDS and missing == 0:
+        synthetic.make_cohort(raw_dir, n_participants, n_words, noise, missing, seed=seed, fmt="raw")
+        files = sorted(os.path.join(raw_dir, f) for f in os.listdir(raw_dir) if f.endswith(".csv")
+                       and f != "vocabulary.csv")
+        jobs["clean_file"] = (lambda: [preprocessing.clean_file(f) for f in files], len(files))
+
+    if wanted & {"combine_trials_for_participant", "load_and_combine_multiarrangement_trials"}:
+        synthetic.make_cohort(cleaned_dir, n_participants, n_words, noise, missing, seed=seed,
+                              fmt="cleaned")
+        vocab = None
+        if missing > 0:
+            vocab = pd.read_csv(os.path.join(cleaned_dir, "vocabulary.csv"),
+                                encoding=synthetic.ENCODING)["word"].tolist()
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            rows = _cleaned_rows(cleaned_dir)
+        jobs["combine_trials_for_participant"] = (
+            lambda: [pm.combine_trials_for_participant(r, n_words=n_words, master_word_list=vocab)
+                     for r in rows],
+            len(rows),
+        )
+        jobs["load_and_combine_multiarrangement_trials"] = (
+            lambda: pm.load_and_combine_multiarrangement_trials(
+                cleaned_dir, n_words=n_words, master_word_list=vocab),
+            n_participants,
+        )
+
+    if wanted & {"calculate_word_iscs", "step1", "step2", "step3"}:
+        rdms, mask, _, _ = synthetic.make_rdms(n_participants, n_words, noise, missing, seed=seed)
+        mask = mask if missing > 0 else None
+        subjects = np.arange(n_participants)
+        sem = _semantic_table(n_words, np.random.default_rng(seed))
+        all_cols = list(range(N_SEMANTIC_DIMS))
+        sig_cols = all_cols[:3]
+
+        def seeded(step, fn):
+            def run():
+                np.random.seed(seed + step)
+                return fn()
+            return run
+
+        jobs["calculate_word_iscs"] = (lambda: da.calculate_word_iscs(rdms, subjects, mask, engine),
+                                       n_words)
+        jobs["step1"] = (seeded(1, lambda: da.run_step1_subject_bootstrap(rdms, n_bootstraps, mask, engine)),
+                         n_bootstraps)
+        jobs["step2"] = (seeded(2, lambda: da.run_step2_word_bootstrap(rdms, n_bootstraps, mask, engine)),
+                         n_bootstraps)
+        jobs["step3"] = (seeded(3, lambda: da.run_step3_split_half(
+                             rdms, n_bootstraps, sem, all_cols, sig_cols, mask, engine)),
+                         n_bootstraps)
+
+    return {name: job for name, job in jobs.items() if name in wanted}
+
+
+def run_benchmarks(participants, words, missing, noise=1.5, n_bootstraps=20, repeat=3,
+                   seed=0, only=BENCHMARKS, engines=("auto",)):
+    """Time every benchmark over the grid; returns one row per (benchmark, cell, engine)."""
+    rows = []
+    for n_words in words:
+        for n_participants in participants:
+            for miss in missing:
+                for engine in engines:
+                    engine = isc_kernels.resolve_engine(engine)
+                    cell = f"{n_participants} participants, {n_words} words, missing {miss:g}, {engine}"
+                    print(f"\n[{cell}]")
+                    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+                        jobs = cell_benchmarks(n_participants, n_words, miss, noise, n_bootstraps,
+                                               seed, only, workdir, engine)
+                        for name in only:
+                            if name not in jobs:
+                                continue
+                            fn, n_items = jobs[name]
+                            times = _timed(fn, repeat)
+                            best, median = min(times), float(np.median(times))
+                            print(f"  {name:42s} best {best:8.4f}s  median {median:8.4f}s")
+                            rows.append({
+                                "benchmark": name,
+                                "participants": n_participants,
+                                "words": n_words,
+                                "missing": miss,
+                                "noise": noise,
+                                "n_bootstraps": n_bootstraps,
+                                "engine": engine,
+                                "items": n_items,
+                                "repeat": repeat,
+                                "best_s": round(best, 6),
+                                "median_s": round(median, 6),
+                            })
+    return rows
+
+
+KEY = ["benchmark", "participants", "words", "missing", "noise", "n_bootstraps", "engine"]
+
+
+def append_history(rows, history_file=HISTORY_FILE):
+    """Append a run to the history; returns (this run, previous history)."""
+    run = pd.DataFrame(rows)
+    run.insert(0, "run_id", datetime.now().strftime("%Y%m%d-%H%M%S"))
+    run.insert(1, "git_commit", _git_commit())
+    run.insert(2, "host", platform.node())
+    run.insert(3, "python", platform.python_version())
+    run.insert(4, "numpy", np.__version__)
+
+    previous = pd.read_csv(history_file) if os.path.exists(history_file) else None
+    if previous is not None and "engine" not in previous.columns:
+        # history from before the ISC engines: those runs used the reference loops
+        previous.insert(previous.columns.get_loc("n_bootstraps") + 1, "engine", "reference")
+        previous.to_csv(history_file, index=False)
+    os.makedirs(os.path.dirname(history_file) or ".", exist_ok=True)
+    run.to_csv(history_file, mode="a", header=previous is None, index=False)
+    return run, previous
+
+
+def compare(run, previous):
+    """Ratio of this run's best time to the last earlier run of the same cell."""
+    if previous is None or previous.empty:
+        return None
+    last = previous.drop_duplicates(KEY, keep="last")[KEY + ["run_id", "best_s"]]
+    merged = run.merge(last, on=KEY, how="inner", suffixes=("", "_prev"))
+    if merged.empty:
+        return None
+    merged["speedup"] = merged["best_s_prev"] / merged["best_s"]
+    return merged[KEY + ["run_id_prev", "best_s_prev", "best_s", "speedup"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the pipeline's hot paths on synthetic cohorts.")
+    parser.add_argument('--participants', type=int, nargs='+', default=[10, 30, 100])
+    parser.add_argument('--words', type=int, nargs='+', default=[synthetic.N_WORDS])
+    parser.add_argument('--missing', type=float, nargs='+', default=[0.0])
+    parser.add_argument('--noise', type=float, default=1.5)
+    parser.add_argument('--n_bootstraps', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', type=str, nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--engine', type=str, nargs='+', choices=isc_kernels.ENGINES, default=["auto"],
+                        help="ISC engine(s) for calculate_word_iscs and the steps (see isc_kernels.py)")
+    parser.add_argument('--history', type=str, default=HISTORY_FILE)
+    args = parser.parse_args(argv)
+
+    rows = run_benchmarks(args.participants, args.words, args.missing, args.noise,
+                          args.n_bootstraps, args.repeat, args.seed, args.only, args.engine)
+    if not rows:
+        sys.exit("No benchmark applies to this grid")
+    run, previous = append_history(rows, args.history)
+    print(f"\n{len(run)} timings appended to {args.history} (run {run['run_id'].iloc[0]})")
+
+    diff = compare(run, previous)
+    if diff is not None:
+        print("\nCompared with the previous run of each cell (speedup > 1 = faster now):")
+        print(diff.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,46 +3,133 @@ import pandas as pd
 import numpy as np
 import os
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
 from tqdm import tqdm
 
-# --- Constants ---
-N_WORDS = 90  # Your word count
+import instrument
+from excel_cache import read_excel_cached
+from masked_isc import masked_corr, mean_fisher_z, masked_word_iscs, word_vectors, without_self
+from isc_kernels import BLOCK, ENGINES, block_iscs, iter_blocks, resolve_engine
 
-def parse_col_range(col_str):
-    """Parses column strings like '2-10' or '3,4,5' into a list of indices."""
+def resolve_columns(col_str, columns):
+    """
+    Parses column strings like '2-10' or '3,4,5' (1-based, Excel-style)
+    into 0-based indices; each comma-separated item may also be a column
+    header (e.g. 'Mean_Language,Mean_Sensory') or a range of headers
+    ('Mean_Language-Mean_Valence').
+    """
+    columns = [str(c) for c in columns]
+    position = {c: i for i, c in enumerate(columns)}
     indices = []
     if not col_str:
         return indices
-    parts = col_str.split(',')
-    for part in parts:
-        if '-' in part:
-            start, end = part.split('-')
-            indices.extend(list(range(int(start), int(end) + 1)))
+    for part in col_str.split(','):
+        part = part.strip()
+        if part in position:
+            indices.append(position[part])
+        elif part.isdigit():
+            indices.append(int(part) - 1)
+        elif '-' in part:
+            start, end = part.split('-', 1)
+            if start.isdigit() and end.isdigit():
+                indices.extend(range(int(start) - 1, int(end)))
+            elif start in position and end in position:
+                indices.extend(range(position[start], position[end] + 1))
+            else:
+                raise ValueError(f"Cannot resolve column range '{part}'")
         else:
-            indices.append(int(part))
-    # Convert from 1-based (Excel-style) to 0-based (pandas-style)
-    return [i - 1 for i in indices]
+            raise ValueError(f"Unknown column '{part}'")
+    return indices
+
+def load_rdms(path):
+    """
+    Load preprocessed RDMs as a dense (n_subjects, n_words, n_words) array.
+
+    Accepts all_rdms.npy (dense), all_rdms_condensed.npy (n_subjects x
+    n_pairs) or all_pairs_sparse.npz (observed pairs only; unobserved
+    pairs are filled with the participant's mean, as in preprocessing).
+    """
+    from scipy.spatial.distance import squareform
 
-def calculate_word_iscs(rdm_data, subject_indices):
+    if path.endswith(".npz"):
+        from scipy import sparse
+        pairs = sparse.load_npz(path).tocsr()
+        n_pairs = pairs.shape[1]
+        n_words = int(round((1 + np.sqrt(1 + 8 * n_pairs)) / 2))
+        rdms = np.empty((pairs.shape[0], n_words, n_words))
+        for s in range(pairs.shape[0]):
+            row = pairs.getrow(s)
+            vec = np.full(n_pairs, np.nan)
+            vec[row.indices] = row.data
+            # mean over the full matrix, zero diagonal included
+            vec[np.isnan(vec)] = 2 * row.data.sum() / (2 * row.nnz + n_words)
+            rdms[s] = squareform(vec)
+        return rdms
+
+    data = np.load(path)
+    if data.ndim == 2:
+        return np.stack([squareform(v) for v in data])
+    return data
+
+def load_observed_mask(path, n_subjects, n_words):
+    """
+    Observed-pair mask as (n_subjects, n_words, n_words) bool.
+
+    Accepts observed_mask.npy from preprocessing (dense or condensed), or
+    an all_pairs_sparse.npz whose stored pairs are the observed ones.
+    """
+    from scipy.spatial.distance import squareform
+
+    if path.endswith(".npz"):
+        from scipy import sparse
+        pairs = sparse.load_npz(path).tocsr()
+        mask = np.zeros(pairs.shape, dtype=bool)
+        for s in range(pairs.shape[0]):
+            mask[s, pairs.indices[pairs.indptr[s]:pairs.indptr[s + 1]]] = True
+    else:
+        mask = np.load(path).astype(bool)
+    if mask.ndim == 2:
+        mask = np.stack([squareform(v, checks=False) for v in mask])
+    mask = mask | np.eye(n_words, dtype=bool)
+    if mask.shape != (n_subjects, n_words, n_words):
+        raise ValueError(f"Mask shape {mask.shape} does not match RDMs ({n_subjects}, {n_words}, {n_words}).")
+    return mask
+
+def calculate_word_iscs(rdm_data, subject_indices, mask=None, engine="auto"):
     """
     Calculates the ISC for every word for a given set of subjects.
     
     rdm_data: (n_total_subjects, n_words, n_words)
     subject_indices: (n_subjects_in_sample,) array of indices
+    mask: optional (n_total_subjects, n_words, n_words) bool, True = observed;
+          subject pairs are then correlated over jointly observed pairs only
+    engine: "reference" (the loop below), "numpy", "numba" or "auto"
+            (see isc_kernels.py); ignored with a mask
     """
+    if mask is not None:
+        return masked_word_iscs(rdm_data, mask, subject_indices)
+
+    n_words = rdm_data.shape[1]
     n_subjects_in_sample = len(subject_indices)
     if n_subjects_in_sample < 2:
-        return np.full(N_WORDS, np.nan)
+        return np.full(n_words, np.nan)
+
+    if resolve_engine(engine) != "reference":
+        words = np.arange(n_words)
+        cols = without_self(np.arange(n_words - 1), n_words)
+        return block_iscs(rdm_data, np.asarray(subject_indices)[None], words[None], cols[None], engine)[0]
 
     rdms = rdm_data[subject_indices, :, :]
     isc_by_word = []
 
-    for word_idx in range(N_WORDS):
+    for word_idx in range(n_words):
         word_vectors = rdms[:, word_idx, :]
-        word_vectors = np.delete(word_vectors, word_idx, axis=1)  # (n_subjects, N_WORDS-1)
-        # Each ROW is one subject's (N_WORDS-1)-dimensional vector
+        word_vectors = np.delete(word_vectors, word_idx, axis=1)  # (n_subjects, n_words-1)
+        # Each ROW is one subject's (n_words-1)-dimensional vector
         
         with np.errstate(divide='ignore', invalid='ignore'):
             # Correlate between subjects (rows) to get (n_subjects, n_subjects) matrix
@@ -75,45 +162,110 @@ def get_bootstrap_stats(boot_results, n_bootstraps):
     }
     return stats
 
-def run_step1_subject_bootstrap(all_rdms, n_bootstraps):
+_block_job = None   # (all_rdms, make_block, engine) of the running run_blocked, inherited by forked workers
+
+def _run_block(blk):
+    all_rdms, make_block, engine = _block_job
+    return blk, block_iscs(all_rdms, *make_block(blk), engine=engine)
+
+def run_blocked(all_rdms, n_bootstraps, make_block, engine, desc, block=BLOCK, n_jobs=1):
+    """
+    (n_bootstraps, n_rows) ISCs from isc_kernels.block_iscs, one block of
+    bootstraps per call; make_block(slice) gives (subjects, words, cols).
+
+    With n_jobs > 1 the blocks are spread over forked worker processes
+    (they share all_rdms copy-on-write). All indices are drawn before, so
+    results do not depend on block or n_jobs. numba parallelizes with its
+    own threads and always runs in-process.
+    """
+    global _block_job
+    blocks = list(iter_blocks(n_bootstraps, block))
+    pool = None
+    if (n_jobs > 1 and len(blocks) > 1 and resolve_engine(engine) != "numba"
+            and "fork" in multiprocessing.get_all_start_methods()):
+        pool = ProcessPoolExecutor(max_workers=min(n_jobs, len(blocks)),
+                                   mp_context=multiprocessing.get_context("fork"))
+
+    out = None
+    _block_job = (all_rdms, make_block, engine)
+    try:
+        with pool or nullcontext(), tqdm(total=n_bootstraps, desc=desc) as bar:
+            for blk, res in (pool.map(_run_block, blocks) if pool else map(_run_block, blocks)):
+                if out is None:
+                    out = np.empty((n_bootstraps, res.shape[1]))
+                out[blk] = res
+                bar.update(blk.stop - blk.start)
+    finally:
+        _block_job = None
+    return out
+
+def run_step1_subject_bootstrap(all_rdms, n_bootstraps, mask=None, engine="auto", block=BLOCK, n_jobs=1):
     """Replicates Step1_ISC_Pearson_sub_Bootstrap.m"""
     print("\n--- Running Step 1: Subject Bootstrap ---")
-    n_subjects = all_rdms.shape[0]
+    n_subjects, n_words = all_rdms.shape[:2]
     
     # Create all bootstrap indices at once
     boot_indices = np.random.randint(0, n_subjects, size=(n_bootstraps, n_subjects))
     
-    boot_results_per_word = []
+    if mask is None and resolve_engine(engine) != "reference":
+        words = np.arange(n_words)
+        cols = without_self(np.arange(n_words - 1), n_words)
+        boot_results_per_word = run_blocked(all_rdms, n_bootstraps, lambda blk: (
+            boot_indices[blk],
+            np.broadcast_to(words, (blk.stop - blk.start,) + words.shape),
+            np.broadcast_to(cols, (blk.stop - blk.start,) + cols.shape),
+        ), engine, "Step 1 Bootstraps", block, n_jobs)
+    else:
+        boot_results_per_word = []
     
-    for i in tqdm(range(n_bootstraps), desc="Step 1 Bootstraps"):
-        isc_for_all_words = calculate_word_iscs(all_rdms, boot_indices[i])
-        boot_results_per_word.append(isc_for_all_words)
+        for i in tqdm(range(n_bootstraps), desc="Step 1 Bootstraps"):
+            isc_for_all_words = calculate_word_iscs(all_rdms, boot_indices[i], mask, engine="reference")
+            boot_results_per_word.append(isc_for_all_words)
     
-    # Shape: (n_bootstraps, N_WORDS)
-    boot_results_per_word = np.array(boot_results_per_word)
+        # Shape: (n_bootstraps, n_words)
+        boot_results_per_word = np.array(boot_results_per_word)
     
     # Get stats for each word
     stats = get_bootstrap_stats(boot_results_per_word, n_bootstraps)
-    stats['word_index'] = np.arange(N_WORDS)
+    stats['word_index'] = np.arange(n_words)
     
     return pd.DataFrame(stats)
 
-def run_step2_word_bootstrap(all_rdms, n_bootstraps):
+def run_step2_word_bootstrap(all_rdms, n_bootstraps, mask=None, engine="auto", block=BLOCK, n_jobs=1):
     """Replicates Step2_ISC_Pearson_word_Bootstrap.m"""
     print("\n--- Running Step 2: Word Vector Bootstrap ---")
-    n_subjects = all_rdms.shape[0]
-    vec_dim = N_WORDS - 1  # This will be 88
+    n_subjects, n_words = all_rdms.shape[:2]
+    vec_dim = n_words - 1  # This will be 89 for 90 words
 
     # Create all bootstrap indices at once
     word_boot_indices = np.random.randint(0, vec_dim, size=(n_bootstraps, vec_dim))
     
+    if mask is None and resolve_engine(engine) != "reference":
+        subjects = np.arange(n_subjects)
+        words = np.arange(n_words)
+        boot_results_per_word = run_blocked(all_rdms, n_bootstraps, lambda blk: (
+            np.broadcast_to(subjects, (blk.stop - blk.start,) + subjects.shape),
+            np.broadcast_to(words, (blk.stop - blk.start,) + words.shape),
+            np.stack([without_self(idx, n_words) for idx in word_boot_indices[blk]]),
+        ), engine, "Step 2 Bootstraps", block, n_jobs)
+        stats = get_bootstrap_stats(boot_results_per_word, n_bootstraps)
+        stats['word_index'] = np.arange(n_words)
+        return pd.DataFrame(stats)
+
     boot_results_per_word = []
 
     for i in tqdm(range(n_bootstraps), desc="Step 2 Bootstraps"):
         current_word_boot_idx = word_boot_indices[i]
+
+        if mask is not None:
+            # All words at once, correlating over jointly observed components
+            cols = without_self(current_word_boot_idx, n_words)
+            boot_results_per_word.append(masked_word_iscs(all_rdms, mask, cols=cols))
+            continue
+
         isc_for_all_words = []
         
-        for word_idx in range(N_WORDS):
+        for word_idx in range(n_words):
             word_vectors = all_rdms[:, word_idx, :]
             word_vectors = np.delete(word_vectors, word_idx, axis=1)
             
@@ -136,60 +288,79 @@ def run_step2_word_bootstrap(all_rdms, n_bootstraps):
             
         boot_results_per_word.append(np.array(isc_for_all_words))
         
-    # Shape: (n_bootstraps, N_WORDS)
+    # Shape: (n_bootstraps, n_words)
     boot_results_per_word = np.array(boot_results_per_word)
     stats = get_bootstrap_stats(boot_results_per_word, n_bootstraps)
-    stats['word_index'] = np.arange(N_WORDS)
+    stats['word_index'] = np.arange(n_words)
     
     return pd.DataFrame(stats)
 
-def run_step3_split_half(all_rdms, n_bootstraps, sem_data, all_cols_idx, sig_cols_idx):
+def run_step3_split_half(all_rdms, n_bootstraps, sem_data, all_cols_idx, sig_cols_idx, mask=None,
+                         engine="auto", block=BLOCK, n_jobs=1):
     """Replicates Step3_ISC_BaseWord_SplitHalf_linearRegression.m"""
     print("\n--- Running Step 3: Split-Half Regression Bootstrap ---")
     
     if sem_data is None:
-        print("Warning: No semantic file provided. Skipping Step 3.")
+        instrument.warn("step3_skipped", "Warning: No semantic file provided. Skipping Step 3.")
         return None, None
         
-    if sem_data.shape[0] != N_WORDS:
-        raise ValueError(f"Semantic file has {sem_data.shape[0]} rows, but N_WORDS is {N_WORDS}. They must match.")
+    n_subjects, n_words = all_rdms.shape[:2]
+    if sem_data.shape[0] != n_words:
+        raise ValueError(f"Semantic file has {sem_data.shape[0]} rows, but the RDMs have {n_words} words. They must match.")
 
     sem_dim_pc = sem_data.iloc[:, all_cols_idx]
     sig_sem_dim = sem_data.iloc[:, sig_cols_idx]
     
-    n_subjects = all_rdms.shape[0]
-    n_half = N_WORDS // 2  # This will be 44 (floor of 89/2)
+    n_half = n_words // 2  # This will be 45 for 90 words
     
     boot_betas = []
     boot_corrs = []
     scaler = StandardScaler()
     model = LinearRegression()
 
+    fast = mask is None and resolve_engine(engine) != "reference"
+    if fast:
+        # All splits drawn up front (same RNG sequence as drawing them in the
+        # loop below), then every split's ISCs in blocks
+        perms = np.array([np.random.permutation(n_words) for _ in range(n_bootstraps)])
+        subjects = np.arange(n_subjects)
+        split_iscs = run_blocked(all_rdms, n_bootstraps, lambda blk: (
+            np.broadcast_to(subjects, (blk.stop - blk.start,) + subjects.shape),
+            perms[blk, :n_half],
+            np.broadcast_to(perms[blk, None, n_half:], (blk.stop - blk.start, n_half, n_words - n_half)),
+        ), engine, "Step 3 ISCs", block, n_jobs)
+
     for i in tqdm(range(n_bootstraps), desc="Step 3 Bootstraps"):
-        perm = np.random.permutation(N_WORDS)
+        perm = perms[i] if fast else np.random.permutation(n_words)
         half1_idx = perm[:n_half]
         half2_idx = perm[n_half:]
         
-        isc_split_half = []
-        
-        for word_idx in half1_idx:
-            split_vectors = all_rdms[:, word_idx, half2_idx]  # (n_subjects, len(half2))
-            # Each ROW is one subject's distance vector to the other half
+        if fast:
+            isc_split_half = split_iscs[i]
+        elif mask is not None:
+            # All half-1 words at once, over jointly observed pairs
+            x, m = word_vectors(all_rdms, mask, rows=half1_idx, cols=half2_idx)
+            isc_split_half = mean_fisher_z(masked_corr(x, m))
+        else:
+            isc_split_half = []
             
-            with np.errstate(divide='ignore', invalid='ignore'):
-                # Correlate between subjects (rows)
-                isc_matrix = np.corrcoef(split_vectors, rowvar=True)
+            for word_idx in half1_idx:
+                split_vectors = all_rdms[:, word_idx, half2_idx]  # (n_subjects, len(half2))
+                # Each ROW is one subject's distance vector to the other half
             
-            idx = np.tril_indices(n_subjects, k=-1)
-            isc_vector = isc_matrix[idx]
-            isc_vector_clipped = np.clip(isc_vector, -0.999999, 0.999999)
-            z_isc = np.arctanh(isc_vector_clipped)
-            z_isc_clean = z_isc[np.isfinite(z_isc)]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    # Correlate between subjects (rows)
+                    isc_matrix = np.corrcoef(split_vectors, rowvar=True)
             
-            mean_z_isc = np.mean(z_isc_clean) if len(z_isc_clean) > 0 else np.nan
-            isc_split_half.append(mean_z_isc)
+                idx = np.tril_indices(n_subjects, k=-1)
+                isc_vector = isc_matrix[idx]
+                isc_vector_clipped = np.clip(isc_vector, -0.999999, 0.999999)
+                z_isc = np.arctanh(isc_vector_clipped)
+                z_isc_clean = z_isc[np.isfinite(z_isc)]
             
-        isc_split_half = np.array(isc_split_half)
+                mean_z_isc = np.mean(z_isc_clean) if len(z_isc_clean) > 0 else np.nan
+                isc_split_half.append(mean_z_isc)
+            isc_split_half = np.array(isc_split_half)
         
         # --- Run Analysis for this split ---
         
@@ -224,7 +395,16 @@ def run_step3_split_half(all_rdms, n_bootstraps, sem_data, all_cols_idx, sig_col
     
     return corr_df, beta_df
 
-def main():
+def int_or_auto(text):
+    """argparse type: a positive int, or 'auto' (chosen by planner.py)."""
+    if text == "auto":
+        return text
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be >= 1 or 'auto', got {text}")
+    return value
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Run 89-word ISC analysis on preprocessed multiarrangement data.")
     parser.add_argument('--preprocessed_file', type=str, required=True, 
                         help="Path to preprocessed RDMs (.npy file)")
@@ -233,22 +413,79 @@ def main():
     parser.add_argument('--semantic_file', type=str, required=False, 
                         help="Path to the .xlsx file with 89 semantic dimensions (required for Step 3)")
     parser.add_argument('--sem_all_cols', type=str, required=False, 
-                        help="Columns for Step 3 correlations (e.g., '2-10' or '2,3,4'). 1-based index.")
+                        help="Columns for Step 3 correlations (e.g., '2-10' or '2,3,4'; 1-based index), "
+                             "or header names ('Mean_Language,Mean_Sensory' or 'Mean_Language-Mean_Valence')")
     parser.add_argument('--sem_sig_cols', type=str, required=False, 
-                        help="Columns for Step 3 regression (e.g., '3,4,5'). 1-based index.")
+                        help="Columns for Step 3 regression (e.g., '3,4,5'; 1-based index, or header names)")
     parser.add_argument('--n_bootstraps', type=int, default=10000, 
                         help="Number of bootstrap iterations")
+    parser.add_argument('--mask_file', type=str, required=False,
+                        help="Observed-pair mask (observed_mask.npy, or the all_pairs_sparse.npz itself); "
+                             "ISCs are then computed over jointly observed pairs only")
+    parser.add_argument('--steps', type=str, default="1,2,3",
+                        help="Analysis steps to run, e.g. '1' or '1,3' (default: all)")
+    parser.add_argument('--engine', type=str, choices=ENGINES, default="auto",
+                        help="ISC kernels for the unmasked steps: the reference loops, vectorized "
+                             "numpy, compiled numba, or auto (numba if installed, else numpy)")
+    parser.add_argument('--block_size', type=int_or_auto, default=BLOCK,
+                        help="Bootstraps per kernel call for numpy/numba, or 'auto' "
+                             "(fit to --memory_budget, see planner.py)")
+    parser.add_argument('--n_jobs', type=int_or_auto, default=1,
+                        help="Worker processes for the numpy kernels, or 'auto'")
+    parser.add_argument('--memory_budget', type=str, required=False,
+                        help="Memory budget for --dry_run and 'auto' settings, e.g. '8G' "
+                             "(default: 80%% of the available memory)")
+    parser.add_argument('--dry_run', '--dry-run', action='store_true',
+                        help="Only plan: read the RDM file header, calibrate each step and print "
+                             "projected time, peak memory and output sizes")
+    parser.add_argument('--seed', type=int, required=False,
+                        help="Seed the RNG before each step (seed + step number), so steps "
+                             "give the same results whether run together or separately")
     
-    args = parser.parse_args()
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrument.run_report("data_analysis_multiarrangement", args):
+        run(args)
+
+
+def run(args):
+    steps = {int(x) for x in args.steps.split(',') if x.strip()}
+
+    block, n_jobs = args.block_size, args.n_jobs
+    if args.dry_run or "auto" in (block, n_jobs):
+        import planner
+        with instrument.stage("plan") as record:
+            plan = planner.plan(args)
+            if record is not None:
+                record["plan"] = plan
+        planner.print_plan(plan)
+        if args.dry_run:
+            return
+        chosen = plan["chosen"] or {"block": BLOCK, "n_jobs": 1}
+        block = chosen["block"] if block == "auto" else block
+        n_jobs = chosen["n_jobs"] if n_jobs == "auto" else n_jobs
+        print(f"Using block size {block}, {n_jobs} worker process(es)")
 
     # Create output folder
     os.makedirs(args.output_folder, exist_ok=True)
     
     # --- 1. Load Preprocessed Data ---
-    print(f"Loading preprocessed RDMs from {args.preprocessed_file}")
-    all_rdms = np.load(args.preprocessed_file)
+    with instrument.stage("load"):
+        print(f"Loading preprocessed RDMs from {args.preprocessed_file}")
+        all_rdms = load_rdms(args.preprocessed_file)
+        instrument.count(participants=all_rdms.shape[0], words=all_rdms.shape[1])
     
-    print(f"Loaded dataset: {all_rdms.shape[0]} participants, {N_WORDS} words")
+    print(f"Loaded dataset: {all_rdms.shape[0]} participants, {all_rdms.shape[1]} words")
+
+    engine = resolve_engine(args.engine)
+    print(f"ISC engine: {engine}")
+
+    mask = None
+    if args.mask_file:
+        mask = load_observed_mask(args.mask_file, *all_rdms.shape[:2])
+        n_words = all_rdms.shape[1]
+        print(f"Using observed-pair mask: {mask[:, ~np.eye(n_words, dtype=bool)].mean():.1%} of pairs observed")
     
     # --- 2. Load Semantics ---
     sem_data = None
@@ -256,27 +493,47 @@ def main():
     sig_cols_idx = []
     if args.semantic_file:
         if not os.path.exists(args.semantic_file):
-            print(f"Warning: Semantic file not found at {args.semantic_file}. Skipping Step 3.")
+            instrument.warn("semantic_file_missing",
+                            f"Warning: Semantic file not found at {args.semantic_file}. Skipping Step 3.")
         else:
-            sem_data = pd.read_excel(args.semantic_file)
-            all_cols_idx = parse_col_range(args.sem_all_cols)
-            sig_cols_idx = parse_col_range(args.sem_sig_cols)
+            sem_data = read_excel_cached(args.semantic_file)
+            all_cols_idx = resolve_columns(args.sem_all_cols, sem_data.columns)
+            sig_cols_idx = resolve_columns(args.sem_sig_cols, sem_data.columns)
             if not all_cols_idx or not sig_cols_idx:
-                print("Warning: --sem_all_cols and --sem_sig_cols must be provided for Step 3. Skipping Step 3.")
+                instrument.warn("semantic_columns_missing",
+                                "Warning: --sem_all_cols and --sem_sig_cols must be provided for Step 3. "
+                                "Skipping Step 3.")
                 sem_data = None
     
+    def seed_step(step):
+        if args.seed is not None:
+            np.random.seed(args.seed + step)
+
     # --- 3. Run Analyses ---
-    step1_results = run_step1_subject_bootstrap(all_rdms, args.n_bootstraps)
-    step1_path = os.path.join(args.output_folder, 'step1_subject_bootstrap_stats.csv')
-    step1_results.to_csv(step1_path, index=False)
-    print(f"\nStep 1 results saved to {step1_path}")
+    if 1 in steps:
+        seed_step(1)
+        with instrument.stage("step1", bootstraps=args.n_bootstraps):
+            step1_results = run_step1_subject_bootstrap(all_rdms, args.n_bootstraps, mask, engine,
+                                                        block, n_jobs)
+        step1_path = os.path.join(args.output_folder, 'step1_subject_bootstrap_stats.csv')
+        step1_results.to_csv(step1_path, index=False)
+        print(f"\nStep 1 results saved to {step1_path}")
 
-    step2_results = run_step2_word_bootstrap(all_rdms, args.n_bootstraps)
-    step2_path = os.path.join(args.output_folder, 'step2_word_bootstrap_stats.csv')
-    step2_results.to_csv(step2_path, index=False)
-    print(f"\nStep 2 results saved to {step2_path}")
+    if 2 in steps:
+        seed_step(2)
+        with instrument.stage("step2", bootstraps=args.n_bootstraps):
+            step2_results = run_step2_word_bootstrap(all_rdms, args.n_bootstraps, mask, engine,
+                                                     block, n_jobs)
+        step2_path = os.path.join(args.output_folder, 'step2_word_bootstrap_stats.csv')
+        step2_results.to_csv(step2_path, index=False)
+        print(f"\nStep 2 results saved to {step2_path}")
 
-    corr_results, beta_results = run_step3_split_half(all_rdms, args.n_bootstraps, sem_data, all_cols_idx, sig_cols_idx)
+    corr_results = None
+    if 3 in steps:
+        seed_step(3)
+        with instrument.stage("step3", bootstraps=args.n_bootstraps):
+            corr_results, beta_results = run_step3_split_half(all_rdms, args.n_bootstraps, sem_data, all_cols_idx, sig_cols_idx,
+                                                             mask, engine, block, n_jobs)
     if corr_results is not None:
         corr_path = os.path.join(args.output_folder, 'step3_correlation_stats.csv')
         beta_path = os.path.join(args.output_folder, 'step3_regression_beta_stats.csv')
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+2D embeddings of per-subject RDMs (metric MDS), computed once and cached.
+
+- SMACOF is seeded with classical (Torgerson) MDS, so a single
+  deterministic init replaces the old 4 random restarts
+- Each subject's coordinates are stored in <cache_dir>/<key>.npy, where
+  the key is a hash of the RDM values plus the MDS settings. The
+  per-participant maps, the 4x8 grid and later runs all read from the
+  same cache, so only new or changed RDMs are ever re-embedded.
+- All subject maps are Procrustes-aligned (rotation/reflection +
+  translation) to the group-mean map, so the same word lands in
+  comparable places across panels.
+
+Usage (from another script):
+    from embeddings import compute_embeddings, compute_aligned_embeddings
+    coords = compute_embeddings(all_rdms)                # (n_subj, 90, 2)
+    aligned, group = compute_aligned_embeddings(all_rdms)
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+
+CACHE_DIR = "cache/embeddings"
+
+# init="classical": one SMACOF run from the Torgerson solution.
+# init="random":    the original n_init random restarts (n_init=4).
+MDS_SETTINGS = {
+    "n_components": 2,
+    "init": "classical",
+    "n_init": 1,
+    "max_iter": 300,
+    "random_state": 42,
+}
+
+
+# ---------------------------------------------------------------------
+# CORE FUNCTIONS
+# ---------------------------------------------------------------------
+
+def classical_mds(rdms, n_components=2):
+    """
+    Classical (Torgerson) MDS via one eigendecomposition.
+
+    rdms: (..., n, n) dissimilarity matrices; leading axes are batched.
+    Returns: coords (..., n, n_components).
+    """
+    d2 = np.asarray(rdms, dtype=np.float64) ** 2
+    # Double centering: B = -1/2 * J D^2 J
+    b = -0.5 * (
+        d2
+        - d2.mean(axis=-1, keepdims=True)
+        - d2.mean(axis=-2, keepdims=True)
+        + d2.mean(axis=(-2, -1), keepdims=True)
+    )
+    evals, evecs = np.linalg.eigh(b)  # ascending eigenvalues
+    evals = evals[..., ::-1][..., :n_components]
+    evecs = evecs[..., ::-1][..., :n_components]
+    return evecs * np.sqrt(np.clip(evals, 0.0, None))[..., None, :]
+
+
+def embed_subject(rdm, n_components=2, init="classical", n_init=1,
+                  max_iter=300, random_state=0, init_coords=None):
+    """
+    Metric MDS on a single subject's 90x90 dissimilarity matrix.
+    init_coords: precomputed classical_mds(rdm) (e.g. from one batched
+    call over all subjects); computed here if None.
+    Returns: coords (90 x n_components).
+    """
+    from sklearn.manifold import MDS, smacof
+
+    if init == "classical":
+        if init_coords is None:
+            init_coords = classical_mds(rdm, n_components)
+        coords, _ = smacof(
+            rdm,
+            metric=True,
+            n_components=n_components,
+            init=init_coords,
+            n_init=1,
+            max_iter=max_iter,
+            random_state=random_state,
+        )
+        return coords
+
+    mds = MDS(
+        n_components=n_components,
+        dissimilarity="precomputed",
+        random_state=random_state,
+        n_init=n_init,
+        max_iter=max_iter,
+    )
+    return mds.fit_transform(rdm)
+
+
+def embedding_key(rdm, settings):
+    """
+    Cache key for one RDM: sha1 over the matrix values and the MDS settings.
+    """
+    rdm = np.ascontiguousarray(rdm, dtype=np.float64)
+    h = hashlib.sha1()
+    h.update(str(rdm.shape).encode("utf-8"))
+    h.update(rdm.tobytes())
+    h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def compute_embeddings(all_rdms, cache_dir=CACHE_DIR, n_jobs=-1, **settings):
+    """
+    Embed every subject's RDM in 2D, reusing cached coordinates.
+
+    Parameters
+    ----------
+    all_rdms : np.ndarray
+        Array of shape (n_subjects, N_WORDS, N_WORDS).
+    cache_dir : str or None
+        Folder holding <key>.npy coordinate files. None disables caching.
+    n_jobs : int
+        Number of worker processes for the missing embeddings
+        (-1 = all cores).
+    **settings
+        Overrides for MDS_SETTINGS (n_components, n_init, max_iter,
+        random_state).
+
+    Returns
+    -------
+    coords : np.ndarray
+        Array of shape (n_subjects, N_WORDS, n_components).
+    """
+    settings = {**MDS_SETTINGS, **settings}
+    n_subj = all_rdms.shape[0]
+
+    keys = [embedding_key(rdm, settings) for rdm in all_rdms]
+    coords = [None] * n_subj
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for s, key in enumerate(keys):
+            path = os.path.join(cache_dir, f"{key}.npy")
+            if os.path.exists(path):
+                coords[s] = np.load(path)
+
+    missing = [s for s in range(n_subj) if coords[s] is None]
+    print(f"Embeddings: {n_subj - len(missing)} cached, {len(missing)} to compute.")
+
+    if missing:
+        from joblib import Parallel, delayed
+
+        # Torgerson seeds for all missing subjects in one batched eigendecomposition
+        inits = [None] * len(missing)
+        if settings["init"] == "classical":
+            inits = classical_mds(all_rdms[missing], settings["n_components"])
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(embed_subject)(all_rdms[s], init_coords=init, **settings)
+            for s, init in zip(missing, inits)
+        )
+        for s, xy in zip(missing, results):
+            coords[s] = xy
+            if cache_dir is not None:
+                np.save(os.path.join(cache_dir, f"{keys[s]}.npy"), xy)
+
+    return np.stack(coords, axis=0)
+
+
+def procrustes_align(coords, reference):
+    """
+    Align every subject map to a reference map in one batched step.
+
+    Orthogonal Procrustes (rotation/reflection) after centering; the
+    scale of each subject map is left untouched.
+
+    coords: (n_subjects, n, k), reference: (n, k).
+    Returns: aligned coords, same shape as coords.
+    """
+    ref_mean = reference.mean(axis=0)
+    ref_c = reference - ref_mean
+    x_c = coords - coords.mean(axis=1, keepdims=True)
+
+    # Q = U V^T from the SVD of X^T R, for all subjects at once
+    m = np.einsum("snk,nl->skl", x_c, ref_c)
+    u, _, vt = np.linalg.svd(m)
+    q = u @ vt
+    return x_c @ q + ref_mean
+
+
+def compute_aligned_embeddings(all_rdms, cache_dir=CACHE_DIR, n_jobs=-1, **settings):
+    """
+    compute_embeddings() + Procrustes alignment to the group-mean map.
+
+    Returns
+    -------
+    coords : np.ndarray
+        Aligned coordinates, shape (n_subjects, N_WORDS, n_components).
+    group_coords : np.ndarray
+        Embedding of the group-mean RDM, shape (N_WORDS, n_components).
+    """
+    settings = {**MDS_SETTINGS, **settings}
+    coords = compute_embeddings(all_rdms, cache_dir=cache_dir, n_jobs=n_jobs, **settings)
+    group_coords = compute_embeddings(
+        all_rdms.mean(axis=0, keepdims=True), cache_dir=cache_dir, n_jobs=1, **settings
+    )[0]
+    return procrustes_align(coords, group_coords), group_coords
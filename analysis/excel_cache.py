@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cached reading of Excel inputs (e.g. Behav_Neural_word_ISC.xlsx).
+
+On the first read every sheet of the workbook is parsed once and stored
+as a .npz of its columns (dtypes preserved) in cache/excel/<sha1>/, where
+<sha1> is the hash of the workbook's bytes. Later reads of any sheet
+load the .npz as long as the workbook is unchanged; editing the file
+changes the hash and triggers a fresh conversion.
+
+The format is plain arrays plus JSON (no pickle), so a cache is readable
+under any pandas version and loading it runs no code: numeric, boolean
+and datetime columns are stored as arrays, other columns as one JSON
+value per cell, and each column's dtype is restored on load. Caches in
+an older format are converted again.
+
+Usage:
+    from excel_cache import read_excel_cached
+    df = read_excel_cached("Behav_Neural_word_ISC.xlsx")              # first sheet
+    df = read_excel_cached("Behav_Neural_word_ISC.xlsx", "GM_ISC")    # by name
+"""
+
+import os
+import json
+import hashlib
+import datetime
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = "cache/excel"
+FORMAT = 2          # sheets.json "format"; 1 (no key) was pickled DataFrames
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """sha1 of a file's contents."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _encode_cell(value):
+    """JSON-safe form of one object-column cell (Excel yields no other types)."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if value is pd.NaT:
+        return {"nat": None}
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"time": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"timedelta": pd.Timedelta(value).isoformat()}
+    raise TypeError(f"Cannot cache a {type(value).__name__} cell: {value!r}")
+
+
+def _decode_cell(value):
+    if not isinstance(value, dict):
+        return value
+    (kind, text), = value.items()
+    if kind == "nat":
+        return pd.NaT
+    if kind == "datetime":
+        return pd.Timestamp(text)
+    if kind == "time":
+        return datetime.time.fromisoformat(text)
+    return pd.Timedelta(text)
+
+
+def _save_sheet(df, path):
+    """One sheet as column arrays in a .npz; returns its column labels and dtypes."""
+    arrays, dtypes = {}, []
+    for i, (_, column) in enumerate(df.items()):
+        values = column.to_numpy()
+        if values.dtype.kind in "biufcmM":
+            arrays[f"c{i}"] = values
+        else:
+            arrays[f"c{i}"] = np.array([json.dumps(_encode_cell(v), ensure_ascii=False) for v in values],
+                                       dtype=str)
+        dtypes.append(str(column.dtype))
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+    return [_encode_cell(label) for label in df.columns], dtypes
+
+
+def _load_sheet(path, columns, dtypes):
+    data = {}
+    with np.load(path, allow_pickle=False) as z:
+        for i, dtype in enumerate(dtypes):
+            values = z[f"c{i}"]
+            if values.dtype.kind == "U":
+                values = [_decode_cell(json.loads(v)) for v in values]
+            column = pd.Series(values, dtype=object if dtype == "object" else None)
+            data[i] = column if dtype == "object" else column.astype(dtype)
+    df = pd.DataFrame(data)
+    df.columns = [_decode_cell(label) for label in columns]
+    return df
+
+
+def _convert(path, out_dir):
+    """Parse every sheet once and store it; returns the index (sheet names, columns, dtypes)."""
+    sheets = pd.read_excel(path, sheet_name=None)
+    os.makedirs(out_dir, exist_ok=True)
+    index = {"format": FORMAT, "source": os.path.abspath(path), "sheets": list(sheets), "columns": [],
+             "dtypes": []}
+    for i, df in enumerate(sheets.values()):
+        tmp_path = os.path.join(out_dir, f"{i}.tmp.npz")
+        columns, dtypes = _save_sheet(df, tmp_path)
+        os.replace(tmp_path, os.path.join(out_dir, f"{i}.npz"))
+        index["columns"].append(columns)
+        index["dtypes"].append(dtypes)
+    # index written last: its presence marks a complete conversion
+    with open(os.path.join(out_dir, "sheets.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    return index
+
+
+def read_excel_cached(path, sheet_name=0, cache_dir=CACHE_DIR):
+    """
+    pd.read_excel(path, sheet_name) through the binary cache.
+
+    Parameters
+    ----------
+    path : str
+        Workbook path.
+    sheet_name : int or str
+        Sheet position (0-based) or name, as in pd.read_excel.
+    cache_dir : str or None
+        Cache root; None reads the workbook directly.
+    """
+    if cache_dir is None:
+        return pd.read_excel(path, sheet_name=sheet_name)
+
+    out_dir = os.path.join(cache_dir, file_sha1(path))
+    index_path = os.path.join(out_dir, "sheets.json")
+    index = None
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    if index is None or index.get("format") != FORMAT:
+        index = _convert(path, out_dir)
+    names = index["sheets"]
+
+    if isinstance(sheet_name, str):
+        if sheet_name not in names:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found in {path}: {names}")
+        pos = names.index(sheet_name)
+    else:
+        pos = int(sheet_name)
+        if not 0 <= pos < len(names):
+            raise IndexError(f"Worksheet index {pos} is invalid, {len(names)} worksheets found")
+    return _load_sheet(os.path.join(out_dir, f"{pos}.npz"), index["columns"][pos], index["dtypes"][pos])
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental per-word ISC: add, exclude or remove one participant without
+rerunning calculate_word_iscs over the whole cohort.
+
+The Step 1 statistic for word w is the mean Fisher z of r_ab over all
+subject pairs, where r_ab correlates subjects a and b's (n_words - 1)
+vectors of distances from w to every other word. With each vector
+standardized once (centred, unit norm: its "profile"), r_ab is a dot
+product of two profiles. The state keeps
+
+    profiles   (n_subjects, n_words, n_words - 1)   one per participant
+    z_sum      (n_words,)   sum of finite, clipped Fisher-z over included pairs
+    n_pairs    (n_words,)   number of those pairs
+
+so a participant joining or leaving changes only their own row of each
+word's ISC matrix: n_included x n_words x (n_words - 1) multiply-adds.
+Values agree with calculate_word_iscs to ~1e-13 (pairs with a constant
+vector are skipped, as there). Unmasked RDMs only: masked correlations
+depend on each pair's joint observations and have no per-subject profile.
+
+Usage:
+    from incremental_isc import IncrementalISC
+    state = IncrementalISC.from_rdms(all_rdms, participant_ids)
+    state.add(new_rdm, "p33")             # live update during collection
+    state.what_if(exclude=["p07"])        # ISC per word without p07, state unchanged
+    state.exclude("p07"); state.iscs()    # or apply it
+
+    python analysis/incremental_isc.py --exclude 0wsojjatgf_f9hok0 [--check]
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from isc_kernels import CLIP
+from masked_isc import without_self
+
+STATE_FILE = "cache/incremental_isc.npz"
+
+
+def word_profiles(rdms):
+    """
+    Standardized word vectors of (..., n_words, n_words) RDMs:
+    (..., n_words, n_words - 1), each row centred with unit norm (the word's
+    distance to itself dropped, as np.delete does in calculate_word_iscs).
+    Rows of a constant vector are NaN.
+    """
+    n_words = rdms.shape[-1]
+    cols = without_self(np.arange(n_words - 1), n_words)
+    x = np.take_along_axis(rdms, np.broadcast_to(cols, rdms.shape[:-1] + (n_words - 1,)), axis=-1)
+    x = x - x.mean(axis=-1, keepdims=True)
+    norm = np.sqrt(np.einsum("...d,...d->...", x, x))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(norm[..., None] > 0, x / norm[..., None], np.nan)
+
+
+def _fisher_z(r):
+    """Clipped Fisher z with non-finite values set to 0, and the finite mask."""
+    with np.errstate(invalid="ignore"):
+        z = np.arctanh(np.clip(r, -CLIP, CLIP))
+    finite = np.isfinite(z)
+    return np.where(finite, z, 0.0), finite
+
+
+class IncrementalISC:
+    """Per-word ISC sums over the included participants, updated one participant at a time."""
+
+    def __init__(self, n_words):
+        self.n_words = n_words
+        self.ids = []
+        self.profiles = np.empty((0, n_words, n_words - 1))
+        self.included = np.empty(0, dtype=bool)
+        self.z_sum = np.zeros(n_words)
+        self.n_pairs = np.zeros(n_words, dtype=np.int64)
+
+    @classmethod
+    def from_rdms(cls, rdms, ids=None):
+        """State of a whole cohort (all included), built in one pass over the words."""
+        n_subjects, n_words = rdms.shape[:2]
+        state = cls(n_words)
+        state.ids = [str(i) for i in (range(n_subjects) if ids is None else ids)]
+        if len(set(state.ids)) != n_subjects:
+            raise ValueError("participant ids must be unique and match the RDMs")
+        state.profiles = word_profiles(np.asarray(rdms, dtype=float))
+        state.included = np.ones(n_subjects, dtype=bool)
+        state.recompute()
+        return state
+
+    # ---------------- lookups ----------------
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _slot(self, subject_id):
+        try:
+            return self.ids.index(str(subject_id))
+        except ValueError:
+            raise KeyError(f"Unknown participant: {subject_id!r}") from None
+
+    def _row(self, slot, others):
+        """(z sum, pair count) per word of slot's pairs with the slots in others."""
+        others = others[others != slot]
+        r = np.einsum("swd,wd->sw", self.profiles[others], self.profiles[slot])
+        z, finite = _fisher_z(r)
+        return z.sum(axis=0), finite.sum(axis=0)
+
+    @property
+    def n_included(self):
+        return int(self.included.sum())
+
+    # ---------------- updates ----------------
+
+    def add(self, rdm, subject_id=None, include=True):
+        """Add one participant's (n_words, n_words) RDM."""
+        subject_id = str(len(self.ids) if subject_id is None else subject_id)
+        if subject_id in self.ids:
+            raise ValueError(f"Participant {subject_id!r} is already in the state")
+        if np.shape(rdm) != (self.n_words, self.n_words):
+            raise ValueError(f"Expected a {self.n_words}x{self.n_words} RDM, got {np.shape(rdm)}")
+        self.ids.append(subject_id)
+        self.profiles = np.concatenate([self.profiles, word_profiles(np.asarray(rdm, dtype=float))[None]])
+        self.included = np.append(self.included, False)
+        if include:
+            self.include(subject_id)
+
+    def include(self, subject_id):
+        """Count an (excluded) participant's pairs again."""
+        slot = self._slot(subject_id)
+        if not self.included[slot]:
+            z, n = self._row(slot, np.flatnonzero(self.included))
+            self.z_sum += z
+            self.n_pairs += n
+            self.included[slot] = True
+
+    def exclude(self, subject_id):
+        """Drop a participant's pairs from the sums, keeping their profile."""
+        slot = self._slot(subject_id)
+        if self.included[slot]:
+            self.included[slot] = False
+            z, n = self._row(slot, np.flatnonzero(self.included))
+            self.z_sum -= z
+            self.n_pairs -= n
+
+    def remove(self, subject_id):
+        """Exclude a participant and forget their profile."""
+        self.exclude(subject_id)
+        slot = self._slot(subject_id)
+        del self.ids[slot]
+        self.profiles = np.delete(self.profiles, slot, axis=0)
+        self.included = np.delete(self.included, slot)
+
+    def recompute(self):
+        """Rebuild the sums from the profiles (e.g. after many updates, to shed rounding drift)."""
+        slots = np.flatnonzero(self.included)
+        self.z_sum = np.zeros(self.n_words)
+        self.n_pairs = np.zeros(self.n_words, dtype=np.int64)
+        i, j = np.tril_indices(len(slots), k=-1)
+        for w in range(self.n_words):
+            p = self.profiles[slots, w]
+            z, finite = _fisher_z((p @ p.T)[i, j])
+            self.z_sum[w] = z.sum()
+            self.n_pairs[w] = finite.sum()
+
+    # ---------------- queries ----------------
+
+    def iscs(self):
+        """Mean Fisher-z ISC per word over the included participants (NaN without pairs)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n_pairs > 0, self.z_sum / np.maximum(self.n_pairs, 1), np.nan)
+
+    def what_if(self, exclude=(), include=()):
+        """
+        ISC per word if the given participants were excluded / included,
+        without changing the state; costs one row per participant named.
+        """
+        exclude = np.array(sorted({self._slot(s) for s in exclude}), dtype=int)
+        include = np.array(sorted({self._slot(s) for s in include}), dtype=int)
+        exclude = exclude[self.included[exclude]]
+        include = include[~self.included[include]]
+        if len(np.intersect1d(exclude, include)):
+            raise ValueError("A participant cannot be both excluded and included")
+
+        z_sum, n_pairs = self.z_sum.copy(), self.n_pairs.copy()
+        kept = np.setdiff1d(np.flatnonzero(self.included), exclude)
+        for slot in exclude:    # pairs with the kept participants; pairs within exclude below
+            z, n = self._row(slot, kept)
+            z_sum -= z
+            n_pairs -= n
+        for a, slot in enumerate(exclude):
+            z, n = self._row(slot, exclude[a + 1:])
+            z_sum -= z
+            n_pairs -= n
+        for b, slot in enumerate(include):
+            z, n = self._row(slot, np.concatenate([kept, include[:b]]))
+            z_sum += z
+            n_pairs += n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n_pairs > 0, z_sum / np.maximum(n_pairs, 1), np.nan)
+
+    # ---------------- persistence ----------------
+
+    def save(self, path=STATE_FILE):
+        np.savez(path, ids=np.array(self.ids, dtype=str), profiles=self.profiles,
+                 included=self.included, z_sum=self.z_sum, n_pairs=self.n_pairs)
+
+    @classmethod
+    def load(cls, path=STATE_FILE):
+        with np.load(path) as z:
+            state = cls(z["profiles"].shape[1])
+            state.ids = z["ids"].tolist()
+            state.profiles = z["profiles"]
+            state.included = z["included"]
+            state.z_sum = z["z_sum"]
+            state.n_pairs = z["n_pairs"]
+        return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-word ISC with what-if participant exclusions.")
+    parser.add_argument('--rdm_file', type=str, default="preprocessed/all_rdms.npy",
+                        help="all_rdms.npy, all_rdms_condensed.npy or all_pairs_sparse.npz")
+    parser.add_argument('--participants_file', type=str, default="preprocessed/participant_info.csv")
+    parser.add_argument('--word_order_file', type=str, default="preprocessed/word_order.csv")
+    parser.add_argument('--exclude', type=str, nargs='*', default=[],
+                        help="Participant ids (or indices) to leave out")
+    parser.add_argument('--top', type=int, default=10, help="Words with the largest ISC change to list")
+    parser.add_argument('--check', action='store_true',
+                        help="Compare against calculate_word_iscs on the remaining participants")
+    args = parser.parse_args(argv)
+
+    from data_analysis_multiarrangement import calculate_word_iscs, load_rdms
+
+    all_rdms = load_rdms(args.rdm_file)
+    ids = pd.read_csv(args.participants_file)["participant_id"].astype(str).tolist()
+    words = pd.read_csv(args.word_order_file, encoding="utf-8-sig")["word"].tolist()
+    state = IncrementalISC.from_rdms(all_rdms, ids)
+    exclude = [ids[int(s)] if s.isdigit() and s not in ids else s for s in args.exclude]
+
+    base = state.iscs()
+    isc = state.what_if(exclude=exclude)
+    print(f"{len(state)} participants, excluding {len(exclude)}: "
+          f"mean ISC {np.nanmean(base):.4f} -> {np.nanmean(isc):.4f}")
+    delta = isc - base
+    for w in np.argsort(-np.abs(np.nan_to_num(delta)))[:args.top if exclude else 0]:
+        print(f"  {words[w]:<12} {base[w]:.4f} -> {isc[w]:.4f} ({delta[w]:+.4f})")
+
+    if args.check:
+        keep = [i for i, pid in enumerate(ids) if pid not in set(exclude)]
+        reference = calculate_word_iscs(all_rdms, np.array(keep), engine="reference")
+        print(f"max |difference| vs calculate_word_iscs: {np.nanmax(np.abs(isc - reference)):.2e}")
+
+
+if __name__ == "__main__":
+    main()
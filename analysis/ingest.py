@@ -0,0 +1,689 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local ingestion service for live jsPsych submissions (asyncio, stdlib only).
+
+Instead of exporting CSVs into data/ and running preprocessing.py, the
+experiment (or the replay client below) POSTs its data to this service:
+
+  POST /submit     a participant's full export, as the pipe plugin's CSV
+                   data_string (Content-Type text/csv) or as jsPsych JSON
+                   rows (a list, or one row per request for live trials).
+                   Rows without placements columns are filled from their
+                   raw_payload; survey / fullscreen rows carry the
+                   participant metadata.
+  GET  /status     participants, trials, batches, queue size, flush latency
+
+Arrangement trials are validated and classified with clean_file's logic
+(preprocessing.classify_arrangement: category from the word set, unknown
+or unparsable trials rejected; the dissimilarity vector must match the
+number of placed words), and only a participant's first trial of each
+category is kept, across submissions. Accepted trials go to a queue; one
+flusher batches them (up to --max_batch trials or --max_latency seconds
+after the first) and appends each batch to the store in a writer thread,
+so the event loop never blocks on disk. A request is answered once its
+trials are on disk.
+
+Participant metadata (extract_metadata's duration and survey answers) is
+kept in parts, so rows arriving one request at a time add up: each
+submission stores its first fullscreen and last time_elapsed and its
+survey answers, and read_store merges them per participant (earliest
+start, latest end, last answer by trial_index).
+
+Store (<store_dir>/*-<seq>.npz, written atomically): per batch, columnar.
+part-<seq>.npz holds trials: participant_number, trial_category,
+n_words, trial_index, received_at; ragged columns as values + offsets
+(dissimilarity_vector float64, word_ids int16 from word_registry,
+placements / distance_matrix JSON as UTF-8). meta-<seq>.npz holds the
+metadata parts (META_COLS).
+
+Commands:
+    python analysis/ingest.py serve --store cache/ingest [--port 8765]
+    python analysis/ingest.py replay data --url http://127.0.0.1:8765 [--mode trials] [--copies 10]
+    python analysis/ingest.py export --store cache/ingest --output_dir cleaned_live
+
+export writes cleaned_<participant>.csv files in clean_file's format, so
+preprocessing_multiarrangement.py runs on them unchanged.
+"""
+
+import io
+import os
+import glob
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+import word_registry as wr
+from preprocessing import (KEEP_COLS, classify_arrangement, extract_metadata, extract_placement_words,
+                           is_valid_category)
+
+STORE_DIR = "cache/ingest"
+PORT = 8765
+MAX_BATCH = 500              # trials per shard at most
+MAX_LATENCY = 0.25           # seconds from a batch's first trial to its flush
+QUEUE_SIZE = 20000           # accepted trials waiting for a flush (back-pressure beyond)
+MAX_BODY = 64 * 2**20
+METADATA_COLS = ["time_elapsed_sec", "mandarin_proficiency", "age", "gender"]
+SURVEY_COLS = METADATA_COLS[1:]
+META_COLS = ["participant_number", "trial_index", "fullscreen_start_ms", "time_elapsed_ms"] + SURVEY_COLS
+TEXT_COLS = ["placements", "distance_matrix"]
+PAYLOAD_COLS = ["placements", "dissimilarity_vector", "distance_matrix", "n_words"]
+REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+# ---------------------------------------------------------------------
+# Submissions -> trial records
+# ---------------------------------------------------------------------
+
+def _json_text(value):
+    """JSON text for a column that may arrive decoded (JSON rows) or as text (CSV)."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def submission_frame(body, content_type="", participant=None):
+    """jsPsych rows of one submission (CSV text, a JSON list of rows, or one JSON row)."""
+    text = body.decode("utf-8-sig")
+    if "csv" in content_type or not text.lstrip().startswith(("[", "{")):
+        df = pd.read_csv(io.StringIO(text))
+    else:
+        rows = json.loads(text)
+        df = pd.DataFrame(rows if isinstance(rows, list) else [rows])
+    if participant is not None:
+        df["participant_number"] = participant
+    # survey responses arrive as objects in JSON rows; extract_metadata parses text
+    for col in ["response", "raw_payload"] + TEXT_COLS + ["dissimilarity_vector"]:
+        if col in df.columns:
+            df[col] = df[col].map(_json_text)
+    return df
+
+
+def _fill_from_raw_payload(df):
+    """Take placements etc. from raw_payload where the flat columns are missing."""
+    if "raw_payload" not in df.columns:
+        return df
+    for col in PAYLOAD_COLS:
+        if col not in df.columns:
+            df[col] = None
+    need = df["placements"].isna() & df["raw_payload"].notna()
+    for i in df.index[need]:
+        try:
+            payload = json.loads(df.at[i, "raw_payload"])
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(payload, dict) or "placements" not in payload:
+            continue
+        for col in PAYLOAD_COLS:
+            value = payload.get(col)
+            df.at[i, col] = value if col == "n_words" else _json_text(value)
+    return df
+
+
+def arrangement_trials(df):
+    """
+    Trial records of a submission's arrangement rows, classified as in
+    clean_file (sorted by trial_index). Returns (records, rejected), where
+    rejected lists {"trial_index", "reason"} for invalid trials.
+    """
+    df = _fill_from_raw_payload(df)
+    if "participant_number" not in df.columns:
+        return [], [{"trial_index": None, "reason": "no participant_number column"}]
+    if "placements" not in df.columns:     # e.g. a survey row
+        return [], []
+
+    df_arr = df[df["placements"].notna()]
+    if "trial_index" in df_arr.columns:
+        df_arr = df_arr.sort_values("trial_index")
+
+    records, rejected = [], []
+    for _, row in df_arr.iterrows():
+        trial_index = row.get("trial_index")
+        trial_index = int(trial_index) if pd.notna(trial_index) else -1
+        category, n_unique = classify_arrangement(row["placements"])
+        if not is_valid_category(category):
+            rejected.append({"trial_index": trial_index, "reason": category})
+            continue
+        words = extract_placement_words(row["placements"])
+        try:
+            dissim = np.asarray(json.loads(row["dissimilarity_vector"]), dtype=float)
+        except (TypeError, ValueError):
+            dissim = None
+        if dissim is None or dissim.ndim != 1 or len(dissim) != len(words) * (len(words) - 1) // 2:
+            rejected.append({"trial_index": trial_index, "reason": "bad dissimilarity_vector"})
+            continue
+        records.append({
+            "participant_number": str(row["participant_number"]),
+            "trial_category": category,
+            "n_words": n_unique,
+            "trial_index": trial_index,
+            "placements": row["placements"],
+            "distance_matrix": _json_text(row.get("distance_matrix")) or "",
+            "dissimilarity_vector": dissim,
+            "word_ids": wr.word_ids(words),
+        })
+    return records, rejected
+
+
+def metadata_parts(df):
+    """
+    Metadata records of a submission, one per participant in it: the
+    first fullscreen and the last time_elapsed (ms; NaN if absent), the
+    survey answers as extract_metadata finds them (None if absent) and
+    the last trial_index (orders answers across submissions).
+    Submissions without any of these give no record.
+    """
+    if "participant_number" not in df.columns:
+        return []
+    parts = []
+    for pid, rows in df.groupby(df["participant_number"].astype(str), sort=False):
+        start = end = np.nan
+        if "time_elapsed" in rows.columns:
+            elapsed = pd.to_numeric(rows["time_elapsed"], errors="coerce")
+            end = elapsed.max()
+            if "trial_type" in rows.columns:
+                start = elapsed[rows["trial_type"].astype(str).str.contains("fullscreen")].min()
+        _, mandarin_proficiency, age, gender = extract_metadata(rows)
+        survey = {"mandarin_proficiency": mandarin_proficiency, "age": age, "gender": gender}
+        if np.isnan(start) and np.isnan(end) and all(v is None for v in survey.values()):
+            continue
+        trial_index = (pd.to_numeric(rows["trial_index"], errors="coerce").max()
+                       if "trial_index" in rows.columns else np.nan)
+        parts.append({
+            "participant_number": pid,
+            "trial_index": int(trial_index) if pd.notna(trial_index) else -1,
+            "fullscreen_start_ms": float(start),
+            "time_elapsed_ms": float(end),
+            **survey,
+        })
+    return parts
+
+
+def parse_submission(body, content_type="", participant=None):
+    """(trial records, rejected, metadata parts) of one submission."""
+    df = submission_frame(body, content_type, participant)
+    records, rejected = arrangement_trials(df)
+    return records, rejected, metadata_parts(df)
+
+
+# ---------------------------------------------------------------------
+# Columnar store
+# ---------------------------------------------------------------------
+
+def _ragged(arrays, dtype):
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(a) for a in arrays])
+    values = np.concatenate(arrays).astype(dtype) if arrays else np.zeros(0, dtype)
+    return values, offsets
+
+
+def _split(values, offsets):
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def _strings(values):
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+class ColumnStore:
+    """Append-only store of trial and metadata records, columnar .npz shards per batch."""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+        self.shards = sorted(glob.glob(os.path.join(store_dir, "part-*.npz")))
+        self.meta_shards = sorted(glob.glob(os.path.join(store_dir, "meta-*.npz")))
+        seqs = [int(os.path.basename(p)[5:-4]) for p in self.shards + self.meta_shards]
+        self.next_seq = max(seqs) + 1 if seqs else 0
+
+    def _save(self, prefix, columns):
+        path = os.path.join(self.store_dir, f"{prefix}-{self.next_seq:06d}.npz")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **columns)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def write_batch(self, records):
+        """Write a batch's trial and metadata records (atomic renames); returns the paths."""
+        received_at = time.time()
+        trials = [r for r in records if "trial_category" in r]
+        parts = [r for r in records if "trial_category" not in r]
+        paths = []
+        if trials:
+            paths.append(self._write_trials(trials, received_at))
+            self.shards.append(paths[-1])
+        if parts:
+            columns = {
+                "participant_number": _strings(r["participant_number"] for r in parts),
+                "trial_index": np.array([r["trial_index"] for r in parts], dtype=np.int32),
+                "fullscreen_start_ms": np.array([r["fullscreen_start_ms"] for r in parts], dtype=float),
+                "time_elapsed_ms": np.array([r["time_elapsed_ms"] for r in parts], dtype=float),
+                "received_at": np.full(len(parts), received_at),
+            }
+            for col in SURVEY_COLS:
+                columns[col] = _strings(r[col] for r in parts)
+            paths.append(self._save("meta", columns))
+            self.meta_shards.append(paths[-1])
+        self.next_seq += 1
+        return paths
+
+    def _write_trials(self, records, received_at):
+        columns = {
+            "participant_number": _strings(r["participant_number"] for r in records),
+            "trial_category": np.array([r["trial_category"] for r in records], dtype=str),
+            "n_words": np.array([r["n_words"] for r in records], dtype=np.int16),
+            "trial_index": np.array([r["trial_index"] for r in records], dtype=np.int32),
+            "received_at": np.full(len(records), received_at),
+        }
+        for col, dtype in (("dissimilarity_vector", np.float64), ("word_ids", np.int16)):
+            columns[col], columns[col + "_offsets"] = _ragged([r[col] for r in records], dtype)
+        for col in TEXT_COLS:
+            blobs = [np.frombuffer(r[col].encode("utf-8"), dtype=np.uint8) for r in records]
+            columns[col], columns[col + "_offsets"] = _ragged(blobs, np.uint8)
+        return self._save("part", columns)
+
+    def seen_trials(self):
+        """(participant_number, trial_category) pairs already stored (reads two columns only)."""
+        seen = set()
+        for path in self.shards:
+            with np.load(path) as z:
+                seen.update(zip(z["participant_number"].tolist(), z["trial_category"].tolist()))
+        return seen
+
+
+def read_metadata(store_dir=STORE_DIR):
+    """
+    Participant metadata merged from all stored parts, indexed by
+    participant_number: time_elapsed_sec from the earliest fullscreen
+    start to the latest time_elapsed (NaN without both), survey answers
+    from the part with the highest trial_index that has one.
+    """
+    frames = []
+    for path in sorted(glob.glob(os.path.join(store_dir, "meta-*.npz"))):
+        with np.load(path) as z:
+            frames.append(pd.DataFrame({c: z[c] for c in META_COLS + ["received_at"]}))
+    if not frames:
+        return pd.DataFrame(columns=METADATA_COLS, index=pd.Index([], name="participant_number"))
+    parts = pd.concat(frames, ignore_index=True)
+    parts[SURVEY_COLS] = parts[SURVEY_COLS].replace("", None)
+    parts = parts.sort_values(["trial_index", "received_at"], kind="stable")
+    grouped = parts.groupby("participant_number", sort=False)
+    meta = pd.DataFrame({
+        "time_elapsed_sec": (grouped["time_elapsed_ms"].max() - grouped["fullscreen_start_ms"].min()) / 1000.0,
+    })
+    for col in SURVEY_COLS:
+        meta[col] = grouped[col].last()    # last non-null
+    return meta.astype(object).where(meta.notna(), None).astype({"time_elapsed_sec": float})
+
+
+def read_store(store_dir=STORE_DIR):
+    """
+    All stored trials as a DataFrame in clean_file's column layout
+    (KEEP_COLS + metadata), plus trial_index, received_at and word_ids.
+    """
+    frames = []
+    for path in sorted(glob.glob(os.path.join(store_dir, "part-*.npz"))):
+        with np.load(path) as z:
+            df = pd.DataFrame({c: z[c] for c in ["participant_number", "trial_category", "n_words",
+                                                 "trial_index", "received_at"]})
+            df["dissimilarity_vector"] = [json.dumps(v.tolist(), separators=(",", ":"))
+                                          for v in _split(z["dissimilarity_vector"],
+                                                          z["dissimilarity_vector_offsets"])]
+            df["word_ids"] = _split(z["word_ids"], z["word_ids_offsets"])
+            for col in TEXT_COLS:
+                df[col] = [b.tobytes().decode("utf-8") for b in _split(z[col], z[col + "_offsets"])]
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=KEEP_COLS + METADATA_COLS)
+    df = pd.concat(frames, ignore_index=True)
+    df = df.join(read_metadata(store_dir), on="participant_number")
+    df["distance_matrix"] = df["distance_matrix"].replace("", None)
+    return df[KEEP_COLS + METADATA_COLS + ["trial_index", "received_at", "word_ids"]]
+
+
+def export_cleaned(store_dir, output_dir):
+    """cleaned_<participant>.csv per participant, as preprocessing.py writes them; returns the count."""
+    df = read_store(store_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    n = 0
+    for pid, rows in df.groupby("participant_number", sort=False):
+        rows = rows.sort_values("trial_index")[KEEP_COLS + METADATA_COLS]
+        rows.to_csv(os.path.join(output_dir, f"cleaned_{pid}.csv"), index=False, encoding="utf-8-sig")
+        n += 1
+    return n
+
+
+# ---------------------------------------------------------------------
+# Service
+# ---------------------------------------------------------------------
+
+class IngestService:
+    """Validation, de-duplication and batched, off-loop store writes."""
+
+    def __init__(self, store, max_batch=MAX_BATCH, max_latency=MAX_LATENCY, queue_size=QUEUE_SIZE):
+        self.store = store
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.queue_size = queue_size
+        self.seen = store.seen_trials()
+        self.stats = {"requests": 0, "trials": 0, "duplicates": 0, "rejected": 0, "batches": 0,
+                      "flush_latency_max_s": 0.0, "flush_latency_sum_s": 0.0}
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.queue_size)
+        self.parser = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ingest-parse")
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-write")
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """Flush what is queued, then stop."""
+        await self.queue.join()
+        self._flusher.cancel()
+        self.parser.shutdown()
+        self.writer.shutdown()
+
+    async def submit(self, body, content_type="", participant=None):
+        """Parse, validate and store one submission; returns the response dict."""
+        loop = asyncio.get_running_loop()
+        records, rejected, parts = await loop.run_in_executor(
+            self.parser, parse_submission, body, content_type, participant)
+
+        accepted, duplicates = [], 0
+        for r in records:
+            key = (r["participant_number"], r["trial_category"])
+            if key in self.seen:
+                duplicates += 1
+                continue
+            self.seen.add(key)
+            accepted.append(r)
+
+        futures = []
+        for r in accepted + parts:
+            fut = loop.create_future()
+            await self.queue.put((r, fut, loop.time()))
+            futures.append(fut)
+        try:
+            await asyncio.gather(*futures)
+        except Exception:
+            for r in accepted:     # not stored: the participant may resubmit
+                self.seen.discard((r["participant_number"], r["trial_category"]))
+            raise
+
+        self.stats["requests"] += 1
+        self.stats["trials"] += len(accepted)
+        self.stats["duplicates"] += duplicates
+        self.stats["rejected"] += len(rejected)
+        return {
+            "accepted": len(accepted),
+            "categories": [r["trial_category"] for r in accepted],
+            "duplicates": duplicates,
+            "rejected": rejected,
+        }
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = batch[0][2] + self.max_latency
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():      # backlog goes in this batch, deadline or not
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await loop.run_in_executor(self.writer, self.store.write_batch, [r for r, _, _ in batch])
+            except Exception as e:
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            else:
+                now = loop.time()
+                latency = now - batch[0][2]
+                self.stats["batches"] += 1
+                self.stats["flush_latency_sum_s"] += latency
+                self.stats["flush_latency_max_s"] = max(self.stats["flush_latency_max_s"], latency)
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_result(None)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def status(self):
+        stats = dict(self.stats)
+        batches = max(stats["batches"], 1)
+        stats["flush_latency_mean_s"] = round(stats.pop("flush_latency_sum_s") / batches, 4)
+        stats["flush_latency_max_s"] = round(stats["flush_latency_max_s"], 4)
+        stats["participants"] = len({pid for pid, _ in self.seen})
+        stats["stored_trials"] = len(self.seen)
+        stats["queued"] = self.queue.qsize()
+        stats["shards"] = len(self.store.shards) + len(self.store.meta_shards)
+        return stats
+
+
+# ---------------------------------------------------------------------
+# Minimal HTTP/1.1 over asyncio streams
+# ---------------------------------------------------------------------
+
+async def read_message(reader, request=True):
+    """
+    (start line parts, headers, body) of one HTTP message; None at EOF.
+    A body that cannot be read is returned as (status, error message).
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    start = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    headers = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = h.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    if request and headers.get("transfer-encoding", "").lower() == "chunked":
+        return start, headers, (411, "chunked bodies are not supported; send Content-Length")
+    try:
+        n = int(headers.get("content-length", 0))
+    except ValueError:
+        n = -1
+    if n < 0:
+        return start, headers, (400, f"invalid Content-Length: {headers['content-length']!r}")
+    if n > MAX_BODY:
+        return start, headers, (413, f"body larger than {MAX_BODY} bytes")
+    body = await reader.readexactly(n) if n else b""
+    return start, headers, body
+
+
+def response_bytes(status, payload=None, keep_alive=True):
+    body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        "Content-Type: application/json; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        "Access-Control-Allow-Origin: *",
+        "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+        "Access-Control-Allow-Headers: Content-Type",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                break
+            (method, target, *_), headers, body = message
+            keep_alive = headers.get("connection", "").lower() != "close"
+            url = urlsplit(target)
+            if isinstance(body, tuple):
+                # the unread body is still on the stream: answer and close
+                (status, error), keep_alive = body, False
+                payload = {"error": error}
+            elif method == "OPTIONS":
+                status, payload = 204, None
+            elif method == "POST" and url.path == "/submit":
+                participant = parse_qs(url.query).get("participant", [None])[0]
+                try:
+                    status, payload = 200, await service.submit(body, headers.get("content-type", ""),
+                                                                participant)
+                except (ValueError, pd.errors.ParserError) as e:
+                    status, payload = 400, {"error": f"cannot parse submission: {e}"}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            elif method == "GET" and url.path == "/status":
+                status, payload = 200, service.status()
+            else:
+                status, payload = 404, {"error": f"no route {method} {url.path}"}
+            writer.write(response_bytes(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(store_dir, host, port, max_batch, max_latency):
+    service = IngestService(ColumnStore(store_dir), max_batch, max_latency)
+    await service.start()
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port,
+                                        limit=2**20)
+    print(f"Ingesting into {store_dir} ({len(service.seen)} trials already stored) "
+          f"on http://{host}:{port}/submit")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+        print(f"Stopped: {service.status()}")
+
+
+# ---------------------------------------------------------------------
+# Replay client (stand-in for live participants)
+# ---------------------------------------------------------------------
+
+async def _post(reader, writer, host, path, body, content_type):
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: {content_type}\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    (_, status, *_), _, response = await read_message(reader, request=False)
+    return int(status), json.loads(response) if response else None
+
+
+def _replay_submissions(path, copy, mode):
+    """Request bodies for one participant: the whole export, or one JSON row per trial (as on_data_update sends them)."""
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    if copy:
+        df["participant_number"] = df["participant_number"].astype(str) + f"_r{copy}"
+    if mode == "export":
+        return [(df.to_csv(index=False).encode("utf-8"), "text/csv")]
+    rows = json.loads(df.to_json(orient="records", force_ascii=False))
+    return [(json.dumps(row, ensure_ascii=False).encode("utf-8"), "application/json") for row in rows]
+
+
+async def replay(data_dir, url, concurrency=100, copies=1, mode="export"):
+    """Replay data_dir/*.csv as concurrent participants; returns a summary dict."""
+    target = urlsplit(url)
+    files = sorted(glob.glob(os.path.join(data_dir, "*.csv")))
+    jobs = [(f, copy) for copy in range(copies) for f in files]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, totals = [], {"accepted": 0, "duplicates": 0, "rejected": 0, "errors": 0}
+
+    async def participant(path, copy):
+        async with semaphore:
+            submissions = _replay_submissions(path, copy, mode)
+            reader, writer = await asyncio.open_connection(target.hostname, target.port)
+            try:
+                for body, content_type in submissions:
+                    t0 = time.perf_counter()
+                    status, result = await _post(reader, writer, target.hostname, "/submit", body, content_type)
+                    latencies.append(time.perf_counter() - t0)
+                    if status != 200:
+                        totals["errors"] += 1
+                        print(f"  {os.path.basename(path)}: HTTP {status} {result}")
+                        continue
+                    totals["accepted"] += result["accepted"]
+                    totals["duplicates"] += result["duplicates"]
+                    totals["rejected"] += len(result["rejected"])
+            finally:
+                writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(participant(f, c) for f, c in jobs))
+    wall = time.perf_counter() - t0
+    lat = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "participants": len(jobs),
+        "requests": len(latencies),
+        **totals,
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(len(latencies) / wall, 1) if wall > 0 else None,
+        "latency_p50_ms": round(float(np.percentile(lat, 50)) * 1000, 1),
+        "latency_p95_ms": round(float(np.percentile(lat, 95)) * 1000, 1),
+        "latency_max_ms": round(float(lat.max()) * 1000, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest live jsPsych submissions into a columnar store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="Run the ingestion service")
+    p.add_argument('--store', type=str, default=STORE_DIR)
+    p.add_argument('--host', type=str, default="127.0.0.1")
+    p.add_argument('--port', type=int, default=PORT)
+    p.add_argument('--max_batch', type=int, default=MAX_BATCH, help="Trials per shard at most")
+    p.add_argument('--max_latency', type=float, default=MAX_LATENCY,
+                   help="Seconds from a batch's first trial to its flush at most")
+
+    p = sub.add_parser("replay", help="Replay jsPsych CSV exports against a running service")
+    p.add_argument('data_dir', type=str, nargs='?', default="data")
+    p.add_argument('--url', type=str, default=f"http://127.0.0.1:{PORT}")
+    p.add_argument('--mode', type=str, choices=["export", "trials"], default="export",
+                   help="export: one CSV submission per participant; trials: one JSON row per trial")
+    p.add_argument('--concurrency', type=int, default=100, help="Participants submitting at once")
+    p.add_argument('--copies', type=int, default=1,
+                   help="Replay each file this many times as distinct participants (<id>_r<k>)")
+
+    p = sub.add_parser("export", help="Write the store as cleaned_*.csv files")
+    p.add_argument('--store', type=str, default=STORE_DIR)
+    p.add_argument('--output_dir', type=str, default="cleaned_live")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.store, args.host, args.port, args.max_batch, args.max_latency))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "replay":
+        summary = asyncio.run(replay(args.data_dir, args.url, args.concurrency, args.copies, args.mode))
+        print(json.dumps(summary, indent=1))
+    else:
+        n = export_cleaned(args.store, args.output_dir)
+        print(f"Exported {n} participants to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
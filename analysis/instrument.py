@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run instrumentation: per-stage timing, memory, item counts and warning
+counters, written as a JSON run report; optional cProfile profiling.
+
+Usage (inside a script's main):
+    instrument.add_arguments(parser)          # --report PATH, --profile
+    args = parser.parse_args(argv)
+    with instrument.run_report("data_analysis", args):
+        with instrument.stage("step1"):
+            ...
+            instrument.count(bootstraps=n_bootstraps)
+        instrument.warn("unknown_words", "  Warning: ...")
+
+Each stage records wall time, CPU time (this process and its finished
+child processes), memory, item counts and the warnings raised inside
+it. Memory is the RSS at the start and end of the stage and the growth
+of the peak RSS during it (peak_rss_growth_mb; 0 for a stage that stays
+below an earlier stage's peak, so a memory-heavy stage stands out);
+process_peak_rss_mb is the peak of the whole process so far. A repeated warning is printed the first MAX_PRINTED times and only
+counted after that. The report goes to cache/reports/<script>_<time>_<pid>.json
+unless --report is given.
+
+With --profile every top-level stage runs under cProfile: the .prof
+file is written next to the report and the top functions by cumulative
+time are listed in it. Work done in worker processes is timed (child CPU
+time) but not profiled.
+
+Outside a run (functions imported on their own) stage() and count() do
+nothing and warn() prints every message.
+"""
+
+import os
+import sys
+import json
+import time
+import cProfile
+import platform
+import pstats
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, memory is not reported
+    resource = None
+
+REPORT_DIR = "cache/reports"
+MAX_PRINTED = 3
+PROFILE_TOP = 15
+
+_current = None
+
+
+def _usage():
+    """(cpu_s self, cpu_s children, peak RSS MB self, peak RSS MB children)."""
+    if resource is None:
+        return time.process_time(), 0.0, None, None
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return (me.ru_utime + me.ru_stime, kids.ru_utime + kids.ru_stime,
+            round(me.ru_maxrss * scale / 2**20, 1), round(kids.ru_maxrss * scale / 2**20, 1))
+
+
+def _rss_mb():
+    """Current resident set size in MB (Linux only, else None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _growth(start, end):
+    """Increase of a peak RSS between two _usage() readings (None if not reported)."""
+    if start is None or end is None:
+        return None
+    return round(max(0.0, end - start), 1)
+
+
+def _top_functions(profiler, n=PROFILE_TOP):
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    rows = []
+    for func in stats.fcn_list[:n]:
+        _, ncalls, tottime, cumtime, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({name})",
+            "ncalls": ncalls,
+            "tottime_s": round(tottime, 4),
+            "cumtime_s": round(cumtime, 4),
+        })
+    return rows
+
+
+class RunReport:
+    """Stage records and warning counters of one script run."""
+
+    def __init__(self, script, params=None, profile=False, path=None):
+        self.script = script
+        self.params = params or {}
+        self.profile = profile
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = path or os.path.join(REPORT_DIR, f"{script}_{stamp}_{os.getpid()}.json")
+        self.stages = []
+        self.warnings = Counter()
+        self._open = []
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name, **items):
+        record = {
+            "stage": name,
+            "parent": self._open[-1]["stage"] if self._open else None,
+            "items": dict(items),
+            "warnings": {},
+        }
+        self.stages.append(record)
+        self._open.append(record)
+
+        profiler = None
+        if self.profile and not self._profiling:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self._profiling = True
+            except ValueError:      # another profiler is already active
+                profiler = None
+
+        t0 = time.perf_counter()
+        cpu0, kids0, peak0, kids_peak0 = _usage()
+        record["rss_start_mb"] = _rss_mb()
+        try:
+            yield record
+            record["status"] = "ok"
+        except BaseException as e:
+            record["status"] = f"failed: {type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                prof_path = os.path.splitext(self.path)[0] + f"_{len(self.stages):02d}_{name}.prof"
+                os.makedirs(os.path.dirname(prof_path) or ".", exist_ok=True)
+                profiler.dump_stats(prof_path)
+                record["profile"] = {"file": prof_path, "top": _top_functions(profiler)}
+
+            cpu1, kids1, peak, kids_peak = _usage()
+            record["wall_s"] = round(time.perf_counter() - t0, 4)
+            record["cpu_s"] = round(cpu1 - cpu0, 4)
+            record["children_cpu_s"] = round(kids1 - kids0, 4)
+            record["rss_mb"] = _rss_mb()
+            record["peak_rss_growth_mb"] = _growth(peak0, peak)
+            record["children_peak_rss_growth_mb"] = _growth(kids_peak0, kids_peak)
+            record["process_peak_rss_mb"] = peak
+            record["children_peak_rss_mb"] = kids_peak
+            self._open.pop()
+
+    def count(self, **items):
+        if self._open:
+            counts = self._open[-1]["items"]
+            for key, n in items.items():
+                counts[key] = counts.get(key, 0) + n
+
+    def warn(self, key, message):
+        self.warnings[key] += 1
+        if self._open:
+            stage_counts = self._open[-1]["warnings"]
+            stage_counts[key] = stage_counts.get(key, 0) + 1
+        n = self.warnings[key]
+        if n <= MAX_PRINTED:
+            print(message)
+        if n == MAX_PRINTED:
+            print(f"  (further '{key}' warnings are only counted in the run report)")
+
+    def to_dict(self):
+        return {
+            "script": self.script,
+            "params": self.params,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stages": self.stages,
+            "warnings": dict(self.warnings),
+        }
+
+    def write(self, extra=None):
+        report = self.to_dict()
+        report.update(extra or {})
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1, default=str)
+        return self.path
+
+
+def add_arguments(parser):
+    """Add --report and --profile to a script's argument parser."""
+    parser.add_argument('--report', type=str, default=None,
+                        help=f"JSON run report path (default: {REPORT_DIR}/<script>_<time>_<pid>.json)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Run each stage under cProfile; .prof files are written next to the report")
+
+
+@contextmanager
+def run_report(script, args=None):
+    """Collect stages and warnings of one run and write the report on exit (also on failure)."""
+    global _current
+    params = {}
+    if args is not None:
+        params = {k: v for k, v in vars(args).items() if k not in ("report", "profile")}
+    report = RunReport(script, params,
+                       profile=getattr(args, "profile", False),
+                       path=getattr(args, "report", None))
+
+    prev, _current = _current, report
+    started = datetime.now().isoformat(timespec="seconds")
+    t0 = time.perf_counter()
+    cpu0, kids0, _, _ = _usage()
+    status = "ok"
+    try:
+        yield report
+    except BaseException as e:
+        status = f"failed: {type(e).__name__}: {e}"
+        raise
+    finally:
+        _current = prev
+        cpu1, kids1, peak, kids_peak = _usage()
+        path = report.write({
+            "status": status,
+            "started": started,
+            "wall_s": round(time.perf_counter() - t0, 4),
+            "cpu_s": round(cpu1 - cpu0, 4),
+            "children_cpu_s": round(kids1 - kids0, 4),
+            "process_peak_rss_mb": peak,
+            "children_peak_rss_mb": kids_peak,
+        })
+        print(f"Run report saved to {path}")
+
+
+def stage(name, **items):
+    """Time a stage of the current run (no-op outside a run)."""
+    if _current is None:
+        return nullcontext()
+    return _current.stage(name, **items)
+
+
+def count(**items):
+    """Add item counts to the innermost open stage."""
+    if _current is not None:
+        _current.count(**items)
+
+
+def warn(key, message):
+    """Print a warning (deduplicated and counted inside a run)."""
+    if _current is None:
+        print(message)
+    else:
+        _current.warn(key, message)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Iterative trial scaling for combining multiarrangement trials
+(inverse MDS, Kriegeskorte & Mur 2012).
+
+Each arrangement trial is drawn at its own arbitrary scale (a subset
+trial fills the arena just like the full one), so plain averaging mixes
+scales. Here every trial gets a scale factor and:
+
+1. RDM estimate = evidence-weighted average of the scaled trial
+   distances for each pair (evidence weight = on-screen distance^2)
+2. Each trial's scale is set so its scaled distances have the same RMS as
+   the current estimate over the trial's pairs
+3. Scales are divided by that of the participant's largest trial (the
+   full arrangement), so distances stay on the full arrangement's scale
+4. Repeat until no trial scale changes by more than tol (relative)
+
+All participants are solved together: observations from every trial of
+every participant are concatenated into one system. The evidence weights do not depend on the scales, so each iteration is
+two sparse matrix-vector products. Converged participants are frozen;
+iterations and the final change are reported per participant.
+
+Usage:
+    from inverse_mds import inverse_mds_combine
+    values, n_iter, change = inverse_mds_combine(group, trial, trial_owner, dists)
+"""
+
+import numpy as np
+from scipy import sparse
+
+TOL = 1e-6
+MAX_ITER = 2000
+
+
+def inverse_mds_combine(group, trial, trial_owner, dists, tol=TOL, max_iter=MAX_ITER):
+    """
+    Combine trial observations by iterative scaling and averaging.
+
+    Parameters
+    ----------
+    group : np.ndarray of int
+        Per observation: index of its (participant, pair) cell, 0..n_groups-1.
+    trial : np.ndarray of int
+        Per observation: global trial index, 0..n_trials-1.
+    trial_owner : np.ndarray of int
+        Per trial: participant index, 0..n_participants-1.
+    dists : np.ndarray
+        Per observation: the trial's (unscaled) dissimilarity.
+    tol, max_iter :
+        A participant has converged when no trial scale changes by more
+        than tol (relative) in one iteration.
+
+    Returns
+    -------
+    values : np.ndarray
+        (n_groups,) combined distance per (participant, pair) cell.
+    n_iter : np.ndarray of int
+        (n_participants,) iterations until convergence (max_iter if not).
+    change : np.ndarray
+        (n_participants,) largest relative scale change in the last
+        iteration (<= tol when converged).
+    """
+    group, trial = np.asarray(group), np.asarray(trial)
+    dists = np.asarray(dists, dtype=np.float64)
+    trial_owner = np.asarray(trial_owner)
+    n_groups = int(group.max()) + 1 if len(group) else 0
+    n_trials = len(trial_owner)
+    n_part = int(trial_owner.max()) + 1 if n_trials else 0
+
+    # Evidence weights do not depend on the scales, so the estimate is a
+    # fixed sparse (group x trial) matrix times the scale vector.
+    evidence = dists ** 2
+    den = np.bincount(group, weights=evidence, minlength=n_groups)
+    # pairs whose trials all put the words on top of each other: plain mean
+    zero = den == 0
+    w = np.where(zero[group], 1.0, evidence)
+    den = np.where(zero, np.bincount(group, minlength=n_groups), den)
+    combine = sparse.csr_matrix((w * dists / den[group], (group, trial)),
+                                shape=(n_groups, n_trials))
+    # trial x group incidence, for per-trial sums over the trial's pairs
+    incidence = sparse.csr_matrix((np.ones(len(group)), (trial, group)),
+                                  shape=(n_trials, n_groups))
+
+    scales = np.ones(n_trials)
+    trial_ss = np.bincount(trial, weights=dists ** 2, minlength=n_trials)
+
+    # Scale anchor: each participant's trial with the most pairs
+    n_obs = np.bincount(trial, minlength=n_trials)
+    order = np.lexsort((-n_obs, trial_owner))
+    first = np.r_[True, trial_owner[order][1:] != trial_owner[order][:-1]]
+    anchor = np.zeros(n_part, dtype=int)
+    anchor[trial_owner[order][first]] = order[first]
+
+    n_iter = np.zeros(n_part, dtype=int)
+    change = np.full(n_part, np.nan)
+    active = np.ones(n_part, dtype=bool)
+
+    for it in range(1, max_iter + 1):
+        est = combine @ scales
+
+        # RMS match of each trial to the estimate over the trial's pairs
+        fit_ss = incidence @ (est ** 2)
+        new_scales = np.sqrt(np.divide(fit_ss, trial_ss, out=scales ** 2, where=trial_ss > 0))
+        new_scales /= new_scales[anchor][trial_owner]
+
+        rel = np.abs(new_scales - scales) / np.maximum(scales, 1e-12)
+        part_change = np.zeros(n_part)
+        np.maximum.at(part_change, trial_owner, rel)
+
+        upd = active[trial_owner]
+        scales[upd] = new_scales[upd]
+        change[active] = part_change[active]
+        n_iter[active] = it
+
+        active &= part_change > tol
+        if not active.any():
+            break
+
+    return combine @ scales, n_iter, change
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Blocked ISC kernels for the unmasked bootstrap steps.
+
+Steps 1-3 all reduce to the same inner loop: for a set of subjects, a
+word and that word's columns, correlate every subject pair's vectors,
+clip to +-0.999999, Fisher-z and average the finite values. Here a whole
+block of bootstraps is done per call:
+
+    subjects (B, S)    subjects of each bootstrap
+    words    (B, K)    words (rows) of each bootstrap
+    cols     (B, K, D) columns of each word's vector
+
+Engines:
+  reference  the original per-word np.corrcoef loops (data_analysis_multiarrangement.py)
+  numpy      gathers a block and correlates all words with one batched matmul
+  numba      compiled kernel, parallel over (bootstrap, word); each task
+             gathers and centres its word's subject vectors into small
+             per-task buffers and correlates them there
+  auto       numba when installed and it passes a check against numpy
+             on first use (see numba_verified), else numpy
+
+numba is optional (pip install numba); without it "auto" falls back to
+numpy. All engines agree with the reference to ~1e-12, see
+analysis/regression.py --analysis_args "--engine numpy".
+"""
+
+import warnings
+
+import numpy as np
+
+from masked_isc import mean_fisher_z
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ENGINES = ["auto", "numba", "numpy", "reference"]
+BLOCK = 64         # bootstraps per kernel call
+CLIP = 0.999999
+VERIFY_TOL = 1e-10  # numba vs numpy on the first-use check
+_numba_ok = None
+
+
+def resolve_engine(engine):
+    """Engine actually used for a requested one."""
+    if engine == "auto":
+        return "numba" if numba_verified() else "numpy"
+    if engine == "numba" and numba is None:
+        raise ImportError("--engine numba needs the numba package (pip install numba)")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; choose from {ENGINES}")
+    return engine
+
+
+def _block_iscs_numpy(rdms, subjects, words, cols):
+    n_boot, n_rows = words.shape
+    out = np.empty((n_boot, n_rows))
+    for b in range(n_boot):
+        # (n_rows, S, D): each row's subject vectors
+        x = rdms[subjects[b][None, :, None], words[b][:, None, None], cols[b][:, None, :]]
+        x = x - x.mean(axis=-1, keepdims=True)
+        norm = np.sqrt(np.einsum("ksd,ksd->ks", x, x))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = (x @ np.swapaxes(x, -1, -2)) / (norm[:, :, None] * norm[:, None, :])
+        out[b] = mean_fisher_z(r)
+    return out
+
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _block_iscs_numba(rdms, subjects, words, cols):
+        n_boot, n_rows = words.shape
+        n_sub = subjects.shape[1]
+        dim = cols.shape[2]
+        out = np.empty((n_boot, n_rows))
+        for t in numba.prange(n_boot * n_rows):
+            b = t // n_rows
+            k = t % n_rows
+            w = words[b, k]
+
+            x = np.empty((n_sub, dim))
+            norm = np.empty(n_sub)
+            for s in range(n_sub):
+                subj = subjects[b, s]
+                mean = 0.0
+                for d in range(dim):
+                    v = rdms[subj, w, cols[b, k, d]]
+                    x[s, d] = v
+                    mean += v
+                mean /= dim
+                ss = 0.0
+                for d in range(dim):
+                    x[s, d] -= mean
+                    ss += x[s, d] * x[s, d]
+                norm[s] = np.sqrt(ss)
+
+            total = 0.0
+            n_valid = 0
+            for i in range(1, n_sub):
+                for j in range(i):
+                    den = norm[i] * norm[j]
+                    if not den > 0.0:       # constant vector: r undefined, skipped
+                        continue
+                    dot = 0.0
+                    for d in range(dim):
+                        dot += x[i, d] * x[j, d]
+                    r = dot / den
+                    if r != r:              # NaN input
+                        continue
+                    r = min(max(r, -CLIP), CLIP)
+                    total += np.arctanh(r)
+                    n_valid += 1
+            out[b, k] = total / n_valid if n_valid > 0 else np.nan
+        return out
+else:
+    _block_iscs_numba = None
+
+
+def numba_verified():
+    """
+    Whether the compiled numba kernel is usable: installed, compiles and
+    matches the numpy kernel on a small random block (constant vectors
+    included). Checked once per process; a failure warns and leaves
+    "auto" on numpy.
+    """
+    global _numba_ok
+    if _numba_ok is None:
+        _numba_ok = False
+        if numba is not None:
+            rng = np.random.default_rng(0)
+            rdms = rng.random((6, 12, 12))
+            rdms[2, 3] = 0.5
+            subjects = rng.integers(0, 6, (3, 5))
+            words = rng.integers(0, 12, (3, 4))
+            cols = rng.integers(0, 12, (3, 4, 9))
+            expected = _block_iscs_numpy(rdms, subjects, words, cols)
+            try:
+                got = block_iscs(rdms, subjects, words, cols, engine="numba")
+                _numba_ok = bool(np.allclose(got, expected, rtol=0, atol=VERIFY_TOL, equal_nan=True))
+                problem = "does not match the numpy kernel"
+            except Exception as e:
+                problem = f"failed ({type(e).__name__}: {e})"
+            if not _numba_ok:
+                warnings.warn(f"numba ISC kernel {problem}; --engine auto uses numpy")
+    return _numba_ok
+
+
+def block_iscs(rdms, subjects, words, cols, engine="auto"):
+    """
+    Mean Fisher-z ISC for a block of bootstraps.
+
+    Parameters
+    ----------
+    rdms : np.ndarray
+        (n_subjects, n_words, n_words).
+    subjects : np.ndarray of int
+        (B, S) subjects of each bootstrap (repeats allowed).
+    words : np.ndarray of int
+        (B, K) word (row) indices of each bootstrap.
+    cols : np.ndarray of int
+        (B, K, D) column indices of each word's vector.
+    engine : str
+        "numpy", "numba" or "auto" (see module docstring).
+
+    Returns
+    -------
+    np.ndarray
+        (B, K); NaN where no subject pair gives a finite correlation.
+    """
+    engine = resolve_engine(engine)
+    if subjects.shape[1] < 2:
+        return np.full(words.shape, np.nan)
+    if engine == "numba":
+        return _block_iscs_numba(np.ascontiguousarray(rdms, dtype=np.float64),
+                                 np.ascontiguousarray(subjects, dtype=np.int64),
+                                 np.ascontiguousarray(words, dtype=np.int64),
+                                 np.ascontiguousarray(cols, dtype=np.int64))
+    if engine == "numpy":
+        return _block_iscs_numpy(rdms, subjects, words, cols)
+    raise ValueError(f"block_iscs has no {engine!r} engine; the reference loops live in "
+                     "data_analysis_multiarrangement.py")
+
+
+def iter_blocks(n_bootstraps, block=BLOCK):
+    """slice objects covering range(n_bootstraps) in blocks."""
+    for start in range(0, n_bootstraps, block):
+        yield slice(start, min(start + block, n_bootstraps))
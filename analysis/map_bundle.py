@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Export all subject maps as one compact bundle plus a static HTML viewer,
+instead of one 300-dpi PNG per participant.
+
+Outputs (in <out_dir>):
+- maps_bundle.json   participant ids, words (zh/en), category codes and
+                     colors, plus every subject's 2D coordinates as a
+                     base64-encoded float32 array (n_subj x n_words x 2)
+- maps_viewer.html   self-contained viewer (bundle inlined), draws the
+                     maps client-side on a <canvas> only when shown
+
+Size and export time scale with the number of coordinates, not pixels.
+
+Usage:
+    python analysis/plot_space.py --format bundle
+"""
+
+import os
+import json
+import base64
+
+import numpy as np
+
+BUNDLE_FILE = "maps_bundle.json"
+VIEWER_FILE = "maps_viewer.html"
+
+
+# ---------------------------------------------------------------------
+# Bundle
+# ---------------------------------------------------------------------
+
+def _encode_f32(arr):
+    return base64.b64encode(np.ascontiguousarray(arr, dtype="<f4").tobytes()).decode("ascii")
+
+
+def build_bundle(all_coords, words, participant_ids, category_colors,
+                 group_coords=None, highlight_word_en=None):
+    """
+    Build the bundle dict.
+
+    all_coords: (n_subj, n_words, 2); words: table with word_zh, word_en,
+    category (rows in RDM order); participant_ids: list in all_coords order.
+    """
+    categories = list(category_colors.keys())
+    cat_code = {c: i for i, c in enumerate(categories)}
+
+    bundle = {
+        "version": 1,
+        "shape": list(all_coords.shape),
+        "participant_ids": [str(p) for p in participant_ids],
+        "words_zh": words["word_zh"].tolist(),
+        "words_en": words["word_en"].tolist(),
+        "category_codes": [cat_code.get(c, cat_code.get("Unknown", 0)) for c in words["category"]],
+        "categories": categories,
+        "category_colors": [category_colors[c] for c in categories],
+        "highlight_word_en": highlight_word_en,
+        "coords_f32": _encode_f32(all_coords),
+    }
+    if group_coords is not None:
+        bundle["group_coords_f32"] = _encode_f32(group_coords)
+    return bundle
+
+
+def load_bundle(path):
+    """
+    Read a bundle back; returns (bundle_dict, coords array (n_subj, n_words, 2)).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        bundle = json.load(f)
+    coords = np.frombuffer(base64.b64decode(bundle["coords_f32"]), dtype="<f4")
+    return bundle, coords.reshape(bundle["shape"])
+
+
+def export_bundle(all_coords, words, participant_ids, category_colors, out_dir,
+                  group_coords=None, highlight_word_en="scenery"):
+    """
+    Write maps_bundle.json and maps_viewer.html to out_dir.
+    Returns (bundle_path, viewer_path).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    bundle = build_bundle(all_coords, words, participant_ids, category_colors,
+                          group_coords=group_coords, highlight_word_en=highlight_word_en)
+    payload = json.dumps(bundle, ensure_ascii=False, separators=(",", ":"))
+
+    bundle_path = os.path.join(out_dir, BUNDLE_FILE)
+    with open(bundle_path, "w", encoding="utf-8") as f:
+        f.write(payload)
+
+    # Inline the bundle so the viewer also works when opened via file://
+    viewer_path = os.path.join(out_dir, VIEWER_FILE)
+    with open(viewer_path, "w", encoding="utf-8") as f:
+        f.write(VIEWER_TEMPLATE.replace("__BUNDLE__", payload.replace("</", "<\\/")))
+
+    print(f"Saved map bundle ({os.path.getsize(bundle_path) / 1024:.1f} KB) to {bundle_path}")
+    print(f"Saved map viewer to {viewer_path}")
+    return bundle_path, viewer_path
+
+
+# ---------------------------------------------------------------------
+# Viewer
+# ---------------------------------------------------------------------
+
+VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Subject semantic maps</title>
+<style>
+  body { font-family: sans-serif; margin: 16px; }
+  #controls { margin-bottom: 12px; }
+  #controls > * { margin-right: 12px; }
+  #grid { display: flex; flex-wrap: wrap; gap: 8px; }
+  .panel { border: 1px solid #ddd; }
+  .panel h4 { margin: 4px; font-size: 12px; font-weight: normal; }
+  #legend span { display: inline-block; margin-right: 12px; font-size: 12px; }
+  #legend i { display: inline-block; width: 10px; height: 10px; border-radius: 5px; margin-right: 4px; }
+</style>
+</head>
+<body>
+<div id="controls">
+  <label>Participant
+    <select id="subject"><option value="all">All (grid)</option><option value="group">Group mean</option></select>
+  </label>
+  <label>Labels
+    <select id="lang"><option value="en">English</option><option value="zh">中文</option></select>
+  </label>
+  <label>Highlight <input id="highlight" size="12"></label>
+  <label>Size <input id="size" type="range" min="150" max="800" value="260"></label>
+</div>
+<div id="legend"></div>
+<div id="grid"></div>
+<script>
+const B = __BUNDLE__;
+
+function decode(b64) {
+  const bin = atob(b64);
+  const buf = new Uint8Array(bin.length);
+  for (let i = 0; i < bin.length; i++) buf[i] = bin.charCodeAt(i);
+  return new Float32Array(buf.buffer);
+}
+const [nSubj, nWords] = B.shape;
+const coords = decode(B.coords_f32);
+const group = B.group_coords_f32 ? decode(B.group_coords_f32) : null;
+
+const subjSel = document.getElementById("subject");
+B.participant_ids.forEach((pid, s) => {
+  const o = document.createElement("option");
+  o.value = s; o.textContent = pid; subjSel.appendChild(o);
+});
+if (!group) subjSel.querySelector('option[value="group"]').remove();
+document.getElementById("highlight").value = B.highlight_word_en || "";
+document.getElementById("legend").innerHTML = B.categories
+  .filter(c => c !== "Unknown")
+  .map(c => `<span><i style="background:${B.category_colors[B.categories.indexOf(c)]}"></i>${c}</span>`)
+  .join("");
+
+function drawMap(canvas, xy, offset, title) {
+  const ctx = canvas.getContext("2d");
+  const W = canvas.width, H = canvas.height, pad = 24;
+  let x0 = Infinity, x1 = -Infinity, y0 = Infinity, y1 = -Infinity;
+  for (let i = 0; i < nWords; i++) {
+    const x = xy[offset + 2 * i], y = xy[offset + 2 * i + 1];
+    x0 = Math.min(x0, x); x1 = Math.max(x1, x); y0 = Math.min(y0, y); y1 = Math.max(y1, y);
+  }
+  const sc = Math.min((W - 2 * pad) / (x1 - x0 || 1), (H - 2 * pad) / (y1 - y0 || 1));
+  const px = x => pad + (x - x0) * sc, py = y => H - pad - (y - y0) * sc;
+  const lang = document.getElementById("lang").value;
+  const labels = lang === "zh" ? B.words_zh : B.words_en;
+  const hl = document.getElementById("highlight").value.trim();
+  const fs = Math.max(7, Math.round(W / 45));
+
+  ctx.clearRect(0, 0, W, H);
+  ctx.textAlign = "center"; ctx.textBaseline = "middle";
+  for (let i = 0; i < nWords; i++) {
+    const x = px(xy[offset + 2 * i]), y = py(xy[offset + 2 * i + 1]);
+    ctx.globalAlpha = 0.7;
+    ctx.fillStyle = B.category_colors[B.category_codes[i]];
+    ctx.beginPath(); ctx.arc(x, y, Math.max(2, W / 100), 0, 2 * Math.PI); ctx.fill();
+    ctx.globalAlpha = 1; ctx.fillStyle = "#000";
+    const isHl = hl && (B.words_en[i] === hl || B.words_zh[i] === hl);
+    ctx.font = (isHl ? "bold " : "") + fs + "px sans-serif";
+    ctx.fillText(labels[i], x, y);
+    if (isHl) {
+      ctx.strokeStyle = "#000"; ctx.lineWidth = 1.5;
+      ctx.beginPath(); ctx.arc(x, y, Math.max(4, W / 60), 0, 2 * Math.PI); ctx.stroke();
+    }
+  }
+  canvas.title = title;
+}
+
+function panel(size, title) {
+  const div = document.createElement("div");
+  div.className = "panel";
+  div.innerHTML = `<h4>${title}</h4>`;
+  const c = document.createElement("canvas");
+  c.width = size; c.height = size;
+  div.appendChild(c);
+  document.getElementById("grid").appendChild(div);
+  return c;
+}
+
+// Grid panels are drawn lazily, when they scroll into view
+let observer = null;
+function render() {
+  const grid = document.getElementById("grid");
+  grid.innerHTML = "";
+  if (observer) observer.disconnect();
+  const size = +document.getElementById("size").value;
+  const v = subjSel.value;
+  if (v === "group") {
+    drawMap(panel(size * 2, "Group mean"), group, 0, "Group mean");
+  } else if (v !== "all") {
+    const s = +v;
+    drawMap(panel(size * 2, "Participant " + B.participant_ids[s]), coords, s * nWords * 2, B.participant_ids[s]);
+  } else {
+    observer = new IntersectionObserver(entries => {
+      entries.forEach(e => {
+        if (!e.isIntersecting) return;
+        const s = +e.target.dataset.s;
+        drawMap(e.target, coords, s * nWords * 2, B.participant_ids[s]);
+        observer.unobserve(e.target);
+      });
+    });
+    for (let s = 0; s < nSubj; s++) {
+      const c = panel(size, "Participant " + B.participant_ids[s]);
+      c.dataset.s = s;
+      observer.observe(c);
+    }
+  }
+}
+["subject", "lang", "highlight", "size"].forEach(id =>
+  document.getElementById(id).addEventListener("input", render));
+render();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Mask-aware inter-subject correlation (ISC) kernels.
+
+np.corrcoef needs every RDM cell to be observed. Here each subject also
+has a boolean mask (True = observed pair, e.g. preprocessed/observed_mask.npy),
+and every subject-pair correlation is computed over the entries both
+subjects observed. All pairs and all words are done at once with masked
+matrix products:
+
+    n_ab   = M_a . M_b              (jointly observed entries)
+    Sx_ab  = (X_a M_a) . M_b        (sum of a's values over those entries)
+    Sxx_ab = (X_a^2 M_a) . M_b
+    Sxy_ab = (X_a M_a) . (X_b M_b)
+    r_ab   = (n Sxy - Sx Sy) / sqrt((n Sxx - Sx^2)(n Syy - Sy^2))
+
+Usage:
+    from masked_isc import masked_word_iscs
+    isc = masked_word_iscs(all_rdms, mask, subject_indices)   # (n_words,) mean Fisher z
+"""
+
+import numpy as np
+
+MIN_OVERLAP = 3   # fewer jointly observed entries -> correlation is NaN
+
+
+def _swap(a):
+    return np.swapaxes(a, -1, -2)
+
+
+def masked_corr(x, mask, min_overlap=MIN_OVERLAP):
+    """
+    Pearson r between all rows over jointly observed entries.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        (..., n_subjects, d) one vector per subject (leading axes = batch,
+        e.g. words).
+    mask : np.ndarray of bool
+        Same shape as x; True where the entry is observed.
+
+    Returns
+    -------
+    np.ndarray
+        (..., n_subjects, n_subjects); NaN where fewer than min_overlap
+        entries are shared or a vector is constant on them.
+    """
+    mask = np.broadcast_to(mask, x.shape)
+    m = mask.astype(np.float64)
+
+    # Center on each row's observed mean; r is unchanged, cancellation is smaller
+    count = m.sum(axis=-1, keepdims=True)
+    xm = np.where(mask, x, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        center = np.where(count > 0, xm.sum(axis=-1, keepdims=True) / count, 0.0)
+    xm = np.where(mask, x - center, 0.0)
+
+    n = m @ _swap(m)
+    sx = xm @ _swap(m)
+    sxx = (xm * xm) @ _swap(m)
+    sxy = xm @ _swap(xm)
+    sy, syy = _swap(sx), _swap(sxx)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+    r[n < min_overlap] = np.nan
+    return r
+
+
+def mean_fisher_z(r):
+    """
+    Mean Fisher z of the lower-triangle subject pairs of (..., n, n) r,
+    clipped and filtered as in the unmasked analysis. Shape (...,).
+    """
+    n = r.shape[-1]
+    i, j = np.tril_indices(n, k=-1)
+    z = np.arctanh(np.clip(r[..., i, j], -0.999999, 0.999999))
+    z[~np.isfinite(z)] = np.nan
+    valid = np.isfinite(z).sum(axis=-1)
+    with np.errstate(invalid="ignore"):
+        return np.where(valid > 0, np.nansum(z, axis=-1) / np.maximum(valid, 1), np.nan)
+
+
+def word_vectors(rdms, mask, rows=None, cols=None):
+    """
+    Stack word vectors for the masked kernel.
+
+    rdms, mask: (n_subjects, n_words, n_words). cols is either one column
+    index array shared by all rows or an (n_rows, k) array of per-row
+    columns. Returns x, m of shape (n_rows, n_subjects, n_cols); a word's
+    distance to itself is never used (its mask entry is cleared).
+    """
+    n_words = rdms.shape[1]
+    rows = np.arange(n_words) if rows is None else np.asarray(rows)
+    cols = np.arange(n_words) if cols is None else np.asarray(cols)
+    if cols.ndim == 1:
+        cols = np.broadcast_to(cols, (len(rows), len(cols)))
+    x = rdms[:, rows[:, None], cols].transpose(1, 0, 2)
+    m = mask[:, rows[:, None], cols].transpose(1, 0, 2)
+    m = m & (rows[:, None, None] != cols[:, None, :])
+    return x, m
+
+
+def without_self(cols, n_words):
+    """
+    Per-word columns for indices into the (n_words - 1) vector that has the
+    word itself removed (as np.delete does in the unmasked analysis).
+    Returns (n_words, len(cols)).
+    """
+    cols = np.asarray(cols)
+    return cols[None, :] + (cols[None, :] >= np.arange(n_words)[:, None])
+
+
+def masked_word_iscs(rdms, mask, subject_indices=None, cols=None):
+    """
+    Mean Fisher-z ISC per word, subject pairs correlated over jointly
+    observed pairs only.
+
+    cols optionally resamples/selects the columns of the word vectors
+    (see word_vectors / without_self); subject_indices selects (or
+    resamples) subjects.
+    """
+    if subject_indices is not None:
+        rdms, mask = rdms[subject_indices], mask[subject_indices]
+    n_words = rdms.shape[1]
+    if rdms.shape[0] < 2:
+        return np.full(n_words, np.nan)
+    x, m = word_vectors(rdms, mask, cols=cols)
+    return mean_fisher_z(masked_corr(x, m))
@@ -1,56 +1,208 @@
+"""
+Ten closest word pairs in the original paper's behavioral RDMs.
+
+Loads every dismx_*.mat file (variable 'estimate_dissimMat_ltv', the
+condensed 4005-vector of a 90x90 RDM), averages across participants and
+prints the k most similar pairs.
+
+The .mat files are read in parallel once; the stacked condensed matrix
+(n_files x 4005) is cached in cache/mat_rdms/<key>.npy, keyed by the file
+paths, sizes and mtimes, and memory-mapped on later runs. The same loader
+works on the dismx_<id>.mat files written by
+preprocessing_multiarrangement.save_rdms_to_mat_files and on the
+consolidated rdms_all.mat (one row per participant; pass it as --pattern,
+its name keeps it out of the dismx_*.mat glob so --mat_export both is
+not read twice).
+
+Usage:
+    python analysis/mat_files.py
+    python analysis/mat_files.py --pattern "preprocessed/dismx_*.mat" \
+        --word_order_file preprocessed/word_order.csv
+"""
+
+import os
 import glob
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 from scipy.io import loadmat
-from scipy.spatial.distance import squareform
-
-# ---------- 1. Load all .mat RDMs ----------
-# adjust the pattern/path if they’re in a subfolder
-mat_files = sorted(glob.glob("BehavioralSemanticDistanceMatrix/dismx_*.mat"))
-print(f"Found {len(mat_files)} .mat files")
-
-rdms = []
-for f in mat_files:
-    mat = loadmat(f)
-    # adjust key name if different
-    vec = mat["estimate_dissimMat_ltv"].ravel()
-    rdm = squareform(vec)        # (90, 90)
-    rdms.append(rdm)
-
-rdms = np.stack(rdms, axis=0)    # (n_participants, 90, 90)
-print("RDM array shape:", rdms.shape)
-
-# ---------- 2. Mean distance matrix across participants ----------
-mean_rdm = rdms.mean(axis=0)     # (90, 90)
-
-# ---------- 3. Get lower-triangular pairs and find 10 smallest ----------
-n_words = mean_rdm.shape[0]
-i_idx, j_idx = np.tril_indices(n_words, k=-1)  # i < j
-pair_dists = mean_rdm[i_idx, j_idx]           # 4005 values
-
-# sort ascending (smallest distance = most similar)
-sort_idx = np.argsort(pair_dists)
-top_k = 10
-best_idx = sort_idx[:top_k]
-
-# ---------- 4. Load word list from Excel ----------
-# inspect columns the first time if you’re unsure
-words_df = pd.read_excel("Behav_Neural_word_ISC.xlsx")
-print("Columns in word file:", words_df.columns)
-
-# CHANGE this column name if needed to match your file
-# e.g. 'Chinese', 'Word', 'word_zh', etc.
-word_col = "Chinese"   # <-- adjust to actual column name
-words = words_df[word_col].tolist()
-
-assert len(words) == n_words, "Word list length must match RDM size (90)."
-
-# ---------- 5. Print 10 most similar pairs ----------
-print("\nTop 10 most similar word pairs (lowest mean distance):\n")
-for rank, idx in enumerate(best_idx, start=1):
-    i = i_idx[idx]
-    j = j_idx[idx]
-    dist = pair_dists[idx]
-    w1 = words[i]
-    w2 = words[j]
-    print(f"{rank:2d}. {w1}  –  {w2}   (mean distance = {dist:.6f})")
+
+MAT_PATTERN = "BehavioralSemanticDistanceMatrix/dismx_*.mat"
+MAT_KEY = "estimate_dissimMat_ltv"
+CACHE_DIR = "cache/mat_rdms"
+WORD_FILE = "Behav_Neural_word_ISC.xlsx"
+WORD_COL = "Chinese"
+
+
+# ---------- Bulk loading ----------
+
+def _files_key(files):
+    """Cache key from each file's path, size and mtime."""
+    h = hashlib.sha1(MAT_KEY.encode("utf-8"))
+    for f in files:
+        st = os.stat(f)
+        h.update(f"{os.path.abspath(f)}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read_condensed(path):
+    """(k, n_pairs) rows of one file: k = 1 for dismx_<id>.mat, n for rdms_all.mat."""
+    data = loadmat(path, variable_names=[MAT_KEY, "participant_ids"])
+    ltv = np.asarray(data[MAT_KEY], dtype=np.float64)
+    # consolidated files carry participant_ids (one row each), even for one participant
+    return ltv.reshape(-1, ltv.shape[-1]) if "participant_ids" in data else ltv.reshape(1, -1)
+
+
+def load_condensed_rdms(pattern=MAT_PATTERN, cache_dir=CACHE_DIR, n_jobs=None):
+    """
+    Load all dismx_*.mat files matching pattern as one condensed matrix.
+
+    Parameters
+    ----------
+    pattern : str
+        Glob for the .mat files.
+    cache_dir : str or None
+        Where to keep <key>.npy / <key>.json. None disables caching.
+    n_jobs : int or None
+        Reader threads for a cache miss (None = ThreadPoolExecutor default).
+
+    Returns
+    -------
+    condensed : np.ndarray
+        (n_rows, n_pairs), memory-mapped read-only when served from cache;
+        one row per dismx_<id>.mat, all rows of a consolidated rdms_all.mat.
+    files : list of str
+        The .mat files in row order (sorted).
+    """
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No .mat files match {pattern}")
+
+    key = _files_key(files)
+    if cache_dir is not None:
+        npy_path = os.path.join(cache_dir, f"{key}.npy")
+        if os.path.exists(npy_path):
+            return np.load(npy_path, mmap_mode="r"), files
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as ex:
+        vecs = list(ex.map(_read_condensed, files))
+
+    lengths = {v.shape[1] for v in vecs}
+    if len(lengths) != 1:
+        raise ValueError(f"Condensed RDMs differ in length across files: {sorted(lengths)}")
+    condensed = np.concatenate(vecs, axis=0)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write-then-rename so a concurrent reader never sees a partial file
+        tmp_path = os.path.join(cache_dir, f"{key}.tmp.npy")
+        np.save(tmp_path, condensed)
+        os.replace(tmp_path, npy_path)
+        with open(os.path.join(cache_dir, f"{key}.json"), "w", encoding="utf-8") as f:
+            json.dump({"pattern": pattern, "files": files}, f, indent=1)
+        condensed = np.load(npy_path, mmap_mode="r")
+
+    return condensed, files
+
+
+def participant_ids_from_files(files):
+    """dismx_<id>.mat -> <id>"""
+    return [os.path.splitext(os.path.basename(f))[0][len("dismx_"):] for f in files]
+
+
+def n_words_from_pairs(n_pairs):
+    """Number of words n for a condensed vector of length n*(n-1)/2."""
+    n = int(round((1 + np.sqrt(1 + 8 * n_pairs)) / 2))
+    if n * (n - 1) // 2 != n_pairs:
+        raise ValueError(f"{n_pairs} is not a valid condensed RDM length")
+    return n
+
+
+# ---------- Top-k queries ----------
+
+def top_k_pairs(pair_dists, k=10, largest=False):
+    """
+    Indices (into the condensed vector) of the k smallest (or largest)
+    distances, sorted. Uses argpartition: O(n_pairs) + O(k log k).
+    """
+    pair_dists = np.asarray(pair_dists)
+    k = min(k, len(pair_dists))
+    vals = -pair_dists if largest else pair_dists
+    part = np.argpartition(vals, k - 1)[:k]
+    return part[np.argsort(vals[part], kind="stable")]
+
+
+def condensed_to_pairs(idx, n_words):
+    """Condensed indices -> (i, j) word indices with i < j."""
+    i_idx, j_idx = np.triu_indices(n_words, k=1)
+    return i_idx[idx], j_idx[idx]
+
+
+# ---------- Word lists ----------
+
+def load_words(word_file=WORD_FILE, word_col=WORD_COL, word_order_file=None):
+    """
+    Word list in RDM order: from word_order.csv (preprocessing outputs) if
+    given, else from the original paper's Excel file.
+    """
+    if word_order_file is not None:
+        return pd.read_csv(word_order_file, encoding="utf-8-sig")["word"].tolist()
+    from excel_cache import read_excel_cached
+    words_df = read_excel_cached(word_file)
+    print("Columns in word file:", words_df.columns)
+    return words_df[word_col].tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Most similar word pairs across dismx_*.mat RDMs.")
+    parser.add_argument('--pattern', type=str, default=MAT_PATTERN)
+    parser.add_argument('--top_k', type=int, default=10)
+    parser.add_argument('--word_file', type=str, default=WORD_FILE)
+    parser.add_argument('--word_col', type=str, default=WORD_COL)
+    parser.add_argument('--word_order_file', type=str, default=None,
+                        help="word_order.csv to use instead of the Excel word list")
+    parser.add_argument('--no_cache', action='store_true',
+                        help="Stream the .mat files through a running mean instead of "
+                             "building/using the stacked npy cache")
+    args = parser.parse_args(argv)
+
+    if args.no_cache:
+        # ---------- 1-2. Stream files, O(4005) memory ----------
+        from rdm_stats import accumulate, iter_mat_files
+        acc, ids, _ = accumulate(iter_mat_files(args.pattern))
+        print(f"Found {len(ids)} .mat files")
+        n_words = acc.n_words
+        print("RDM array shape:", (acc.n, n_words, n_words))
+        pair_dists = acc.mean
+    else:
+        # ---------- 1. Load all .mat RDMs (condensed) ----------
+        condensed, files = load_condensed_rdms(args.pattern, CACHE_DIR)
+        print(f"Found {len(files)} .mat files"
+              + (f" ({condensed.shape[0]} RDMs)" if condensed.shape[0] != len(files) else ""))
+        n_words = n_words_from_pairs(condensed.shape[1])
+        print("RDM array shape:", (condensed.shape[0], n_words, n_words))
+
+        # ---------- 2. Mean distance across participants (condensed) ----------
+        pair_dists = condensed.mean(axis=0)       # 4005 values
+
+    # ---------- 3. k smallest pairs ----------
+    best_idx = top_k_pairs(pair_dists, args.top_k)
+    i_idx, j_idx = condensed_to_pairs(best_idx, n_words)
+
+    # ---------- 4. Word list ----------
+    words = load_words(args.word_file, args.word_col, args.word_order_file)
+    assert len(words) == n_words, f"Word list length must match RDM size ({n_words})."
+
+    # ---------- 5. Print most similar pairs ----------
+    print(f"\nTop {args.top_k} most similar word pairs (lowest mean distance):\n")
+    for rank, (idx, i, j) in enumerate(zip(best_idx, i_idx, j_idx), start=1):
+        # lower-triangle (row > col) order, as in the original printout
+        print(f"{rank:2d}. {words[j]}  –  {words[i]}   (mean distance = {pair_dists[idx]:.6f})")
+
+
+if __name__ == "__main__":
+    main()
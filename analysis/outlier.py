@@ -1,35 +1,61 @@
+"""
+Subject quality check: correlation of each participant's RDM with the
+leave-one-out group-mean RDM (low values flag outliers).
+
+Usage:
+    python analysis/outlier.py [--rdm_file preprocessed/all_rdms.npy]
+        [--participants_file preprocessed/participant_info.csv] [--out_file qc.csv]
+"""
+
+import argparse
+
 import numpy as np
 import pandas as pd
 from scipy.stats import pearsonr
 
-# --- Load data ---
-all_rdms = np.load("preprocessed/all_rdms.npy")  # shape: (n_subj, 90, 90)
-participants = pd.read_csv("preprocessed/participant_info.csv")
+from rdm_stats import accumulate, iter_npy_shards, as_condensed
+
+RDM_FILE = "preprocessed/all_rdms.npy"
+PARTICIPANTS_FILE = "preprocessed/participant_info.csv"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leave-one-out RDM quality per participant.")
+    parser.add_argument('--rdm_file', type=str, default=RDM_FILE)
+    parser.add_argument('--participants_file', type=str, default=PARTICIPANTS_FILE)
+    parser.add_argument('--out_file', type=str, default=None,
+                        help="Optional CSV for participant_id + rdm_group_corr")
+    args = parser.parse_args(argv)
+
+    # --- Load data ---
+    # all_rdms.npy is streamed (memory-mapped), one subject at a time
+    participants = pd.read_csv(args.participants_file)
+
+    # --- Group mean RDM in one pass (O(4005) state, constant in n_subj) ---
+    group, _, _ = accumulate(iter_npy_shards([args.rdm_file]))
+    n_subj, n_words = group.n, group.n_words
+    print("all_rdms shape:", (n_subj, n_words, n_words))
 
-n_subj, n_words, _ = all_rdms.shape
-print("all_rdms shape:", all_rdms.shape)
+    # --- Compute leave-one-out correlation for each subject ---
+    # vectors are the upper triangle (excluding diagonal), i.e. condensed form
+    subj_quality = []
 
-# helper: flatten upper triangle (excluding diagonal)
-def vec_from_rdm(rdm):
-    triu_idx = np.triu_indices(n_words, k=1)
-    return rdm[triu_idx]
+    for s, rdm_s in iter_npy_shards([args.rdm_file]):
+        vec_s = as_condensed(rdm_s)
 
-# --- Compute leave-one-out correlation for each subject ---
-subj_quality = []
+        # mean RDM of all other subjects
+        vec_mean = group.leave_one_out_mean(vec_s)
 
-for s in range(n_subj):
-    rdm_s = all_rdms[s]
-    vec_s = vec_from_rdm(rdm_s)
+        r, _ = pearsonr(vec_s, vec_mean)
+        subj_quality.append(r)
 
-    # mean RDM of all other subjects
-    others = np.delete(all_rdms, s, axis=0)
-    mean_rdm_others = others.mean(axis=0)
-    vec_mean = vec_from_rdm(mean_rdm_others)
+    subj_quality = np.array(subj_quality)
+    participants["rdm_group_corr"] = subj_quality
 
-    r, _ = pearsonr(vec_s, vec_mean)
-    subj_quality.append(r)
+    print(participants)
+    if args.out_file:
+        participants.to_csv(args.out_file, index=False)
 
-subj_quality = np.array(subj_quality)
-participants["rdm_group_corr"] = subj_quality
 
-print(participants)
+if __name__ == "__main__":
+    main()
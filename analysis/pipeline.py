@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+One entry point for the whole workflow:
+
+    clean -> preprocess -> step1 -> plot_isc
+                        -> step2
+                        -> step3              (with --sem_all_cols/--sem_sig_cols)
+                        -> mat_export, qc, plot_space
+
+Each stage declares its inputs, outputs and parameters. Its fingerprint
+is a sha1 over the stage's command line (all parameters), its script (or
+function source), every analysis/*.py module these import, directly or
+through each other (lazy imports included), and the contents of its
+input files. A stage whose fingerprint matches its
+last successful run (cache/pipeline/state.json) and whose outputs all
+exist is skipped, so e.g. re-plotting never reruns the bootstraps.
+Stages whose dependencies are done run concurrently (--jobs); each stage
+logs to cache/pipeline/logs/<stage>.log.
+
+Usage:
+    python analysis/pipeline.py                        # all stages, up-to-date ones skipped
+    python analysis/pipeline.py --steps plot_isc       # one stage (+ stale upstream stages)
+    python analysis/pipeline.py --steps step1,step2 --n_bootstraps 1000 --force
+    python analysis/pipeline.py --list                 # stages and whether they are up to date
+"""
+
+import os
+import ast
+import sys
+import json
+import shlex
+import hashlib
+import inspect
+import argparse
+import textwrap
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from excel_cache import file_sha1
+
+ANALYSIS_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = "cache/pipeline"
+# Scripts that write a JSON run report (instrument.py) via --report
+REPORTING_SCRIPTS = {
+    "preprocessing.py", "preprocessing_multiarrangement.py",
+    "data_analysis_multiarrangement.py", "plot_word_isc.py", "plot_space.py",
+}
+
+
+# ---------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------
+
+class Stage:
+    """
+    One pipeline step: either a script run as a subprocess (script + args)
+    or an in-process function (func(**params)).
+    """
+
+    def __init__(self, name, deps=(), inputs=(), outputs=(), script=None, args=(),
+                 func=None, params=None):
+        self.name = name
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.script = script
+        self.args = [str(a) for a in args]
+        self.func = func
+        self.params = params or {}
+
+    def command(self):
+        return [sys.executable, os.path.join(ANALYSIS_DIR, self.script)] + self.args
+
+    def outputs_exist(self):
+        return all(os.path.exists(p) for p in self.outputs)
+
+
+def _export_mat(rdm_file, participants_file, output_folder):
+    """mat_export stage: dismx_<id>.mat files (parallel, unchanged ones skipped)."""
+    import numpy as np
+    import pandas as pd
+    from preprocessing_multiarrangement import save_rdms_to_mat_files
+
+    ids = pd.read_csv(participants_file)["participant_id"].astype(str).tolist()
+    save_rdms_to_mat_files(np.load(rdm_file, mmap_mode="r"), ids, output_folder)
+
+
+def build_stages(args):
+    """The stage graph for the given command-line settings."""
+    pre = args.preprocessed_dir
+    rdm_file = os.path.join(pre, "all_rdms.npy")
+    participants_file = os.path.join(pre, "participant_info.csv")
+    word_order_file = os.path.join(pre, "word_order.csv")
+    res = args.results_dir
+    step1_file = os.path.join(res, "step1_subject_bootstrap_stats.csv")
+
+    analysis_args = ["--preprocessed_file", rdm_file, "--output_folder", res,
+                     "--n_bootstraps", args.n_bootstraps, "--seed", args.seed]
+
+    stages = [
+        Stage("clean", inputs=[args.data_dir], outputs=[args.cleaned_dir],
+              script="preprocessing.py",
+              args=["--data_dir", args.data_dir, "--output_dir", args.cleaned_dir]),
+        Stage("preprocess", deps=["clean"], inputs=[args.cleaned_dir],
+              outputs=[rdm_file, participants_file, word_order_file],
+              script="preprocessing_multiarrangement.py",
+              args=[args.cleaned_dir, pre, "--mat_export", "none"]
+                   + shlex.split(args.preprocess_args)),
+        Stage("mat_export", deps=["preprocess"], inputs=[rdm_file, participants_file],
+              outputs=[os.path.join(pre, "dismx_manifest.json")],
+              func=_export_mat,
+              params={"rdm_file": rdm_file, "participants_file": participants_file,
+                      "output_folder": pre}),
+        Stage("qc", deps=["preprocess"], inputs=[rdm_file, participants_file],
+              outputs=[os.path.join(res, "qc_rdm_group_corr.csv")],
+              script="outlier.py",
+              args=["--rdm_file", rdm_file, "--participants_file", participants_file,
+                    "--out_file", os.path.join(res, "qc_rdm_group_corr.csv")]),
+        Stage("step1", deps=["preprocess"], inputs=[rdm_file], outputs=[step1_file],
+              script="data_analysis_multiarrangement.py",
+              args=analysis_args + ["--steps", "1"]),
+        Stage("step2", deps=["preprocess"], inputs=[rdm_file],
+              outputs=[os.path.join(res, "step2_word_bootstrap_stats.csv")],
+              script="data_analysis_multiarrangement.py",
+              args=analysis_args + ["--steps", "2"]),
+        Stage("plot_isc", deps=["step1"],
+              inputs=[word_order_file, step1_file, args.experiment_js],
+              outputs=[os.path.join(res, "word_ISC_barplot_english.png")],
+              script="plot_word_isc.py",
+              args=["--word_order_file", word_order_file, "--isc_file", step1_file,
+                    "--experiment_js", args.experiment_js,
+                    "--output_fig", os.path.join(res, "word_ISC_barplot_english.png")]),
+        Stage("plot_space", deps=["preprocess"],
+              inputs=[rdm_file, participants_file, word_order_file, args.experiment_js],
+              outputs=[os.path.join(args.figures_dir, "subject_maps_4x8.png")],
+              script="plot_space.py",
+              args=["--rdm_file", rdm_file, "--participants_file", participants_file,
+                    "--word_order_file", word_order_file, "--experiment_js", args.experiment_js,
+                    "--out_dir", args.figures_dir]),
+    ]
+    if args.sem_all_cols and args.sem_sig_cols:
+        stages.append(Stage(
+            "step3", deps=["preprocess"], inputs=[rdm_file, args.semantic_file],
+            outputs=[os.path.join(res, "step3_correlation_stats.csv"),
+                     os.path.join(res, "step3_regression_beta_stats.csv")],
+            script="data_analysis_multiarrangement.py",
+            args=analysis_args + ["--steps", "3", "--semantic_file", args.semantic_file,
+                                  "--sem_all_cols", args.sem_all_cols,
+                                  "--sem_sig_cols", args.sem_sig_cols],
+        ))
+    return {s.name: s for s in stages}
+
+
+# ---------------------------------------------------------------------
+# Fingerprints / state
+# ---------------------------------------------------------------------
+
+_hash_memo = {}
+
+
+def _content_hash(path):
+    """sha1 of a file, memoized on (path, size, mtime) for this run."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if key not in _hash_memo:
+        _hash_memo[key] = file_sha1(path)
+    return _hash_memo[key]
+
+
+def _local_imports(tree):
+    """Names of the analysis/*.py modules imported anywhere in an ast (function bodies included)."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split(".")[0])
+    return {n for n in names if os.path.exists(os.path.join(ANALYSIS_DIR, n + ".py"))}
+
+
+def _module_imports(name):
+    """_local_imports of analysis/<name>.py, memoized on its content hash."""
+    path = os.path.join(ANALYSIS_DIR, name + ".py")
+    key = ("imports", _content_hash(path))
+    if key not in _hash_memo:
+        with open(path, "r", encoding="utf-8") as f:
+            _hash_memo[key] = _local_imports(ast.parse(f.read(), filename=path))
+    return _hash_memo[key]
+
+
+def code_closure(modules):
+    """The given analysis modules plus everything they import from analysis/, sorted."""
+    seen, todo = set(), list(modules)
+    while todo:
+        name = todo.pop()
+        if name not in seen:
+            seen.add(name)
+            todo.extend(_module_imports(name))
+    return sorted(seen)
+
+
+def fingerprint(stage):
+    """sha1 of the stage's command/parameters, code (with its analysis imports) and input contents."""
+    h = hashlib.sha1(stage.name.encode("utf-8"))
+    if stage.script is not None:
+        h.update(json.dumps(stage.args).encode("utf-8"))
+        modules = code_closure([os.path.splitext(stage.script)[0]])
+    else:
+        source = textwrap.dedent(inspect.getsource(stage.func))
+        h.update(source.encode("utf-8"))
+        h.update(json.dumps(stage.params, sort_keys=True).encode("utf-8"))
+        modules = code_closure(_local_imports(ast.parse(source)))
+    for name in modules:
+        h.update(name.encode("utf-8"))
+        h.update(_content_hash(os.path.join(ANALYSIS_DIR, name + ".py")).encode("utf-8"))
+    for path in stage.inputs:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                for f in sorted(files):
+                    fp = os.path.join(root, f)
+                    h.update(os.path.relpath(fp, path).encode("utf-8"))
+                    h.update(_content_hash(fp).encode("utf-8"))
+        elif os.path.exists(path):
+            h.update(path.encode("utf-8"))
+            h.update(_content_hash(path).encode("utf-8"))
+        else:
+            h.update(f"missing:{path}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_state(state_dir=STATE_DIR):
+    path = os.path.join(state_dir, "state.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    path = os.path.join(state_dir, "state.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(stage, state):
+    return stage.outputs_exist() and state.get(stage.name) == fingerprint(stage)
+
+
+# ---------------------------------------------------------------------
+# Running
+# ---------------------------------------------------------------------
+
+def run_stage(stage, state_dir=STATE_DIR):
+    """
+    Run one stage, output to <state_dir>/logs/<name>.log (run report, if
+    the script writes one, to <name>.json). Returns True on success.
+    """
+    log_dir = os.path.join(state_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"{stage.name}.log")
+    for out in stage.outputs:
+        parent = out if not os.path.splitext(out)[1] else os.path.dirname(out)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+
+    with open(log_path, "w", encoding="utf-8") as log:
+        if stage.script is not None:
+            command = stage.command()
+            if stage.script in REPORTING_SCRIPTS:
+                # not part of stage.args, so it does not change the fingerprint
+                command += ["--report", os.path.join(log_dir, f"{stage.name}.json")]
+            log.write(" ".join(shlex.quote(c) for c in command) + "\n\n")
+            log.flush()
+            env = dict(os.environ, MPLBACKEND="Agg")
+            proc = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT, env=env)
+            return proc.returncode == 0
+
+        from contextlib import redirect_stdout, redirect_stderr
+        try:
+            with redirect_stdout(log), redirect_stderr(log):
+                stage.func(**stage.params)
+        except Exception as e:
+            log.write(f"\n{type(e).__name__}: {e}\n")
+            return False
+        return True
+
+
+def with_upstream(stages, selected):
+    """selected stage names plus everything they depend on."""
+    needed, todo = set(), list(selected)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(stages[name].deps)
+    return needed
+
+
+def run_pipeline(stages, selected, jobs=None, force=False, state_dir=STATE_DIR):
+    """
+    Run the selected stages and any stale upstream stages, concurrently
+    where the graph allows. force=True reruns the selected stages even
+    if up to date. Returns {stage: "ran" | "up to date" | "failed" | "blocked"}.
+    """
+    state = load_state(state_dir)
+    needed = with_upstream(stages, selected)
+    status = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as ex:
+        while True:
+            n_resolved = len(status)
+            for name in sorted(needed - set(status) - {n for n, _ in running.values()}):
+                deps = stages[name].deps
+                if any(status.get(d) in ("failed", "blocked") for d in deps):
+                    status[name] = "blocked"
+                    print(f"[{name}] blocked (upstream failure)")
+                    continue
+                if not all(status.get(d) in ("ran", "up to date") for d in deps if d in needed):
+                    continue
+                stage = stages[name]
+                fp = fingerprint(stage)
+                if not (force and name in selected) and stage.outputs_exist() \
+                        and state.get(name) == fp:
+                    status[name] = "up to date"
+                    print(f"[{name}] up to date")
+                    continue
+                print(f"[{name}] running")
+                running[ex.submit(run_stage, stage, state_dir)] = (name, fp)
+
+            if not running:
+                if needed <= set(status):
+                    break
+                if len(status) == n_resolved:
+                    raise RuntimeError(f"Cannot schedule stages {sorted(needed - set(status))}")
+                # newly resolved stages (up to date / blocked) may unblock others
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, fp = running.pop(fut)
+                ok = fut.result()
+                status[name] = "ran" if ok else "failed"
+                if ok:
+                    # fingerprint at start: inputs changed mid-run -> rerun next time
+                    state[name] = fp
+                    save_state(state, state_dir)
+                    print(f"[{name}] done")
+                else:
+                    state.pop(name, None)
+                    save_state(state, state_dir)
+                    print(f"[{name}] FAILED, see {os.path.join(state_dir, 'logs', name + '.log')}")
+    return status
+
+
+# ---------------------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the analysis pipeline, skipping up-to-date stages.")
+    parser.add_argument('--steps', type=str, default="all",
+                        help="Comma-separated stages to run (plus stale upstream stages); "
+                             "see --list. Default: all")
+    parser.add_argument('--force', action='store_true',
+                        help="Rerun the selected stages even if up to date")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Stages run at the same time (default: all cores)")
+    parser.add_argument('--list', action='store_true', help="List stages and their status")
+    parser.add_argument('--data_dir', type=str, default="data")
+    parser.add_argument('--cleaned_dir', type=str, default="cleaned")
+    parser.add_argument('--preprocessed_dir', type=str, default="preprocessed")
+    parser.add_argument('--results_dir', type=str, default="results")
+    parser.add_argument('--figures_dir', type=str, default="figures")
+    parser.add_argument('--experiment_js', type=str, default="experiment.js")
+    parser.add_argument('--preprocess_args', type=str, default="",
+                        help="Extra arguments for preprocessing_multiarrangement.py, "
+                             "e.g. \"--weighting inverse_mds\"")
+    parser.add_argument('--n_bootstraps', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42,
+                        help="Analysis RNG seed (cached results are only reusable if seeded)")
+    parser.add_argument('--semantic_file', type=str, default="Behav_Neural_word_ISC.xlsx")
+    parser.add_argument('--sem_all_cols', type=str, default=None)
+    parser.add_argument('--sem_sig_cols', type=str, default=None)
+    args = parser.parse_args(argv)
+
+    stages = build_stages(args)
+
+    if args.list:
+        state = load_state()
+        for name, stage in stages.items():
+            ok = is_up_to_date(stage, state)
+            deps = ", ".join(stage.deps) or "-"
+            print(f"{name:12s} {'up to date' if ok else 'stale':10s} after: {deps}")
+        return
+
+    selected = list(stages) if args.steps == "all" else [s.strip() for s in args.steps.split(",")]
+    unknown = [s for s in selected if s not in stages]
+    if unknown:
+        parser.error(f"Unknown stage(s) {unknown}; choose from {list(stages)}")
+
+    status = run_pipeline(stages, selected, jobs=args.jobs, force=args.force)
+    if any(v in ("failed", "blocked") for v in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
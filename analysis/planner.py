@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resource-cost planner for data_analysis_multiarrangement.py (--dry_run).
+
+Only the header of the RDM file is read (subjects x words). Each
+requested step is then calibrated on random RDMs of that shape: the
+bootstrap count doubles from 1 until a run takes CAL_SECONDS (or reaches
+CAL_MAX_BOOTSTRAPS), and the last two runs give the step's fixed and
+per-bootstrap cost. The same two runs under tracemalloc give its working
+memory and memory per bootstrap, and the calibration CSVs give the
+output sizes (their rows do not depend on the bootstrap count). One more
+run with all CPUs as worker processes measures the parallel speedup.
+
+Projections for n bootstraps, block size b and j workers:
+
+  time    fixed + per_bootstrap * n / speedup(j)
+          (speedup interpolated between 1 and the measured one)
+  memory  process baseline (current RSS: interpreter, libraries) + RDM
+          tensor (+ mask) + memory per bootstrap * n
+          + j * (working memory + index arrays of a block of b)
+
+choose() picks the fastest (workers, block) setting whose peak fits the
+memory budget (default: BUDGET_FRACTION of the available memory); ties
+go to fewer workers and larger blocks. Block size and worker count only
+apply to the blocked engines (numpy, numba without a mask); numba uses
+its own threads, so it always runs with one process.
+
+Usage:
+    python analysis/data_analysis_multiarrangement.py --preprocessed_file preprocessed/all_rdms.npy \\
+        --output_folder results --n_bootstraps 10000 --dry_run [--memory_budget 8G]
+    python analysis/data_analysis_multiarrangement.py ... --n_jobs auto --block_size auto
+"""
+
+import io
+import os
+import time
+import math
+import tracemalloc
+from contextlib import redirect_stdout, redirect_stderr
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import data_analysis_multiarrangement as da
+from excel_cache import read_excel_cached
+from isc_kernels import BLOCK, resolve_engine
+
+BLOCK_SIZES = [16, 32, 64, 128, 256]
+CAL_SECONDS = 0.5          # target duration of the last calibration run
+CAL_MAX_BOOTSTRAPS = 256
+BUDGET_FRACTION = 0.8      # of the available memory, when no --memory_budget is given
+MIN_SPEEDUP = 1.1          # measured parallel speedup below this = workers do not pay off
+
+
+def rdm_shape(path):
+    """(n_subjects, n_words) from the header of an all_rdms(.npy / _condensed.npy) or all_pairs_sparse.npz."""
+    if path.endswith(".npz"):
+        with np.load(path) as z:            # scipy.sparse.save_npz stores the shape separately
+            n_subjects, n_pairs = (int(x) for x in z["shape"])
+    else:
+        with open(path, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, _, _ = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, _ = np.lib.format.read_array_header_2_0(f)
+        if len(shape) == 3:
+            return int(shape[0]), int(shape[1])
+        n_subjects, n_pairs = (int(x) for x in shape)
+    return n_subjects, int(round((1 + np.sqrt(1 + 8 * n_pairs)) / 2))
+
+
+def parse_size(text):
+    """Bytes from '8G', '512M', '1.5GB', '2e9' ..."""
+    units = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    unit = text[-1] if text and text[-1] in units else ""
+    try:
+        return int(float(text[:len(text) - len(unit)]) * units[unit])
+    except ValueError:
+        raise ValueError(f"Cannot parse memory size {text!r} (e.g. 8G, 512M)")
+
+
+def available_memory():
+    """Available memory in bytes (MemAvailable on Linux, else physical memory, else None)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def format_bytes(n):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def format_seconds(s):
+    if s < 60:
+        return f"{s:.1f}s"
+    if s < 3600:
+        return f"{s / 60:.1f}min"
+    if s < 86400:
+        return f"{s / 3600:.1f}h"
+    return f"{s / 86400:.1f}d"
+
+
+def calibration_data(n_subjects, n_words, with_mask, n_sem_cols, seed=0):
+    """Random symmetric RDMs (+ all-observed mask, + semantic table) of the run's shape."""
+    rng = np.random.default_rng(seed)
+    rdms = rng.random((n_subjects, n_words, n_words))
+    rdms += rdms.transpose(0, 2, 1)
+    rdms[:, np.arange(n_words), np.arange(n_words)] = 0
+    mask = np.ones(rdms.shape, dtype=bool) if with_mask else None
+    sem = pd.DataFrame(rng.normal(size=(n_words, n_sem_cols))) if n_sem_cols else None
+    return rdms, mask, sem
+
+
+def _run_step(step, data, n_bootstraps, engine, sem_idx, block=BLOCK, n_jobs=1):
+    """Run one step quietly on calibration data; returns its result DataFrames."""
+    rdms, mask, sem = data
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        if step == 1:
+            return [da.run_step1_subject_bootstrap(rdms, n_bootstraps, mask, engine, block, n_jobs)]
+        if step == 2:
+            return [da.run_step2_word_bootstrap(rdms, n_bootstraps, mask, engine, block, n_jobs)]
+        return list(da.run_step3_split_half(rdms, n_bootstraps, sem, *sem_idx, mask, engine, block, n_jobs))
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def _traced_peak(fn):
+    """Peak bytes allocated (numpy included) while fn runs."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _fit(n_prev, y_prev, n, y):
+    """(fixed, per_bootstrap) through two measurements; per-bootstrap only if they disagree."""
+    slope = (y - y_prev) / (n - n_prev)
+    if n_prev == 0 or slope <= 0:
+        return 0.0, y / n
+    return max(y - slope * n, 0.0), slope
+
+
+def calibrate_step(step, data, n_bootstraps, engine, sem_idx, max_jobs=1):
+    """Measured costs of one step (see module docstring)."""
+    run = lambda n, block=BLOCK, jobs=1: _run_step(step, data, n, engine, sem_idx, block, jobs)
+    run(1)   # warm-up: imports, caches, numba compilation
+
+    cap = max(1, min(n_bootstraps, CAL_MAX_BOOTSTRAPS))
+    n_prev, t_prev, n = 0, 0.0, 1
+    while True:
+        t = _timed(lambda: run(n))
+        if t >= CAL_SECONDS or n >= cap:
+            break
+        n_prev, t_prev, n = n, t, min(2 * n, cap)
+    fixed_s, per_bootstrap_s = _fit(n_prev, t_prev, n, t)
+
+    peak = _traced_peak(lambda: run(n))
+    peak_prev = _traced_peak(lambda: run(n_prev)) if n_prev else 0
+    working, per_bootstrap_bytes = _fit(n_prev, peak_prev, n, peak)
+
+    outputs = run(n)
+    output_bytes = sum(len(df.to_csv(index=False).encode("utf-8")) for df in outputs if df is not None)
+
+    speedup, jobs_cal = 1.0, 1
+    if max_jobs > 1:
+        jobs_cal = max_jobs
+        n_par = max(n, jobs_cal)
+        t_par = _timed(lambda: run(n_par, math.ceil(n_par / jobs_cal), jobs_cal))
+        speedup = (fixed_s + per_bootstrap_s * n_par) / t_par
+
+    return {
+        "step": step,
+        "calibration_bootstraps": n,
+        "fixed_s": fixed_s,
+        "per_bootstrap_s": per_bootstrap_s,
+        "working_bytes": int(working),
+        "per_bootstrap_bytes": per_bootstrap_bytes,
+        "output_bytes": output_bytes,
+        "parallel_jobs": jobs_cal,
+        "parallel_speedup": speedup,
+    }
+
+
+def block_bytes(step, block, n_subjects, n_words, engine):
+    """Index and result arrays of one block that are not views (np.stack, or ascontiguousarray for numba)."""
+    k, d = (n_words // 2, n_words - n_words // 2) if step == 3 else (n_words, n_words - 1)
+    size = block * k * 8                        # block result
+    if step == 2 or engine == "numba":
+        size += block * k * d * 8               # column indices
+    if engine == "numba":
+        size += block * (n_subjects + k) * 8    # subject and word indices
+    return size
+
+
+def speedup_at(cal, n_jobs):
+    """Parallel speedup with n_jobs workers, interpolated from the measured one."""
+    if n_jobs <= 1 or cal["parallel_jobs"] <= 1 or cal["parallel_speedup"] < MIN_SPEEDUP:
+        return 1.0
+    frac = (min(n_jobs, cal["parallel_jobs"]) - 1) / (cal["parallel_jobs"] - 1)
+    return 1.0 + (cal["parallel_speedup"] - 1.0) * frac
+
+
+def project(cal, n_bootstraps, base_bytes, shape, engine, block, n_jobs):
+    """Projected wall time and peak memory of one step for a setting."""
+    n_jobs = max(1, min(n_jobs, math.ceil(n_bootstraps / block)))
+    wall = cal["fixed_s"] + cal["per_bootstrap_s"] * n_bootstraps / speedup_at(cal, n_jobs)
+    per_process = cal["working_bytes"] + block_bytes(cal["step"], block, *shape, engine)
+    peak = base_bytes + cal["per_bootstrap_bytes"] * n_bootstraps + n_jobs * per_process
+    return {"wall_s": wall, "peak_bytes": int(peak)}
+
+
+def choose(cals, n_bootstraps, base_bytes, shape, engine, budget, max_jobs):
+    """
+    (block, n_jobs, fits) of the fastest setting whose peak memory fits
+    the budget; if none fits, the one with the smallest peak.
+    """
+    settings = []
+    for n_jobs in range(1, max_jobs + 1):
+        for block in BLOCK_SIZES:
+            block = min(block, max(1, math.ceil(n_bootstraps / n_jobs)))
+            p = [project(c, n_bootstraps, base_bytes, shape, engine, block, n_jobs) for c in cals]
+            wall = sum(x["wall_s"] for x in p)
+            peak = max(x["peak_bytes"] for x in p)
+            settings.append((wall, peak, n_jobs, block))
+    fitting = [s for s in settings if budget is None or s[1] <= budget]
+    if fitting:
+        # equal times (e.g. no parallel speedup): fewer workers, then larger blocks
+        _, _, n_jobs, block = min(fitting, key=lambda s: (round(s[0], 3), s[2], -s[3]))
+        return block, n_jobs, True
+    _, _, n_jobs, block = min(settings, key=lambda s: (s[1], s[0]))
+    return block, n_jobs, False
+
+
+def plan(args):
+    """
+    Calibrate and project the run described by data_analysis_multiarrangement
+    arguments; returns a JSON-serializable plan dict (see print_plan).
+    """
+    shape = rdm_shape(args.preprocessed_file)
+    n_subjects, n_words = shape
+    n_bootstraps = args.n_bootstraps
+    engine = resolve_engine(args.engine)
+    masked = bool(args.mask_file)
+    blocked = engine != "reference" and not masked
+    max_jobs = (os.cpu_count() or 1) if blocked and engine != "numba" else 1
+    steps = sorted({int(x) for x in args.steps.split(',') if x.strip()})
+
+    notes = []
+    sem_idx = ([], [])
+    if 3 in steps:
+        if args.semantic_file and os.path.exists(args.semantic_file):
+            columns = read_excel_cached(args.semantic_file).columns
+            sem_idx = (da.resolve_columns(args.sem_all_cols, columns),
+                       da.resolve_columns(args.sem_sig_cols, columns))
+        if not all(sem_idx):
+            notes.append("Step 3 skipped: no semantic file or columns (as in the run)")
+            steps.remove(3)
+    n_sem_cols = max(sem_idx[0] + sem_idx[1], default=-1) + 1
+
+    if args.memory_budget:
+        budget, budget_source = parse_size(args.memory_budget), "--memory_budget"
+    else:
+        available = available_memory()
+        budget = int(available * BUDGET_FRACTION) if available else None
+        budget_source = f"{BUDGET_FRACTION:.0%} of available memory" if available else "unknown"
+
+    rdm_bytes = n_subjects * n_words * n_words * 8
+    mask_bytes = n_subjects * n_words * n_words if masked else 0
+    rss_mb = instrument._rss_mb()
+    baseline_bytes = int(rss_mb * 2**20) if rss_mb is not None else 0
+    base_bytes = baseline_bytes + rdm_bytes + mask_bytes
+    result = {
+        "preprocessed_file": args.preprocessed_file,
+        "file_bytes": os.path.getsize(args.preprocessed_file),
+        "n_subjects": n_subjects,
+        "n_words": n_words,
+        "n_bootstraps": n_bootstraps,
+        "engine": engine,
+        "masked": masked,
+        "blocked": blocked,
+        "max_jobs": max_jobs,
+        "budget_bytes": budget,
+        "budget_source": budget_source,
+        "rdm_bytes": rdm_bytes,
+        "mask_bytes": mask_bytes,
+        "baseline_bytes": baseline_bytes,
+        "steps": [],
+        "settings": [],
+        "chosen": None,
+        "notes": notes,
+    }
+    if budget is not None and base_bytes + rdm_bytes + mask_bytes > budget:
+        # the calibration data is a second tensor of the same size
+        notes.append("Process baseline + RDM tensor (+ its calibration copy) exceed the memory budget; "
+                     "not calibrated")
+        return result
+    if not steps:
+        return result
+
+    state = np.random.get_state()
+    try:
+        data = calibration_data(n_subjects, n_words, masked, n_sem_cols)
+        cals = []
+        for step in steps:
+            print(f"Calibrating step {step} ...")
+            cals.append(calibrate_step(step, data, n_bootstraps, engine, sem_idx, max_jobs))
+    finally:
+        np.random.set_state(state)
+    result["steps"] = cals
+
+    block, n_jobs, fits = choose(cals, n_bootstraps, base_bytes, shape, engine, budget, max_jobs)
+    candidates = [("serial", BLOCK, 1)]
+    if max_jobs > 1:
+        candidates.append((f"parallel x{max_jobs}", BLOCK, max_jobs))
+    if blocked:
+        candidates.append(("chosen", block, n_jobs))
+    for name, b, j in candidates:
+        p = [project(c, n_bootstraps, base_bytes, shape, engine, b, j) for c in cals]
+        result["settings"].append({
+            "setting": name,
+            "block": b if blocked else None,
+            "n_jobs": j,
+            "wall_s": [x["wall_s"] for x in p],
+            "peak_bytes": [x["peak_bytes"] for x in p],
+        })
+    result["chosen"] = {"block": block, "n_jobs": n_jobs, "fits": fits}
+    if not fits:
+        notes.append("No setting fits the memory budget; chosen = smallest peak")
+    if not blocked:
+        notes.append("Block size and workers do not apply to the reference engine or masked runs")
+    return result
+
+
+def print_plan(result):
+    print(f"\n--- Plan: {result['n_subjects']} subjects x {result['n_words']} words, "
+          f"{result['n_bootstraps']} bootstraps, engine {result['engine']}"
+          f"{', masked' if result['masked'] else ''} ---")
+    budget = result["budget_bytes"]
+    print(f"RDM file {format_bytes(result['file_bytes'])}, in memory "
+          f"{format_bytes(result['rdm_bytes'] + result['mask_bytes'])}, process baseline "
+          f"{format_bytes(result['baseline_bytes'])}; memory budget "
+          f"{format_bytes(budget) if budget is not None else 'unlimited'} ({result['budget_source']})")
+
+    if result["steps"]:
+        rows = []
+        for setting in result["settings"]:
+            label = setting["setting"]
+            if result["blocked"]:
+                label += f" (block {setting['block']}, {setting['n_jobs']} process"
+                label += "es)" if setting["n_jobs"] > 1 else ")"
+            for cal, wall, peak in zip(result["steps"], setting["wall_s"], setting["peak_bytes"]):
+                rows.append({
+                    "setting": label,
+                    "step": cal["step"],
+                    "time": format_seconds(wall),
+                    "peak memory": format_bytes(peak),
+                    "fits": budget is None or peak <= budget,
+                    "output": format_bytes(cal["output_bytes"]),
+                })
+            rows.append({"setting": label, "step": "all", "time": format_seconds(sum(setting["wall_s"])),
+                         "peak memory": format_bytes(max(setting["peak_bytes"])),
+                         "fits": budget is None or max(setting["peak_bytes"]) <= budget,
+                         "output": format_bytes(sum(c["output_bytes"] for c in result["steps"]))})
+        print(pd.DataFrame(rows).to_string(index=False))
+
+        print("\nCalibration:")
+        for cal in result["steps"]:
+            line = (f"  step {cal['step']}: {cal['calibration_bootstraps']} bootstraps, "
+                    f"{cal['per_bootstrap_s'] * 1000:.2f} ms + {format_bytes(cal['per_bootstrap_bytes'])} "
+                    f"per bootstrap, working memory {format_bytes(cal['working_bytes'])}")
+            if cal["parallel_jobs"] > 1:
+                line += f", speedup x{cal['parallel_speedup']:.2f} with {cal['parallel_jobs']} processes"
+            print(line)
+        chosen = result["chosen"]
+        if result["blocked"]:
+            print(f"\nChosen: --block_size {chosen['block']} --n_jobs {chosen['n_jobs']}")
+    for note in result["notes"]:
+        print(f"Note: {note}")
@@ -7,132 +7,97 @@ Reconstruct 2D semantic maps per subject (like Wang & Bi Fig. 1C / 2C).
 Inputs:
 - preprocessed/all_rdms.npy        (n_subjects x 90 x 90 dissimilarity matrices)
 - preprocessed/word_order.csv      (the 90 words, Chinese)
+- preprocessed/participant_info.csv (participant_id, same order as all_rdms)
 - experiment.js                    (contains zh/en mapping for labels)
 
 Outputs:
-- figures/subject_map_subjXX.png   (one plot per subject)
-- figures/subject_maps_example.png (4-panel example for a few subjects)
+- figures/<participant_id>.png     (one plot per subject)
+- figures/subject_maps_4x8.png     (grid of up to 32 subjects)
+- cache/embeddings/<key>.npy       (cached 2D coordinates per RDM + MDS settings)
+- figures/maps_bundle.json,        (--format bundle: all coordinates + labels in
+  figures/maps_viewer.html          one file, drawn client-side; see map_bundle.py)
+
+Usage:
+    python analysis/plot_space.py [--rdm_file ...] [--out_dir figures] [--n_jobs 8]
+    python analysis/plot_space.py --format bundle
+
+The helpers can also be imported (e.g. from a notebook); matplotlib and
+sklearn are only imported when something is actually embedded or drawn,
+and always with the headless Agg backend.
 """
 
 import os
-import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.manifold import MDS
 
+# Category labels/colors and zh -> en translations come from the registry
+from word_registry import CATEGORY_COLORS, word_table
+import instrument
+
+# -------------------------------------------------------
+# Default paths (override on the command line)
+# -------------------------------------------------------
 RDM_FILE = "preprocessed/all_rdms.npy"
 WORD_ORDER_FILE = "preprocessed/word_order.csv"
+PARTICIPANTS_FILE = "preprocessed/participant_info.csv"
 EXPERIMENT_JS_FILE = "experiment.js"
 OUT_DIR = "figures"
 
-os.makedirs(OUT_DIR, exist_ok=True)
-
 # -------------------------------------------------------
-# Load RDMs and word list
+# Lazy matplotlib (headless)
 # -------------------------------------------------------
-all_rdms = np.load(RDM_FILE)              # shape: n_subj x 90 x 90
-n_subj, n_words, _ = all_rdms.shape
-print(f"Loaded RDMs: {all_rdms.shape}")
-
-words = pd.read_csv(WORD_ORDER_FILE, encoding="utf-8-sig")
-words = words.reset_index().rename(columns={"index": "word_index", "word": "word_zh"})
-print("Shape of all_rdms:", all_rdms.shape)
-
-
-# Load participant info; order must match all_rdms
-participants = pd.read_csv("preprocessed/participant_info.csv")
-print("Shape of participants:", participants.shape)
-
-assert participants.shape[0] == all_rdms.shape[0], "Participants vs RDM count mismatch!"
+def get_pyplot():
+    """
+    Import pyplot on first use, forcing the non-interactive Agg backend
+    so batch rendering works on servers and in worker processes.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
 
 
 # -------------------------------------------------------
-# Paths (change if needed)
+# Loading
 # -------------------------------------------------------
+def load_words(word_order_file=WORD_ORDER_FILE, experiment_js_file=EXPERIMENT_JS_FILE):
+    """
+    Word table in RDM order with columns:
+    word_index, word_zh, word_en (from experiment.js), category.
+    """
+    word_order = pd.read_csv(word_order_file, encoding="utf-8-sig")["word"]
+    words = word_table(word_order, experiment_js_file)
+    words["word_en"] = words["word_en"].fillna(words["word_zh"])
+    return words
 
 
-# -------------------------------------------------------
-# zh -> en mapping from experiment.js
-# -------------------------------------------------------
-with open(EXPERIMENT_JS_FILE, "r", encoding="utf-8") as f:
-    js = f.read()
-
-pairs = re.findall(r'\{\s*zh:\s*"([^"]+)"\s*,\s*en:\s*"([^"]+)"\s*\}', js)
-zh2en = {zh: en for zh, en in pairs}
+def load_inputs(rdm_file=RDM_FILE, participants_file=PARTICIPANTS_FILE):
+    """
+    Returns (all_rdms, participant_ids); order of participant_ids matches all_rdms.
+    """
+    all_rdms = np.load(rdm_file)              # shape: n_subj x 90 x 90
+    print(f"Loaded RDMs: {all_rdms.shape}")
 
-words["word_en"] = words["word_zh"].map(zh2en).fillna(words["word_zh"])
+    participants = pd.read_csv(participants_file)
+    print("Shape of participants:", participants.shape)
+    assert participants.shape[0] == all_rdms.shape[0], "Participants vs RDM count mismatch!"
 
-# -------------------------------------------------------
-# Category definitions (Chinese)
-# -------------------------------------------------------
-animals_zh = {
-    "蚂蚁","猫","大象","长颈鹿","熊猫","兔子","老鼠","麻雀","老虎","乌龟"
-}
-body_parts_zh = {
-    "脚踝","胳膊","耳朵","眼睛","手指","膝盖","嘴唇","鼻子","肩膀","大腿"
-}
-artifacts_zh = {
-    "空调","斧头","床","扫帚","柜子","椅子","筷子","鼠标","锤子","钥匙",
-    "微波炉","铅笔","冰箱","剪刀","沙发","勺子","桌子","电视","牙刷","洗衣机"
-}
-emotional_zh = {
-    "愤怒","反感","冷漠","慈善","舒心","死亡","债务","沮丧","疾病","纠纷",
-    "错误","兴奋","缘分","过失","恐惧","骗局","友情","快乐","天堂","敌意",
-    "爱心","魔力","婚姻","奇迹","骄傲","难过","风景","光彩","创伤","暴力"
-}
-nonemotional_zh = {
-    "协议","买卖","性质","概念","内容","数据","纪律","作用","身份","方法",
-    "义务","现象","过程","原因","关系","结果","社会","地位","制度","团队"
-}
-
-def get_category(w):
-    if w in animals_zh: return "Animal"
-    if w in body_parts_zh: return "Face/Body Part"
-    if w in artifacts_zh: return "Artifact"
-    if w in emotional_zh: return "Emotional Nonobject"
-    if w in nonemotional_zh: return "Nonemotional Nonobject"
-    return "Unknown"
-
-words["category"] = words["word_zh"].apply(get_category)
-
-CATEGORY_COLORS = {
-    "Animal": "#b2182b",
-    "Face/Body Part": "#ef8a62",
-    "Artifact": "#fddbc7",
-    "Emotional Nonobject": "#4393c3",
-    "Nonemotional Nonobject": "#2166ac",
-    "Unknown": "#999999",
-}
+    return all_rdms, participants["participant_id"].astype(str).tolist()
 
-# -------------------------------------------------------
-# Helper: embed one subject's RDM in 2D with MDS
-# -------------------------------------------------------
-def embed_subject(rdm, random_state=0):
-    """
-    Metric MDS on a single subject's 90x90 dissimilarity matrix.
-    Returns: coords (90 x 2).
-    """
-    mds = MDS(
-        n_components=2,
-        dissimilarity="precomputed",
-        random_state=random_state,
-        n_init=4,
-        max_iter=300,
-    )
-    coords = mds.fit_transform(rdm)
-    return coords
 
 # -------------------------------------------------------
 # Helper: plot one subject's space
 # -------------------------------------------------------
-def plot_subject_space(subj_idx, highlight_word_en=None, ax=None):
+def plot_subject_space(coords, words, title=None, highlight_word_en=None, ax=None):
     """
-    subj_idx: 0-based index into all_rdms
+    coords: (90 x 2) embedding of one subject, rows in words["word_index"] order
+    words: table from load_words()
     highlight_word_en: optional English word to box/highlight (e.g., "scenery")
     """
-    rdm = all_rdms[subj_idx]
-    coords = embed_subject(rdm, random_state=42)
+    plt = get_pyplot()
 
     if ax is None:
         fig, ax = plt.subplots(figsize=(6, 6))
@@ -153,14 +118,11 @@ def plot_subject_space(subj_idx, highlight_word_en=None, ax=None):
         )
 
     # Add text labels
-    for i, row in words.iterrows():
-        x, y = coords[i]
-        label = row["word_en"]
+    for (x, y), label in zip(coords, words["word_en"].values):
         ax.text(x, y, label, fontsize=7, ha="center", va="center")
 
     # Optionally highlight one word (like "scenery")
     if highlight_word_en is not None:
-        # find index of this word
         match = words[words["word_en"] == highlight_word_en]
         if len(match) == 1:
             idx = int(match["word_index"].iloc[0])
@@ -171,64 +133,154 @@ def plot_subject_space(subj_idx, highlight_word_en=None, ax=None):
 
     ax.set_xticks([])
     ax.set_yticks([])
-    pid = participants.loc[subj_idx, "participant_id"]
-    ax.set_title(f"Participant {pid}")
-
+    if title is not None:
+        ax.set_title(title)
 
     if own_fig:
-        # legend once per figure if you want
         handles = [
             plt.Line2D([0], [0], marker='o', linestyle='', color=c, label=cat)
             for cat, c in CATEGORY_COLORS.items() if cat != "Unknown"
         ]
         ax.legend(handles=handles, fontsize=8, frameon=False)
-        plt.tight_layout()
-        plt.show()
+        fig.tight_layout()
 
     return ax
 
+
 # -------------------------------------------------------
-# 1) Make a map for each subject (optional)
+# Batch rendering
 # -------------------------------------------------------
-for s in range(n_subj):
-    pid = participants.loc[s, "participant_id"]
-
+def _render_chunk(coords_chunk, pids_chunk, words, out_dir, highlight_word_en, dpi):
+    """
+    Worker: render a block of subjects into one reused figure/axes pair,
+    clearing the axes between subjects instead of building a new figure.
+    """
+    plt = get_pyplot()
     fig, ax = plt.subplots(figsize=(6, 6))
-    plot_subject_space(s, highlight_word_en="scenery", ax=ax)
-    fig.tight_layout()
-    fig.savefig(os.path.join(OUT_DIR, f"{pid}.png"), dpi=300)
+    paths = []
+    for coords, pid in zip(coords_chunk, pids_chunk):
+        ax.clear()
+        plot_subject_space(coords, words, title=f"Participant {pid}",
+                           highlight_word_en=highlight_word_en, ax=ax)
+        fig.tight_layout()
+        path = os.path.join(out_dir, f"{pid}.png")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
     plt.close(fig)
+    return paths
 
-print("Saved per-participant maps using participant_id-based filenames.")
 
+def render_subject_maps(all_coords, words, participant_ids, out_dir=OUT_DIR,
+                        highlight_word_en="scenery", dpi=300, n_jobs=None):
+    """
+    Write one <participant_id>.png per subject, rendered in a process pool.
 
-# -------------------------------------------------------
-# 2) Example figure with 4 chosen subjects (like in the paper)
-# -------------------------------------------------------
-# -------------------------------------------------------
-# 2) Big figure: 4 rows × 8 columns = 32 subjects
-# -------------------------------------------------------
-rows, cols = 4, 8
-max_panels = rows * cols
+    Subjects are split into one contiguous block per worker, so total time
+    is bounded by (n_subjects / n_workers) figure saves.
+    n_jobs: number of worker processes (None = os.cpu_count(); 1 = in-process).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, len(participant_ids)))
+
+    blocks = np.array_split(np.arange(len(participant_ids)), n_jobs)
+    blocks = [b for b in blocks if len(b) > 0]
+    args = [
+        (all_coords[b], [participant_ids[i] for i in b], words, out_dir, highlight_word_en, dpi)
+        for b in blocks
+    ]
+
+    if n_jobs == 1:
+        paths = [p for a in args for p in _render_chunk(*a)]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+            paths = [p for chunk in ex.map(_render_chunk, *zip(*args)) for p in chunk]
+
+    print(f"Saved {len(paths)} per-participant maps to {out_dir}")
+    return paths
 
-# if you have fewer than 32 participants, adjust automatically
-n_to_plot = min(n_subj, max_panels)
-subjects_to_plot = list(range(n_to_plot))   # [0, 1, 2, ..., n_to_plot-1]
 
-fig, axes = plt.subplots(rows, cols, figsize=(cols * 3, rows * 3))
-axes = axes.flatten()
+def render_grid(all_coords, words, participant_ids, out_path,
+                rows=4, cols=8, highlight_word_en="scenery", dpi=300):
+    """
+    Big figure: rows x cols subjects (first rows*cols participants).
+    """
+    plt = get_pyplot()
+    n_to_plot = min(len(participant_ids), rows * cols)
 
-for ax, s in zip(axes, subjects_to_plot):
-    plot_subject_space(s, highlight_word_en="scenery", ax=ax)
-    pid = participants.loc[s, "participant_id"]
-    ax.set_title(f"Participant {pid}", fontsize=8)
+    fig, axes = plt.subplots(rows, cols, figsize=(cols * 3, rows * 3))
+    axes = axes.flatten()
 
-# hide any unused axes (if n_subj < 32)
-for ax in axes[n_to_plot:]:
-    ax.axis("off")
+    for s, ax in enumerate(axes[:n_to_plot]):
+        plot_subject_space(all_coords[s], words, highlight_word_en=highlight_word_en, ax=ax)
+        ax.set_title(f"Participant {participant_ids[s]}", fontsize=8)
 
-plt.tight_layout()
-fig.savefig(os.path.join(OUT_DIR, "subject_maps_4x8.png"), dpi=300)
-plt.close(fig)
-print("Saved 4x8 subject map figure (up to 32 participants).")
+    # hide any unused axes (if n_subj < rows*cols)
+    for ax in axes[n_to_plot:]:
+        ax.axis("off")
 
+    fig.tight_layout()
+    fig.savefig(out_path, dpi=dpi)
+    plt.close(fig)
+    print(f"Saved {rows}x{cols} subject map figure ({n_to_plot} participants) to {out_path}")
+    return out_path
+
+
+# -------------------------------------------------------
+# MAIN
+# -------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot each participant's 2D semantic map.")
+    parser.add_argument('--rdm_file', type=str, default=RDM_FILE)
+    parser.add_argument('--word_order_file', type=str, default=WORD_ORDER_FILE)
+    parser.add_argument('--participants_file', type=str, default=PARTICIPANTS_FILE)
+    parser.add_argument('--experiment_js', type=str, default=EXPERIMENT_JS_FILE)
+    parser.add_argument('--out_dir', type=str, default=OUT_DIR)
+    parser.add_argument('--highlight', type=str, default="scenery",
+                        help="English word to highlight on every map")
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--n_jobs', type=int, default=None,
+                        help="Worker processes for embedding and rendering (default: all cores)")
+    parser.add_argument('--no_individual', action='store_true',
+                        help="Skip the per-participant PNGs")
+    parser.add_argument('--no_grid', action='store_true',
+                        help="Skip the 4x8 grid figure")
+    parser.add_argument('--format', type=str, choices=["png", "bundle", "both"], default="png",
+                        help="png: PNG figures; bundle: maps_bundle.json + maps_viewer.html; both")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from embeddings import compute_aligned_embeddings
+
+    with instrument.run_report("plot_space", args):
+        with instrument.stage("load"):
+            all_rdms, participant_ids = load_inputs(args.rdm_file, args.participants_file)
+            words = load_words(args.word_order_file, args.experiment_js)
+
+        # Embed every subject once (parallel, cached); both figure types reuse it.
+        # Maps are Procrustes-aligned to the group-mean map so they can be
+        # compared by eye (e.g. where "scenery" lands).
+        with instrument.stage("embed", participants=len(participant_ids)):
+            all_coords, group_coords = compute_aligned_embeddings(all_rdms, n_jobs=args.n_jobs or -1)
+
+        os.makedirs(args.out_dir, exist_ok=True)
+        if args.format in ("bundle", "both"):
+            from map_bundle import export_bundle
+            with instrument.stage("bundle", maps=len(participant_ids)):
+                export_bundle(all_coords, words, participant_ids, CATEGORY_COLORS, args.out_dir,
+                              group_coords=group_coords, highlight_word_en=args.highlight)
+            if args.format == "bundle":
+                return
+
+        if not args.no_individual:
+            with instrument.stage("render_maps", maps=len(participant_ids)):
+                render_subject_maps(all_coords, words, participant_ids, args.out_dir,
+                                    highlight_word_en=args.highlight, dpi=args.dpi, n_jobs=args.n_jobs)
+        if not args.no_grid:
+            with instrument.stage("render_grid", maps=len(participant_ids)):
+                render_grid(all_coords, words, participant_ids,
+                            os.path.join(args.out_dir, "subject_maps_4x8.png"),
+                            highlight_word_en=args.highlight, dpi=args.dpi)
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@
 """
 Clean jsPsych circle-arrangement CSVs for ISC analysis.
 
-For each CSV in ./data:
+For each CSV in ./data (--data_dir):
 - Read with UTF-8 (keeping Chinese correctly)
 - Keep only trials with placements (arrangement trials)
 - Infer the TRUE category by matching word sets:
@@ -14,14 +14,21 @@ For each CSV in ./data:
 - Drop duplicate rows per participant × inferred_category
   (fixes the "extra last row" problem)
 - Keep only relevant columns
-- Write cleaned_<original>.csv to ./cleaned
+- Write cleaned_<original>.csv to ./cleaned (--output_dir)
 """
 
 import os
+import re
 import glob
 import json
+import argparse
 import pandas as pd
 
+import instrument
+
+# Category word lists and trial signatures live in the shared registry
+from word_registry import classify_trial
+
 # -------- CONFIG --------
 DATA_DIR = "data"
 OUTPUT_DIR = "cleaned"
@@ -36,28 +43,11 @@ KEEP_COLS = [
     "distance_matrix",
 ]
 
-# -------- CATEGORY WORD SETS (from your experiment.js, zh only) --------
-animals_zh = {
-    "蚂蚁","猫","大象","长颈鹿","熊猫","兔子","老鼠","麻雀","老虎","乌龟"
-}
-body_parts_zh = {
-    "脚踝","胳膊","耳朵","眼睛","手指","膝盖","嘴唇","鼻子","肩膀","大腿"
-}
-artifacts_zh = {
-    "空调","斧头","床","扫帚","柜子","椅子","筷子","鼠标","锤子","钥匙",
-    "微波炉","铅笔","冰箱","剪刀","沙发","勺子","桌子","电视","牙刷","洗衣机"
-}
-emotional_zh = {
-    "愤怒","反感","冷漠","慈善","舒心","死亡","债务","沮丧","疾病","纠纷",
-    "错误","兴奋","缘分","过失","恐惧","骗局","友情","快乐","天堂","敌意",
-    "爱心","魔力","婚姻","奇迹","骄傲","难过","风景","光彩","创伤","暴力"
-}
-nonemotional_zh = {
-    "协议","买卖","性质","概念","内容","数据","纪律","作用","身份","方法",
-    "义务","现象","过程","原因","关系","结果","社会","地位","制度","团队"
-}
-
-all_words_zh = animals_zh | body_parts_zh | artifacts_zh | emotional_zh | nonemotional_zh
+
+# "word":"..." fields inside a placements JSON blob
+PLACEMENT_WORD_RE = re.compile(r'"word"\s*:\s*"((?:[^"\\]|\\.)*)"')
+# "},{" between consecutive placement objects
+PLACEMENT_SEP_RE = re.compile(r'\}\s*,\s*\{')
 
 
 def infer_category_from_words(words):
@@ -67,26 +57,58 @@ def infer_category_from_words(words):
         "all_words", "animals", "body_parts", "artifacts",
         "emotional_nonobject", "nonemotional_nonobject",
         or "unknown_<n>" if not matched.
+
+    One dict lookup on the sorted word-id signature (see word_registry.TRIAL_TYPES).
+    """
+    return classify_trial(words)[0]
+
+
+def extract_placement_words(placements_json):
+    """
+    Pull only the "word" fields out of a placements JSON array, without
+    decoding the per-word x/y/angle dicts. Returns None if the value is
+    not a well-formed placements array.
+
+    The regex scan is only trusted on a complete, flat array (closed with
+    "]", one {...} object per "word" field, "," between objects); anything
+    else, e.g. a truncated export, goes through json.loads, which rejects
+    it.
+    """
+    if not isinstance(placements_json, str):
+        return None
+    text = placements_json.strip()
+    if not text.startswith("["):
+        return None
+    words = PLACEMENT_WORD_RE.findall(text)
+    well_formed = (words and text.endswith("]")
+                   and text.count("{") == text.count("}") == len(words)
+                   and len(PLACEMENT_SEP_RE.findall(text)) == len(words) - 1)
+    if not well_formed:
+        try:
+            placements = json.loads(text)
+            words = [p["word"] for p in placements]
+        except (ValueError, TypeError, KeyError):
+            return None
+        return words if words and all(isinstance(w, str) for w in words) else None
+    # Only escaped words (e.g. \uXXXX) need a real JSON decode
+    return [json.loads(f'"{w}"') if "\\" in w else w for w in words]
+
+
+def classify_arrangement(placements_json):
+    """
+    (trial_category, n_unique_words) of one arrangement trial's placements
+    JSON, as clean_file infers it; ("parse_error", None) if the placements
+    cannot be read. Invalid trials are those whose category is
+    "parse_error" or "unknown_<n>" (see is_valid_category).
     """
-    s = set(words)
-    n = len(s)
-
-    if n == 90 and s == all_words_zh:
-        return "all_words"
-    if n == 10:
-        if s == animals_zh:
-            return "animals"
-        if s == body_parts_zh:
-            return "body_parts"
-    if n == 20:
-        if s == artifacts_zh:
-            return "artifacts"
-        if s == nonemotional_zh:
-            return "nonemotional_nonobject"
-    if n == 30 and s == emotional_zh:
-        return "emotional_nonobject"
-
-    return f"unknown_{n}"
+    words = extract_placement_words(placements_json)
+    if words is None:
+        return "parse_error", None
+    return classify_trial(words)
+
+
+def is_valid_category(category):
+    return category != "parse_error" and not category.startswith("unknown_")
 
 
 def extract_metadata(df):
@@ -151,7 +173,7 @@ def clean_file(path):
     total_time_sec, mandarin_proficiency, age, gender = extract_metadata(df)
 
     if "placements" not in df.columns:
-        print("  WARNING: no 'placements' column; skipping.")
+        instrument.warn("no_placements_column", "  WARNING: no 'placements' column; skipping.")
         return None
 
     # Keep only rows with placements (arrangement trials)
@@ -159,7 +181,7 @@ def clean_file(path):
     print(f"  Found {len(df_arr)} arrangement rows (with placements).")
 
     if df_arr.empty:
-        print("  No usable arrangement rows; skipping file.")
+        instrument.warn("no_arrangement_rows", "  No usable arrangement rows; skipping file.")
         return None
 
     # Sort by trial_index if present (so we keep first occurrence later)
@@ -170,39 +192,31 @@ def clean_file(path):
     inferred_categories = []
     inferred_n_words = []
 
-    for i, row in df_arr.iterrows():
-        try:
-            placements = json.loads(row["placements"])
-        except Exception as e:
-            print(f"  WARNING: could not parse placements in row {i}: {e}")
-            inferred_categories.append("parse_error")
-            inferred_n_words.append(None)
-            continue
-
-        words = [p["word"] for p in placements]
-        cat = infer_category_from_words(words)
+    for i, placements_json in zip(df_arr.index, df_arr["placements"]):
+        cat, n_unique = classify_arrangement(placements_json)
+        if cat == "parse_error":
+            instrument.warn("placements_parse_error", f"  WARNING: could not parse placements in row {i}")
         inferred_categories.append(cat)
-        inferred_n_words.append(len(set(words)))
+        inferred_n_words.append(n_unique)
 
     df_arr["trial_category"] = inferred_categories  # overwrite old labels
     df_arr["n_words"] = inferred_n_words           # ensure consistent count
 
     # Drop any rows where category inference failed (unknown or parse_error)
     before = len(df_arr)
-    df_arr = df_arr[~df_arr["trial_category"].str.startswith("unknown_")]
-    df_arr = df_arr[df_arr["trial_category"] != "parse_error"]
+    df_arr = df_arr[df_arr["trial_category"].map(is_valid_category)]
     after = len(df_arr)
     if after < before:
         print(f"  Dropped {before - after} rows with unknown/invalid categories.")
 
     if df_arr.empty:
-        print("  All arrangement rows were invalid; skipping file.")
+        instrument.warn("all_rows_invalid", "  All arrangement rows were invalid; skipping file.")
         return None
 
     # Now drop duplicates: one row per participant × trial_category
     # (this removes the extra duplicated last row you saw)
     if "participant_number" not in df_arr.columns:
-        print("  WARNING: no 'participant_number' column; skipping file.")
+        instrument.warn("no_participant_number", "  WARNING: no 'participant_number' column; skipping file.")
         return None
 
     before = len(df_arr)
@@ -231,23 +245,31 @@ def clean_file(path):
     return df_arr
 
 
-def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean raw jsPsych arrangement CSVs.")
+    parser.add_argument('--data_dir', type=str, default=DATA_DIR)
+    parser.add_argument('--output_dir', type=str, default=OUTPUT_DIR)
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
 
-    files = glob.glob(os.path.join(DATA_DIR, "*.csv"))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    files = glob.glob(os.path.join(args.data_dir, "*.csv"))
     if not files:
-        print(f"No CSV files found in {DATA_DIR}/")
+        print(f"No CSV files found in {args.data_dir}/")
         return
 
-    for fpath in files:
-        cleaned = clean_file(fpath)
-        if cleaned is None:
-            continue
+    with instrument.run_report("preprocessing", args), instrument.stage("clean", files=len(files)):
+        for fpath in files:
+            cleaned = clean_file(fpath)
+            if cleaned is None:
+                continue
 
-        base = os.path.basename(fpath)
-        out_path = os.path.join(OUTPUT_DIR, f"cleaned_{base}")
-        cleaned.to_csv(out_path, index=False, encoding="utf-8-sig")
-        print(f"  Saved cleaned file → {out_path}")
+            base = os.path.basename(fpath)
+            out_path = os.path.join(args.output_dir, f"cleaned_{base}")
+            cleaned.to_csv(out_path, index=False, encoding="utf-8-sig")
+            instrument.count(cleaned_files=1, rows=len(cleaned))
+            print(f"  Saved cleaned file → {out_path}")
 
 
 if __name__ == "__main__":
@@ -25,30 +25,73 @@ Preprocessing for Multiarrangement Data (Behavioral Only)
     * <output_folder>/all_rdms.npy          (shape: n_subj x 90 x 90)
     * <output_folder>/participant_info.csv  (participant_id)
     * <output_folder>/word_order.csv        (word, length = 90)
-    * optional: dismx_<id>.mat files with vectorized RDMs
+    * optional: dismx_<id>.mat files with vectorized RDMs (--mat_export;
+      written in parallel, unchanged participants skipped via
+      dismx_manifest.json), or one consolidated rdms_all.mat
+
+- Large-vocabulary designs (--n_words, --vocabulary):
+    * Pair distances are accumulated sparsely (observed pairs only), so
+      per-participant memory scales with the pairs a participant saw,
+      not with n_words^2
+    * --output condensed writes all_rdms_condensed.npy (n_subj x n_pairs);
+      --output sparse writes all_pairs_sparse.npz (observed pairs only,
+      no filling); a dense all_rdms.npy is only built for --output dense
+
+- Trial combination (--weighting):
+    * equal (default): plain average over trials where a pair co-occurs
+    * mean_sq: trials weighted by mean(dissim)^2
+    * inverse_mds: each trial's scale is iteratively fitted to the current
+      RDM estimate (Kriegeskorte & Mur), batched over all participants;
+      iterations and final change are saved to inverse_mds_convergence.csv
+
+- Sweep mode: several --weighting and/or --z_threshold values. Trials are
+  read and decoded once, each weighting is combined from the same arrays
+  and every threshold is applied to the same MPD vector; one output set
+  per configuration goes to <output_folder>/<weighting>_z<threshold>/,
+  with sweep_summary.csv listing exclusions per configuration
+
+- Missing pairs (never co-occurred in any trial):
+    * --completion mean (default): participant's mean distance
+    * --completion lowrank: imputed from the participant's own observed
+      distances with an MDS-based low-rank model (rdm_completion.py)
+    * observed_mask.npy is saved next to the RDMs (True = observed pair),
+      same shape as all_rdms.npy / all_rdms_condensed.npy
 
 Usage:
     python preprocessing_multiarrangement.py <data_folder> [output_folder]
+        [--n_words 90] [--vocabulary words.csv] [--output dense|condensed|sparse]
+        [--weighting equal|mean_sq|inverse_mds ...] [--tol 1e-6]
+        [--z_threshold 3.0 ...] [--mat_export per_participant|consolidated|both|none]
+        [--completion mean|lowrank] [--rank 5] [--report run.json] [--profile]
 
 Example:
     python preprocessing_multiarrangement.py cleaned preprocessed
 """
 
 import os
-import sys
 import glob
 import json
+import argparse
+from functools import lru_cache
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from scipy.spatial.distance import squareform
 from tqdm import tqdm
 
+import instrument
+from rdm_stats import RDMAccumulator
+
 # ---------------------------------------------------------------------
 # CONFIG
 # ---------------------------------------------------------------------
 
-N_WORDS = 90                     # Total number of words in full set
+N_WORDS = 90                     # Default number of words in full set (--n_words)
+WEIGHTINGS = ["equal", "mean_sq", "inverse_mds"]   # --weighting choices
+MAT_KEY = "estimate_dissimMat_ltv"     # MATLAB variable name (original analysis code)
+MAT_MANIFEST = "dismx_manifest.json"   # content hashes for incremental .mat export
+CONSOLIDATED_MAT = "rdms_all.mat"
 JSON_COLUMN_NAME = "dissimilarity_vector"
 ENCODING = "utf-8-sig"           # Keep Chinese characters intact
 
@@ -58,27 +101,11 @@ ENCODING = "utf-8-sig"           # Keep Chinese characters intact
 # ---------------------------------------------------------------------
 
 
-def load_and_combine_multiarrangement_trials(data_folder, equal_weights=True):
+def iter_participant_rows(data_folder):
     """
-    Loads all participant CSV files and combines full + subset trials into
-    one RDM per participant.
-
-    Parameters
-    ----------
-    data_folder : str
-        Folder containing participant CSV files (e.g. cleaned_*.csv)
-    equal_weights : bool
-        If True, use equal weights for all trials (simple averaging).
-        If False, weight trials by mean(dissim)^2.
-
-    Returns
-    -------
-    all_rdms : np.ndarray
-        Array of shape (n_participants, N_WORDS, N_WORDS).
-    participant_ids : list of str
-        List of participant IDs, same order as all_rdms.
-    master_words : list of str
-        The word order corresponding to RDM rows/columns (length N_WORDS).
+    Yields (participant_id, data_rows, csv_name) for each cleaned_*.csv in
+    data_folder, reading one CSV at a time; data_rows are the arrangement
+    trials (rows with a dissimilarity vector).
     """
     # Load only cleaned_*.csv from top folder
     csv_files = [
@@ -91,165 +118,523 @@ def load_and_combine_multiarrangement_trials(data_folder, equal_weights=True):
 
     print(f"Found {len(csv_files)} cleaned CSV files. Processing...")
 
-    all_rdms = []
-    participant_ids = []
-    all_wordlists = []
-
     for csv_file in tqdm(csv_files, desc="Processing participants"):
         df = pd.read_csv(csv_file, encoding=ENCODING)
 
         # Keep only rows that have dissimilarity data (arrangement trials)
         if JSON_COLUMN_NAME not in df.columns:
-            print(f"  Warning: {os.path.basename(csv_file)} missing '{JSON_COLUMN_NAME}', skipping.")
+            instrument.warn("missing_dissimilarity_column",
+                            f"  Warning: {os.path.basename(csv_file)} missing '{JSON_COLUMN_NAME}', skipping.")
             continue
 
         data_rows = df[df[JSON_COLUMN_NAME].notna()].copy()
 
         if len(data_rows) == 0:
-            print(f"  Warning: No arrangement data in {os.path.basename(csv_file)}")
+            instrument.warn("no_arrangement_data",
+                            f"  Warning: No arrangement data in {os.path.basename(csv_file)}")
             continue
 
         if "participant_number" not in data_rows.columns:
-            print(f"  Warning: 'participant_number' missing in {os.path.basename(csv_file)}, skipping.")
+            instrument.warn("missing_participant_number",
+                            f"  Warning: 'participant_number' missing in {os.path.basename(csv_file)}, skipping.")
             continue
 
         participant_id = str(data_rows["participant_number"].iloc[0])
+        yield participant_id, data_rows, os.path.basename(csv_file)
+
 
+def iter_participant_rdms(data_folder, equal_weights=True, n_words=N_WORDS,
+                          master_word_list=None, dense=True):
+    """
+    Yields one combined RDM per participant, reading one CSV at a time.
+
+    Parameters
+    ----------
+    data_folder : str
+        Folder containing participant CSV files (e.g. cleaned_*.csv)
+    equal_weights, n_words, master_word_list, dense :
+        Passed to combine_trials_for_participant.
+
+    Yields
+    ------
+    participant_id : str
+    rdm : np.ndarray or scipy.sparse.csr_matrix
+        (n_words, n_words) combined RDM (dense), or the observed pairs
+        (upper triangle) when dense=False.
+    wordlist : list of str
+        Word order of rdm rows/columns.
+    """
+    for participant_id, data_rows, csv_name in iter_participant_rows(data_folder):
         try:
-            rdm, wordlist = combine_trials_for_participant(data_rows, equal_weights=equal_weights)
+            rdm, wordlist = combine_trials_for_participant(
+                data_rows,
+                equal_weights=equal_weights,
+                n_words=n_words,
+                master_word_list=master_word_list,
+                dense=dense,
+            )
         except Exception as e:
-            print(f"  Error processing {participant_id} in {os.path.basename(csv_file)}: {e}")
+            instrument.warn("participant_error", f"  Error processing {participant_id} in {csv_name}: {e}")
             continue
 
-        all_rdms.append(rdm)
-        participant_ids.append(participant_id)
-        all_wordlists.append(wordlist)
+        yield participant_id, rdm, wordlist
 
-    if len(all_rdms) == 0:
-        raise ValueError("No participants were successfully processed.")
 
-    # --- Verify that the word order is identical across participants ---
+def check_word_order(all_wordlists, participant_ids, n_words):
+    """Raises unless every participant has the same word order; returns it."""
     print("\nChecking consistency of word order across participants...")
     first = all_wordlists[0]
     for i, wl in enumerate(all_wordlists[1:], start=1):
         if wl != first:
             raise ValueError(
                 f"Word order mismatch for participant {participant_ids[i]}. "
-                "All participants must share the same 90-word order."
+                f"All participants must share the same {n_words}-word order."
             )
-    master_words = first
     print("Word order is consistent across all participants.")
+    return first
+
+
+def load_and_combine_multiarrangement_trials(data_folder, equal_weights=True, n_words=N_WORDS,
+                                             master_word_list=None, dense=True):
+    """
+    Loads all participant CSV files and combines full + subset trials into
+    one RDM per participant.
+
+    Parameters
+    ----------
+    data_folder : str
+        Folder containing participant CSV files (e.g. cleaned_*.csv)
+    equal_weights : bool
+        If True, use equal weights for all trials (simple averaging).
+        If False, weight trials by mean(dissim)^2.
+    n_words : int
+        Vocabulary size.
+    master_word_list : list of str or None
+        Fixed word order (e.g. from --vocabulary); None = take it from each
+        participant's full trial.
+    dense : bool
+        If False, return sparse (observed-pairs) RDMs, see
+        combine_trials_for_participant.
+
+    Returns
+    -------
+    all_rdms : np.ndarray or list of scipy.sparse.csr_matrix
+        Array of shape (n_participants, N_WORDS, N_WORDS), or one sparse
+        upper-triangular matrix per participant when dense=False.
+    participant_ids : list of str
+        List of participant IDs, same order as all_rdms.
+    master_words : list of str
+        The word order corresponding to RDM rows/columns (length N_WORDS).
+    """
+    all_rdms = []
+    participant_ids = []
+    all_wordlists = []
+
+    for participant_id, rdm, wordlist in iter_participant_rdms(
+        data_folder, equal_weights, n_words, master_word_list, dense
+    ):
+        all_rdms.append(rdm)
+        participant_ids.append(participant_id)
+        all_wordlists.append(wordlist)
+
+    if len(all_rdms) == 0:
+        raise ValueError("No participants were successfully processed.")
+
+    # --- Verify that the word order is identical across participants ---
+    master_words = check_word_order(all_wordlists, participant_ids, n_words)
 
     print(f"\nSuccessfully processed {len(all_rdms)} participants.")
+    if not dense:
+        return all_rdms, participant_ids, master_words
     return np.array(all_rdms), participant_ids, master_words
 
 
-def combine_trials_for_participant(data_rows, equal_weights=True):
+def load_participant_trials(data_folder, n_words=N_WORDS, master_word_list=None):
     """
-    Combines full + subset trials for a single participant into one 90x90 RDM.
+    Reads and decodes every participant's trials once (collect_trial_pairs),
+    so several weighting schemes can be combined from the same arrays.
+
+    Returns
+    -------
+    trials : list of tuple
+        (keys, dists, trial, trial_means) per participant.
+    participant_ids : list of str
+    master_words : list of str
+    """
+    trials, participant_ids, all_wordlists = [], [], []
+
+    for participant_id, data_rows, csv_name in iter_participant_rows(data_folder):
+        try:
+            keys, d, t, trial_means, wordlist = collect_trial_pairs(
+                data_rows, n_words, master_word_list
+            )
+        except Exception as e:
+            instrument.warn("participant_error", f"  Error processing {participant_id} in {csv_name}: {e}")
+            continue
+        trials.append((keys, d, t, trial_means))
+        instrument.count(participants=1, trials=len(trial_means), observations=len(d))
+        participant_ids.append(participant_id)
+        all_wordlists.append(wordlist)
+
+    if len(trials) == 0:
+        raise ValueError("No participants were successfully processed.")
+
+    master_words = check_word_order(all_wordlists, participant_ids, n_words)
+    print(f"\nSuccessfully processed {len(trials)} participants.")
+    return trials, participant_ids, master_words
+
+
+def combine_collected(trials, n_words=N_WORDS, weighting="equal", tol=None, max_iter=None):
+    """
+    Observed-pair RDMs from load_participant_trials output.
 
     Parameters
     ----------
-    data_rows : pd.DataFrame
-        Rows containing trial data for one participant.
-    equal_weights : bool
-        If True, all trials get weight=1.0.
-        If False, weight = (mean(dissim_vec))^2 per trial.
+    trials : list of tuple
+        (keys, dists, trial, trial_means) per participant.
+    weighting : str
+        "equal", "mean_sq" (mean(dissim)^2 trial weights) or "inverse_mds"
+        (iterative trial scaling, all participants in one batch).
+    tol, max_iter :
+        Convergence settings for inverse_mds (None = inverse_mds defaults).
+
+    Returns
+    -------
+    pair_rdms : list of scipy.sparse.csr_matrix
+        Observed pairs (upper triangle) per participant, as with dense=False.
+    convergence : pd.DataFrame or None
+        For inverse_mds: n_trials, n_iter, converged, final_change, tol per
+        participant (same order as trials).
+    """
+    if weighting != "inverse_mds":
+        pair_rdms = [
+            average_trial_pairs(keys, d, t, trial_means, n_words,
+                                equal_weights=(weighting == "equal"))
+            for keys, d, t, trial_means in trials
+        ]
+        return pair_rdms, None
+
+    from inverse_mds import TOL, MAX_ITER, inverse_mds_combine
+
+    tol = TOL if tol is None else tol
+    max_iter = MAX_ITER if max_iter is None else max_iter
+
+    group, trial, dists, trial_owner, cells = [], [], [], [], []
+    n_groups = n_trials = 0
+    for p, (keys, d, t, trial_means) in enumerate(trials):
+        uniq, inv = np.unique(keys, return_inverse=True)
+        group.append(inv + n_groups)
+        trial.append(t + n_trials)
+        dists.append(d)
+        trial_owner.append(np.full(len(trial_means), p))
+        cells.append(uniq)
+        n_groups += len(uniq)
+        n_trials += len(trial_means)
+
+    trial_owner = np.concatenate(trial_owner)
+    values, n_iter, change = inverse_mds_combine(
+        np.concatenate(group), np.concatenate(trial), trial_owner, np.concatenate(dists),
+        tol=tol, max_iter=max_iter,
+    )
+
+    pair_rdms = []
+    offsets = np.cumsum([0] + [len(c) for c in cells])
+    for p, keys in enumerate(cells):
+        vals = values[offsets[p]:offsets[p + 1]]
+        pair_rdms.append(sparse.csr_matrix(
+            (vals, (keys // n_words, keys % n_words)), shape=(n_words, n_words)
+        ))
+
+    convergence = pd.DataFrame({
+        "n_trials": np.bincount(trial_owner, minlength=len(trials)),
+        "n_iter": n_iter,
+        "converged": change <= tol,
+        "final_change": change,
+        "tol": tol,
+    })
+    print(f"\nInverse MDS: {int(convergence['converged'].sum())}/{len(convergence)} participants "
+          f"converged (max {int(n_iter.max())} iterations)")
+    return pair_rdms, convergence
+
+
+def load_inverse_mds_trials(data_folder, n_words=N_WORDS, master_word_list=None,
+                            tol=None, max_iter=None):
+    """
+    Combines each participant's trials by iterative inverse-MDS scaling
+    (see inverse_mds.py), all participants solved in one batch.
 
     Returns
     -------
-    final_rdm : np.ndarray
-        90x90 dissimilarity matrix averaged across all trials.
+    pair_rdms : list of scipy.sparse.csr_matrix
+        Observed pairs (upper triangle) per participant, as with dense=False.
+    participant_ids : list of str
+    master_words : list of str
+    convergence : pd.DataFrame
+        participant_id, n_trials, n_iter, converged, final_change, tol.
+    """
+    trials, participant_ids, master_words = load_participant_trials(
+        data_folder, n_words, master_word_list
+    )
+    pair_rdms, convergence = combine_collected(trials, n_words, "inverse_mds", tol, max_iter)
+    convergence.insert(0, "participant_id", participant_ids)
+    return pair_rdms, participant_ids, master_words, convergence
+
+
+@lru_cache(maxsize=None)
+def _triu(k):
+    """Row/col indices of a k-word trial's condensed dissimilarity vector."""
+    return np.triu_indices(k, k=1)
+
+
+def collect_trial_pairs(data_rows, n_words=N_WORDS, master_word_list=None):
+    """
+    Every (pair, distance) observation of one participant, all trials
+    concatenated.
+
+    Parameters
+    ----------
+    data_rows, n_words, master_word_list :
+        See combine_trials_for_participant.
+
+    Returns
+    -------
+    keys : np.ndarray of int64
+        Pair key lo * n_words + hi (lo < hi, master indices) per observation.
+    dists : np.ndarray
+        The trial's dissimilarity for that pair.
+    trial : np.ndarray of int
+        Trial number (0..n_trials-1) of each observation.
+    trial_means : np.ndarray
+        mean(dissimilarity_vector) of each kept trial (all its pairs).
     master_word_list : list of str
-        Word order used for this participant's RDM (length N_WORDS).
+        Word order used (length n_words).
     """
-    # --- Step 1: Get master word list from the full trial (90 words) ---
-    full_trial = data_rows[data_rows["n_words"] == N_WORDS]
+    # --- Master word list: given, or from the full trial ---
+    if master_word_list is None:
+        full_trial = data_rows[data_rows["n_words"] == n_words]
 
-    if len(full_trial) == 0:
-        raise ValueError(f"No full trial ({N_WORDS} words) found for this participant")
+        if len(full_trial) == 0:
+            raise ValueError(f"No full trial ({n_words} words) found for this participant")
 
-    if len(full_trial) > 1:
-        print("  Warning: Multiple full trials found, using the first one.")
-        full_trial = full_trial.iloc[:1]
+        if len(full_trial) > 1:
+            instrument.warn("multiple_full_trials",
+                            "  Warning: Multiple full trials found, using the first one.")
+            full_trial = full_trial.iloc[:1]
 
-    placements_json = full_trial["placements"].iloc[0]
-    placements = json.loads(placements_json)
-    master_word_list = [p["word"] for p in placements]
+        placements_json = full_trial["placements"].iloc[0]
+        placements = json.loads(placements_json)
+        master_word_list = [p["word"] for p in placements]
 
-    if len(master_word_list) != N_WORDS:
+    if len(master_word_list) != n_words:
         raise ValueError(
-            f"Master word list has {len(master_word_list)} words, expected {N_WORDS}"
+            f"Master word list has {len(master_word_list)} words, expected {n_words}"
         )
 
     word_to_idx = {w: i for i, w in enumerate(master_word_list)}
 
-    # --- Initialize accumulation matrices ---
-    sum_matrix = np.zeros((N_WORDS, N_WORDS), dtype=float)
-    count_matrix = np.zeros((N_WORDS, N_WORDS), dtype=float)
+    # --- (pair, distance) per trial ---
+    pair_keys, pair_dists, pair_trial, trial_means = [], [], [], []
 
-    # --- Step 2: Process each trial (full + subsets) ---
     for _, row in data_rows.iterrows():
-        n_words = int(row["n_words"])
+        trial_n = int(row["n_words"])
 
         # Words in this trial
         placements = json.loads(row["placements"])
         trial_words = [p["word"] for p in placements]
 
-        # Dissimilarity vector for this trial
-        dissim_vec = json.loads(row[JSON_COLUMN_NAME])
+        # Dissimilarity vector for this trial (condensed, i < j order)
+        dissim_vec = np.asarray(json.loads(row[JSON_COLUMN_NAME]), dtype=float)
 
-        expected_len = n_words * (n_words - 1) // 2
+        expected_len = trial_n * (trial_n - 1) // 2
         if len(dissim_vec) != expected_len:
-            print(
-                f"  Warning: Trial with {n_words} words has vector length "
+            instrument.warn(
+                "bad_vector_length",
+                f"  Warning: Trial with {trial_n} words has vector length "
                 f"{len(dissim_vec)}, expected {expected_len}. Skipping trial."
             )
             continue
 
-        trial_matrix = squareform(dissim_vec)
-
-        # Determine weight for this trial
-        if equal_weights:
-            weight = 1.0
+        # Map trial positions to master indices, all pairs at once
+        idx = np.array([word_to_idx.get(w, -1) for w in trial_words])
+        ti, tj = _triu(trial_n)
+        mi, mj = idx[ti], idx[tj]
+
+        ok = (mi >= 0) & (mj >= 0) & (mi != mj)
+        if not ok.all():
+            unknown = sorted({w for w in trial_words if w not in word_to_idx})
+            if unknown:
+                instrument.warn("unknown_words",
+                                f"  Warning: Words {unknown} not in master list; "
+                                f"skipping {int((~ok).sum())} pairs.")
+            mi, mj, d = mi[ok], mj[ok], dissim_vec[ok]
         else:
-            # Kriegeskorte & Mur style: larger distances → more evidence
-            weight = (np.mean(dissim_vec) ** 2) if len(dissim_vec) > 0 else 0.0
-            if weight <= 0:
-                weight = 1.0
-
-        # Map trial distances into the full 90x90 matrix
-        for i in range(n_words):
-            for j in range(i + 1, n_words):
-                w_i = trial_words[i]
-                w_j = trial_words[j]
-
-                try:
-                    mi = word_to_idx[w_i]
-                    mj = word_to_idx[w_j]
-                except KeyError as e:
-                    print(f"  Warning: Word {e} not in master list; skipping pair.")
-                    continue
-
-                d = trial_matrix[i, j]
-                sum_matrix[mi, mj] += weight * d
-                sum_matrix[mj, mi] += weight * d
-                count_matrix[mi, mj] += weight
-                count_matrix[mj, mi] += weight
-
-    # --- Step 3: Compute weighted average RDM ---
-    with np.errstate(divide="ignore", invalid="ignore"):
-        final_rdm = sum_matrix / count_matrix
+            d = dissim_vec
+
+        lo, hi = np.minimum(mi, mj), np.maximum(mi, mj)
+        pair_keys.append(lo.astype(np.int64) * n_words + hi)
+        pair_dists.append(d)
+        pair_trial.append(np.full(len(d), len(trial_means)))
+        trial_means.append(np.mean(dissim_vec) if len(dissim_vec) > 0 else 0.0)
+
+    if not pair_keys:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=int),
+                np.zeros(0), master_word_list)
+    return (np.concatenate(pair_keys), np.concatenate(pair_dists),
+            np.concatenate(pair_trial), np.array(trial_means), master_word_list)
+
+
+def combine_trials_for_participant(data_rows, equal_weights=True, n_words=N_WORDS,
+                                   master_word_list=None, dense=True):
+    """
+    Combines full + subset trials for a single participant into one RDM.
+
+    Pairs are accumulated sparsely: each trial contributes only the pairs
+    it contains, and the weighted average is formed per observed pair.
+
+    Parameters
+    ----------
+    data_rows : pd.DataFrame
+        Rows containing trial data for one participant.
+    equal_weights : bool
+        If True, all trials get weight=1.0.
+        If False, weight = (mean(dissim_vec))^2 per trial.
+    n_words : int
+        Vocabulary size (N_WORDS by default).
+    master_word_list : list of str or None
+        Word order for rows/columns. If None, it is taken from the
+        participant's full trial (a trial with n_words words).
+    dense : bool
+        If True, return the filled n_words x n_words matrix (pairs that
+        never co-occurred get the mean of observed distances). If False,
+        return a scipy.sparse.csr_matrix holding only the observed pairs
+        (upper triangle, i < j), nothing filled.
+
+    Returns
+    -------
+    final_rdm : np.ndarray or scipy.sparse.csr_matrix
+        n_words x n_words dissimilarity matrix averaged across all trials.
+    master_word_list : list of str
+        Word order used for this participant's RDM (length n_words).
+    """
+    # --- Step 1-2: Master word list and (pair, distance) per trial ---
+    keys, dists, trial, trial_means, master_word_list = collect_trial_pairs(
+        data_rows, n_words, master_word_list
+    )
+
+    # --- Step 3: Weighted average per observed pair ---
+    pair_rdm = average_trial_pairs(keys, dists, trial, trial_means, n_words, equal_weights)
+
+    if not dense:
+        return pair_rdm, master_word_list
+
+    return pairs_to_dense(pair_rdm), master_word_list
+
+
+def average_trial_pairs(keys, dists, trial, trial_means, n_words=N_WORDS, equal_weights=True):
+    """
+    Weighted average per observed pair of collect_trial_pairs output, as a
+    sparse upper-triangular (n_words, n_words) matrix.
+    equal_weights=False weights each trial by mean(dissim)^2.
+    """
+    # Determine weight for each trial
+    if equal_weights:
+        trial_weights = np.ones(len(trial_means))
+    else:
+        # Kriegeskorte & Mur style: larger distances → more evidence
+        trial_weights = trial_means ** 2
+        trial_weights[trial_weights <= 0] = 1.0
+    obs_weights = trial_weights[trial]
+
+    keys, inv = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inv, weights=obs_weights * dists, minlength=len(keys))
+    weights = np.bincount(inv, weights=obs_weights, minlength=len(keys))
+
+    return sparse.csr_matrix(
+        (sums / weights, (keys // n_words, keys % n_words)), shape=(n_words, n_words)
+    )
+
+
+def pairs_to_dense(pair_rdm, fill="mean"):
+    """
+    Observed-pairs matrix (upper triangle) -> symmetric dense RDM.
+
+    Diagonal is 0. Unobserved pairs are NaN if fill is None, otherwise
+    the mean of the matrix (observed pairs + zero diagonal, as the
+    original dense averaging did).
+    """
+    coo = pair_rdm.tocoo()
+    n = pair_rdm.shape[0]
+    final_rdm = np.full((n, n), np.nan)
+    final_rdm[coo.row, coo.col] = coo.data
+    final_rdm[coo.col, coo.row] = coo.data
 
     # Set diagonal to 0 (self-dissimilarity)
     np.fill_diagonal(final_rdm, 0.0)
 
     # Fill any NaNs (pairs never co-occurred) with mean of observed distances
-    if np.isnan(final_rdm).any():
+    if fill == "mean" and np.isnan(final_rdm).any():
         mean_val = np.nanmean(final_rdm)
         final_rdm = np.nan_to_num(final_rdm, nan=mean_val)
 
-    return final_rdm, master_word_list
+    return final_rdm
+
+
+def observed_mask(pair_rdm, condensed=False):
+    """
+    Boolean mask of observed pairs (symmetric, diagonal True), or its
+    condensed form if condensed=True.
+    """
+    coo = pair_rdm.tocoo()
+    n = pair_rdm.shape[0]
+    if condensed:
+        mask = np.zeros(n * (n - 1) // 2, dtype=bool)
+        mask[condensed_index(coo.row, coo.col, n)] = True
+        return mask
+    mask = np.eye(n, dtype=bool)
+    mask[coo.row, coo.col] = True
+    mask[coo.col, coo.row] = True
+    return mask
+
+
+def pairs_to_condensed(pair_rdm, fill="mean"):
+    """
+    Observed-pairs matrix -> condensed vector (length n*(n-1)/2) without
+    building the square matrix. Same fill rule as pairs_to_dense.
+    """
+    coo = pair_rdm.tocoo()
+    n = pair_rdm.shape[0]
+    vec = np.full(n * (n - 1) // 2, np.nan)
+    vec[condensed_index(coo.row, coo.col, n)] = coo.data
+    if fill == "mean" and coo.nnz < len(vec):
+        # mean over the full symmetric matrix, zero diagonal included
+        vec[np.isnan(vec)] = 2 * coo.data.sum() / (2 * coo.nnz + n)
+    return vec
+
+
+def condensed_index(i, j, n):
+    """Position of pair (i, j), i < j, in a condensed vector of an n x n RDM."""
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    return i * n - i * (i + 1) // 2 + (j - i - 1)
+
+
+def stack_pairs(pair_rdms):
+    """
+    Stack observed-pairs matrices into one (n_participants, n_pairs) CSR
+    matrix in condensed pair order (nothing densified).
+    """
+    n = pair_rdms[0].shape[0]
+    n_pairs = n * (n - 1) // 2
+    rows, cols, vals = [], [], []
+    for s, m in enumerate(pair_rdms):
+        coo = m.tocoo()
+        rows.append(np.full(coo.nnz, s))
+        cols.append(condensed_index(coo.row, coo.col, n))
+        vals.append(coo.data)
+    return sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(pair_rdms), n_pairs),
+    )
 
 
 def compute_mean_pairwise_distance(rdm):
@@ -273,24 +658,50 @@ def compute_mean_pairwise_distance(rdm):
     return float(vals.mean())
 
 
-def filter_participants_by_mpd(all_rdms, participant_ids, z_threshold=3.0):
+def mpd_statistics(all_rdms):
+    """
+    Per-participant MPD plus its group mean and SD (ddof=0).
+
+    all_rdms as in filter_participants_by_mpd. Returns (mpd, mean_mpd, std_mpd).
+    """
+    if sparse.issparse(all_rdms):
+        rdms = all_rdms.tocsr()
+        n_observed = np.diff(rdms.indptr)
+        mpd = np.asarray(rdms.sum(axis=1)).ravel() / np.maximum(n_observed, 1)
+        return mpd, mpd.mean(), mpd.std(ddof=0)
+
+    rdms = np.asarray(all_rdms)
+    # Running MPD statistics (same accumulator outlier.py / mat_files.py use)
+    n_pairs = rdms.shape[1] if rdms.ndim == 2 else rdms.shape[1] * (rdms.shape[1] - 1) // 2
+    acc = RDMAccumulator(n_pairs)
+    mpd = np.array([acc.add(r) for r in rdms])
+    return mpd, acc.mpd_mean, acc.mpd_std(ddof=0)
+
+
+def filter_participants_by_mpd(all_rdms, participant_ids, z_threshold=3.0, mpd_stats=None):
     """
     Exclude participants whose mean pairwise distance (MPD) is greater than
     (group mean + z_threshold * SD).
 
     Parameters
     ----------
-    all_rdms : np.ndarray
-        Array of shape (n_participants, N_WORDS, N_WORDS).
+    all_rdms : np.ndarray or scipy.sparse matrix
+        Array of shape (n_participants, N_WORDS, N_WORDS), condensed
+        (n_participants, n_pairs), or a sparse (n_participants, n_pairs)
+        matrix of observed pairs (see stack_pairs). For the sparse form,
+        MPD is the mean over each participant's observed pairs only.
     participant_ids : list of str
         Participant IDs in the same order.
     z_threshold : float
         Number of standard deviations above mean to define outliers.
+    mpd_stats : tuple or None
+        Precomputed mpd_statistics(all_rdms), so several thresholds can
+        be applied without recomputing MPD.
 
     Returns
     -------
-    rdms_filtered : np.ndarray
-        Filtered RDMs.
+    rdms_filtered : np.ndarray or scipy.sparse matrix
+        Filtered RDMs (same form as all_rdms).
     ids_filtered : np.ndarray
         Filtered participant IDs.
     mpd : np.ndarray
@@ -298,12 +709,12 @@ def filter_participants_by_mpd(all_rdms, participant_ids, z_threshold=3.0):
     bad_idx : np.ndarray
         Indices of excluded participants (0-based).
     """
-    rdms = np.asarray(all_rdms)
     ids = np.asarray(participant_ids)
+    rdms = all_rdms.tocsr() if sparse.issparse(all_rdms) else np.asarray(all_rdms)
 
-    mpd = np.array([compute_mean_pairwise_distance(r) for r in rdms])
-    mean_mpd = mpd.mean()
-    std_mpd = mpd.std(ddof=0)
+    if mpd_stats is None:
+        mpd_stats = mpd_statistics(rdms)
+    mpd, mean_mpd, std_mpd = mpd_stats
     threshold = mean_mpd + z_threshold * std_mpd
 
     print("\n=== Mean Pairwise Distance (MPD) Filtering ===")
@@ -315,19 +726,29 @@ def filter_participants_by_mpd(all_rdms, participant_ids, z_threshold=3.0):
     print("Excluded participant indices (0-based):", bad_idx.tolist())
     print("Excluded participant IDs:", ids[bad_idx].tolist())
 
-    rdms_filtered = np.delete(rdms, bad_idx, axis=0)
-    ids_filtered = np.delete(ids, bad_idx, axis=0)
+    keep = np.ones(len(ids), dtype=bool)
+    keep[bad_idx] = False
+    rdms_filtered = rdms[keep]
+    ids_filtered = ids[keep]
 
     print(f"Remaining participants after filtering: {len(ids_filtered)}")
     return rdms_filtered, ids_filtered, mpd, bad_idx
 
 
-def save_rdms_to_mat_files(all_rdms, participant_ids, output_folder):
+def save_rdms_to_mat_files(all_rdms, participant_ids, output_folder, n_jobs=None,
+                           incremental=True):
     """
     Optionally save RDMs as .mat files for MATLAB compatibility.
 
     Each file will contain a vectorized lower-triangular form of the RDM
-    in the variable 'estimate_dissimMat_ltv'.
+    in the variable 'estimate_dissimMat_ltv'. all_rdms may be square RDMs,
+    condensed vectors, or a sparse (n_participants, n_pairs) matrix of
+    observed pairs (unobserved pairs are written as NaN).
+
+    Files are written by a thread pool (n_jobs workers, None = default).
+    With incremental=True a content hash per participant is kept in
+    dismx_manifest.json and files whose RDM has not changed are not
+    rewritten.
     """
     try:
         import scipy.io as sio
@@ -335,61 +756,136 @@ def save_rdms_to_mat_files(all_rdms, participant_ids, output_folder):
         print("scipy.io not available, skipping .mat file export.")
         return
 
-    os.makedirs(output_folder, exist_ok=True)
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
 
-    for rdm, pid in zip(all_rdms, participant_ids):
-        vec = squareform(rdm, checks=False)  # lower triangle, no diagonal
+    os.makedirs(output_folder, exist_ok=True)
+    manifest_path = os.path.join(output_folder, MAT_MANIFEST)
+    manifest = {}
+    if incremental and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    def _save(s):
+        pid = participant_ids[s]
+        vec = _condensed_row(all_rdms, s)  # lower triangle, no diagonal
+        digest = hashlib.sha1(np.ascontiguousarray(vec, dtype=np.float64).tobytes()).hexdigest()
         mat_path = os.path.join(output_folder, f"dismx_{pid}.mat")
-        sio.savemat(mat_path, {"estimate_dissimMat_ltv": vec})
+        if incremental and manifest.get(str(pid)) == digest and os.path.exists(mat_path):
+            return pid, digest, False
+        sio.savemat(mat_path, {MAT_KEY: vec})
+        return pid, digest, True
 
-    print(f"Saved {len(all_rdms)} .mat files to {output_folder}")
+    with ThreadPoolExecutor(max_workers=n_jobs) as ex:
+        results = list(ex.map(_save, range(len(participant_ids))))
 
+    n_written = sum(written for _, _, written in results)
+    if incremental:
+        manifest.update({str(pid): digest for pid, digest, _ in results})
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
 
-# ---------------------------------------------------------------------
-# MAIN
-# ---------------------------------------------------------------------
+    print(f"Saved {n_written} .mat files to {output_folder}"
+          + (f" ({len(results) - n_written} unchanged)" if n_written < len(results) else ""))
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python preprocessing_multiarrangement.py <data_folder> [output_folder]")
-        print("\nExample:")
-        print("  python preprocessing_multiarrangement.py ./cleaned ./preprocessed")
-        sys.exit(1)
-
-    data_folder = sys.argv[1]
-    output_folder = sys.argv[2] if len(sys.argv) > 2 else "./preprocessed"
-
-    # 1) Load & combine trials into RDMs, and get the word order
-    all_rdms, participant_ids, master_words = load_and_combine_multiarrangement_trials(
-        data_folder,
-        equal_weights=True,
-    )
 
-    # 2) Filter by MPD (exclude random/chaotic responders)
-    rdms_filtered, ids_filtered, mpd_values, bad_idx = filter_participants_by_mpd(
-        all_rdms,
-        participant_ids,
-        z_threshold=3.0,
-    )
+def save_consolidated_mat(all_rdms, participant_ids, word_order, output_folder,
+                          filename=CONSOLIDATED_MAT):
+    """
+    All participants in one .mat file:
+      estimate_dissimMat_ltv  n_participants x n_pairs (row s = what
+                              dismx_<id>.mat would hold for participant s)
+      participant_ids         cell array of ids (row order)
+      word_order              cell array of words (RDM order)
+    """
+    import scipy.io as sio
 
-    # 3) Save filtered outputs
     os.makedirs(output_folder, exist_ok=True)
+    ltv = np.stack([_condensed_row(all_rdms, s) for s in range(len(participant_ids))])
+    path = os.path.join(output_folder, filename)
+    sio.savemat(path, {
+        MAT_KEY: ltv,
+        "participant_ids": np.array([str(p) for p in participant_ids], dtype=object),
+        "word_order": np.array(list(word_order), dtype=object),
+    })
+    print(f"Saved consolidated {ltv.shape[0]} x {ltv.shape[1]} {MAT_KEY} to {path}")
+    return path
+
+
+def _condensed_row(all_rdms, s):
+    """Participant s as a condensed vector, whatever form all_rdms is in."""
+    if sparse.issparse(all_rdms):
+        row = all_rdms.getrow(s)
+        vec = np.full(all_rdms.shape[1], np.nan)
+        vec[row.indices] = row.data
+        return vec
+    rdm = np.asarray(all_rdms[s])
+    return rdm if rdm.ndim == 1 else squareform(rdm, checks=False)
+
+
+def fill_pairs(pair_rdms, output="dense", completion="mean", rank=5):
+    """
+    Observed-pair RDMs -> the requested output form.
+
+    Returns (all_rdms, masks): dense (n, W, W) or condensed (n, n_pairs)
+    arrays with never-co-occurring pairs filled ("mean" or "lowrank"), plus
+    the observed-pair masks in the same layout; or, for output="sparse",
+    the stacked observed pairs and masks=None.
+    """
+    if output == "sparse":
+        return stack_pairs(pair_rdms), None
+
+    condensed = output == "condensed"
+    masks = np.stack([observed_mask(m, condensed=condensed) for m in pair_rdms])
 
-    # 3a. RDMs + participant info (filtered)
-    np.save(os.path.join(output_folder, "all_rdms.npy"), rdms_filtered)
+    if completion == "lowrank":
+        from rdm_completion import complete_rdms
+        all_rdms, n_iter = complete_rdms(
+            np.stack([pairs_to_dense(m, fill=None) for m in pair_rdms]), rank=rank
+        )
+        print(f"Low-rank completion: {int((n_iter > 0).sum())} participants with missing pairs, "
+              f"max {int(n_iter.max())} iterations")
+        if condensed:
+            all_rdms = np.stack([squareform(r, checks=False) for r in all_rdms])
+    elif condensed:
+        all_rdms = np.stack([pairs_to_condensed(m) for m in pair_rdms])
+    else:
+        all_rdms = np.stack([pairs_to_dense(m) for m in pair_rdms])
+    return all_rdms, masks
+
+
+def write_outputs(output_folder, output, rdms_filtered, masks, ids_filtered,
+                  participant_ids, mpd_values, bad_idx, master_words, convergence=None,
+                  mat_export="per_participant"):
+    """Writes one filtered output set (RDMs, ids, word order, diagnostics, .mat files)."""
+    os.makedirs(output_folder, exist_ok=True)
+
+    # a. RDMs + participant info (filtered)
+    if output == "dense":
+        rdm_file = "all_rdms.npy"
+        np.save(os.path.join(output_folder, rdm_file), rdms_filtered)
+    elif output == "condensed":
+        rdm_file = "all_rdms_condensed.npy"
+        np.save(os.path.join(output_folder, rdm_file), rdms_filtered)
+    else:
+        rdm_file = "all_pairs_sparse.npz"
+        sparse.save_npz(os.path.join(output_folder, rdm_file), rdms_filtered)
+    if masks is not None:
+        # observed (True) vs filled/imputed (False) cells, same layout as the RDMs
+        np.save(os.path.join(output_folder, "observed_mask.npy"), np.delete(masks, bad_idx, axis=0))
     pd.DataFrame({"participant_id": ids_filtered}).to_csv(
         os.path.join(output_folder, "participant_info.csv"),
         index=False,
     )
 
-    # 3b. Word order (one list, same for all participants)
+    # b. Word order (one list, same for all participants)
     pd.DataFrame({"word": master_words}).to_csv(
         os.path.join(output_folder, "word_order.csv"),
         index=False,
         encoding="utf-8-sig", 
     )
 
-    # 3c. MPD diagnostics (optional but useful)
+    # c. MPD diagnostics (optional but useful)
     pd.DataFrame({
         "participant_id": participant_ids,
         "mpd_value": mpd_values,
@@ -399,11 +895,139 @@ if __name__ == "__main__":
         index=False,
     )
 
-    # 4) Optional: MATLAB .mat files for filtered participants
-    save_rdms_to_mat_files(rdms_filtered, ids_filtered, output_folder)
+    # d. Inverse-MDS convergence per participant
+    if convergence is not None:
+        convergence.to_csv(os.path.join(output_folder, "inverse_mds_convergence.csv"), index=False)
+
+    # e. Optional: MATLAB .mat files for filtered participants
+    if mat_export in ("per_participant", "both"):
+        save_rdms_to_mat_files(rdms_filtered, ids_filtered, output_folder)
+    if mat_export in ("consolidated", "both"):
+        save_consolidated_mat(rdms_filtered, ids_filtered, master_words, output_folder)
 
     print("\nPreprocessing complete! Filtered files saved to", output_folder)
-    print(f"  - all_rdms.npy: shape {rdms_filtered.shape}")
+    print(f"  - {rdm_file}: shape {rdms_filtered.shape}")
+    if masks is not None:
+        print("  - observed_mask.npy (True = observed pair)")
     print(f"  - participant_info.csv: {len(ids_filtered)} participants")
     print(f"  - word_order.csv: {len(master_words)} words")
     print("  - mpd_values_all.csv (MPD diagnostics)")
+    if convergence is not None:
+        print("  - inverse_mds_convergence.csv (iterations / final change per participant)")
+
+
+# ---------------------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Combine multiarrangement trials into one RDM per participant."
+    )
+    parser.add_argument('data_folder', type=str, help="Folder with cleaned_*.csv files")
+    parser.add_argument('output_folder', type=str, nargs='?', default="./preprocessed")
+    parser.add_argument('--n_words', type=int, default=N_WORDS,
+                        help="Vocabulary size (default: %(default)s)")
+    parser.add_argument('--vocabulary', type=str, default=None,
+                        help="CSV with a 'word' column giving the fixed word order; "
+                             "needed when participants see only subsets (no full trial)")
+    parser.add_argument('--output', type=str, choices=["dense", "condensed", "sparse"],
+                        default="dense",
+                        help="dense: all_rdms.npy (n x W x W); condensed: all_rdms_condensed.npy "
+                             "(n x W(W-1)/2); sparse: all_pairs_sparse.npz (observed pairs only)")
+    parser.add_argument('--weighting', type=str, nargs='+', choices=WEIGHTINGS,
+                        default=["equal"],
+                        help="Trial combination: equal averaging, mean(dissim)^2 trial weights, or "
+                             "iterative inverse-MDS scaling (writes inverse_mds_convergence.csv). "
+                             "Several values = sweep")
+    parser.add_argument('--z_threshold', type=float, nargs='+', default=[3.0],
+                        help="MPD exclusion threshold(s) in SDs above the mean. Several values = sweep")
+    parser.add_argument('--tol', type=float, default=1e-6,
+                        help="Convergence tolerance for --weighting inverse_mds")
+    parser.add_argument('--mat_export', type=str,
+                        choices=["per_participant", "consolidated", "both", "none"],
+                        default="per_participant",
+                        help="per_participant: dismx_<id>.mat (parallel, unchanged files skipped); "
+                             "consolidated: one rdms_all.mat (n x n_pairs + ids + word order)")
+    parser.add_argument('--completion', type=str, choices=["mean", "lowrank"], default="mean",
+                        help="How to fill pairs that never co-occurred (dense/condensed output)")
+    parser.add_argument('--rank', type=int, default=5,
+                        help="Model rank for --completion lowrank")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with instrument.run_report("preprocessing_multiarrangement", args):
+        run(args)
+
+
+def run(args):
+    data_folder = args.data_folder
+    output_folder = args.output_folder
+
+    master_word_list = None
+    n_words = args.n_words
+    if args.vocabulary:
+        master_word_list = pd.read_csv(args.vocabulary, encoding=ENCODING)["word"].tolist()
+        n_words = len(master_word_list)
+
+    # 1) Read & decode every participant's trials once
+    with instrument.stage("load"):
+        trials, participant_ids, master_words = load_participant_trials(
+            data_folder, n_words=n_words, master_word_list=master_word_list
+        )
+
+    weightings = list(dict.fromkeys(args.weighting))
+    z_thresholds = list(dict.fromkeys(args.z_threshold))
+    sweep = len(weightings) * len(z_thresholds) > 1
+    summary = []
+
+    for weighting in weightings:
+        # 1a) Combine trials into observed-pair RDMs
+        with instrument.stage(f"combine_{weighting}", participants=len(trials)):
+            pair_rdms, convergence = combine_collected(trials, n_words, weighting, tol=args.tol)
+            if convergence is not None:
+                convergence.insert(0, "participant_id", participant_ids)
+                instrument.count(iterations=int(convergence["n_iter"].sum()))
+
+        # 1b) Fill never-co-occurring pairs (dense / condensed outputs only)
+        with instrument.stage(f"fill_{args.completion}", participants=len(pair_rdms)):
+            all_rdms, masks = fill_pairs(pair_rdms, args.output, args.completion, args.rank)
+
+        # 2) Filter by MPD (exclude random/chaotic responders); MPD is
+        #    computed once and every threshold applied to it
+        mpd_stats = mpd_statistics(all_rdms)
+        for z_threshold in z_thresholds:
+            rdms_filtered, ids_filtered, mpd_values, bad_idx = filter_participants_by_mpd(
+                all_rdms,
+                participant_ids,
+                z_threshold=z_threshold,
+                mpd_stats=mpd_stats,
+            )
+
+            # 3) Save filtered outputs (one folder per configuration in a sweep)
+            config_folder = output_folder
+            if sweep:
+                config_folder = os.path.join(output_folder, f"{weighting}_z{z_threshold:g}")
+            with instrument.stage("write", participants=len(ids_filtered)):
+                write_outputs(
+                    config_folder, args.output, rdms_filtered, masks, ids_filtered,
+                    participant_ids, mpd_values, bad_idx, master_words, convergence,
+                    mat_export=args.mat_export,
+                )
+            summary.append({
+                "weighting": weighting,
+                "z_threshold": z_threshold,
+                "n_participants": len(ids_filtered),
+                "n_excluded": len(bad_idx),
+                "excluded_ids": ";".join(np.asarray(participant_ids)[bad_idx]),
+                "folder": config_folder,
+            })
+
+    if sweep:
+        summary_path = os.path.join(output_folder, "sweep_summary.csv")
+        pd.DataFrame(summary).to_csv(summary_path, index=False)
+        print(f"\nSweep complete: {len(summary)} configurations, summary in {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Low-rank completion of never-co-occurring word pairs.
+
+When a pair never appears in the same trial, the original combiner fills
+it with the participant's mean distance. For subset-based or
+large-vocabulary designs that fill dominates. Here missing pairs are
+imputed from the participant's own observed distances instead:
+
+1. Warm start: group-mean RDM over participants who observed each pair,
+   rescaled to the participant's own observed distances
+2. Repeat until the imputed cells stop changing:
+     X = classical MDS of the current RDM (rank-k, one eigendecomposition)
+     missing cells <- Euclidean distances between the rows of X
+   Observed cells are never modified.
+
+All steps are batched over participants (stacked eigendecompositions), so
+the whole cohort completes in a few array operations per iteration.
+
+Usage (see preprocessing_multiarrangement.py --completion lowrank):
+    from rdm_completion import complete_rdms
+    completed, n_iter = complete_rdms(rdms_with_nan, rank=5)
+"""
+
+import numpy as np
+
+from embeddings import classical_mds
+
+RANK = 5          # embedding dimensions used to impute missing pairs
+MAX_ITER = 200
+TOL = 1e-5        # relative change of the imputed cells
+
+
+def group_mean_warm_start(rdms, mask):
+    """
+    Initial guess for every cell: group mean over participants who observed
+    the pair (global mean where nobody did), scaled per participant so its
+    observed cells match the participant's own mean distance.
+    """
+    n = rdms.shape[-1]
+    off_diag = ~np.eye(n, dtype=bool)
+    observed = np.where(mask, rdms, 0.0)
+
+    counts = mask.sum(axis=0)
+    group = np.full((n, n), np.nan)
+    np.divide(observed.sum(axis=0), counts, out=group, where=counts > 0)
+    group[np.isnan(group)] = np.nanmean(group[off_diag])
+    np.fill_diagonal(group, 0.0)
+
+    own = (observed * off_diag).sum(axis=(1, 2))
+    ref = (np.where(mask, group, 0.0) * off_diag).sum(axis=(1, 2))
+    scale = np.divide(own, ref, out=np.ones_like(own), where=ref > 0)
+    return group[None, :, :] * scale[:, None, None]
+
+
+def pairwise_distances(coords):
+    """(..., n, k) coordinates -> (..., n, n) Euclidean distances."""
+    sq = (coords ** 2).sum(axis=-1)
+    gram = coords @ np.swapaxes(coords, -1, -2)
+    d2 = sq[..., :, None] + sq[..., None, :] - 2 * gram
+    return np.sqrt(np.clip(d2, 0.0, None))
+
+
+def complete_rdms(rdms, mask=None, rank=RANK, max_iter=MAX_ITER, tol=TOL):
+    """
+    Impute missing cells of a stack of RDMs.
+
+    Parameters
+    ----------
+    rdms : np.ndarray
+        (n_subjects, n_words, n_words); missing pairs are NaN (or marked
+        False in mask).
+    mask : np.ndarray of bool or None
+        True where the pair was observed. Default: ~np.isnan(rdms).
+    rank : int
+        Dimensionality of the MDS model used for imputation.
+    max_iter, tol :
+        Stop when the relative change of the imputed cells is below tol
+        for every participant, or after max_iter iterations.
+
+    Returns
+    -------
+    completed : np.ndarray
+        (n_subjects, n_words, n_words); observed cells unchanged.
+    n_iter : np.ndarray
+        Iterations used per participant (0 if nothing was missing).
+    """
+    rdms = np.asarray(rdms, dtype=np.float64)
+    if mask is None:
+        mask = ~np.isnan(rdms)
+    mask = mask | np.eye(rdms.shape[-1], dtype=bool)[None, :, :]
+    rdms = np.where(mask, rdms, 0.0)
+    np.einsum("sii->si", rdms)[:] = 0.0
+
+    completed = rdms.copy()
+    n_iter = np.zeros(rdms.shape[0], dtype=int)
+
+    todo = np.where(~mask.all(axis=(1, 2)))[0]
+    if len(todo) == 0:
+        return completed, n_iter
+
+    obs, m = rdms[todo], mask[todo]
+    current = np.where(m, obs, group_mean_warm_start(rdms, mask)[todo])
+    active = np.ones(len(todo), dtype=bool)
+
+    for it in range(1, max_iter + 1):
+        a = np.where(active)[0]
+        coords = classical_mds(current[a], n_components=rank)
+        updated = np.where(m[a], obs[a], pairwise_distances(coords))
+
+        change = np.sqrt((((updated - current[a]) * ~m[a]) ** 2).sum(axis=(1, 2)))
+        size = np.sqrt(((current[a] * ~m[a]) ** 2).sum(axis=(1, 2)))
+        current[a] = updated
+        n_iter[todo[a]] = it
+
+        done = change <= tol * np.maximum(size, 1e-12)
+        active[a[done]] = False
+        if not active.any():
+            break
+
+    completed[todo] = current
+    return completed, n_iter
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Streaming group-level RDM summaries.
+
+RDMAccumulator keeps Welford running statistics over condensed RDM
+vectors (n_words*(n_words-1)/2 values, 4005 for 90 words) plus the
+per-participant mean pairwise distance (MPD). Participants are added one
+at a time, so memory stays O(n_pairs) however large the cohort is, and
+partial accumulators built in parallel workers can be merged.
+
+Sources:
+    iter_mat_files(pattern)          dismx_*.mat files (estimate_dissimMat_ltv)
+    iter_npy_shards(paths)           .npy files of (k, n, n) or (k, n_pairs)
+    iter_cleaned_participants(dir)   cleaned_*.csv via the trial combiner
+
+Usage:
+    from rdm_stats import accumulate, iter_mat_files
+    acc = accumulate(iter_mat_files("preprocessed/dismx_*.mat"))
+    acc.mean_rdm(), acc.variance(), acc.mpd_mean, acc.mpd_std()
+"""
+
+import os
+import glob
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.spatial.distance import squareform
+
+
+# ---------------------------------------------------------------------
+# Accumulator
+# ---------------------------------------------------------------------
+
+class RDMAccumulator:
+    """
+    Running mean / variance of condensed RDMs and of per-participant MPD.
+
+    Attributes
+    ----------
+    n : int
+        Participants added so far.
+    mean : np.ndarray
+        (n_pairs,) running mean RDM (condensed).
+    m2 : np.ndarray
+        (n_pairs,) running sum of squared deviations.
+    mpd_mean, mpd_m2 : float
+        Same for the scalar MPD of each participant.
+    """
+
+    def __init__(self, n_pairs):
+        self.n = 0
+        self.mean = np.zeros(n_pairs, dtype=np.float64)
+        self.m2 = np.zeros(n_pairs, dtype=np.float64)
+        self.mpd_mean = 0.0
+        self.mpd_m2 = 0.0
+
+    @property
+    def n_pairs(self):
+        return self.mean.shape[0]
+
+    @property
+    def n_words(self):
+        return int(round((1 + np.sqrt(1 + 8 * self.n_pairs)) / 2))
+
+    def add(self, rdm):
+        """
+        Add one participant; rdm is a square matrix or a condensed vector.
+        Returns the participant's MPD.
+        """
+        vec = as_condensed(rdm)
+        if vec.shape[0] != self.n_pairs:
+            raise ValueError(f"Expected {self.n_pairs} pairs, got {vec.shape[0]}")
+
+        self.n += 1
+        delta = vec - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (vec - self.mean)
+
+        mpd = float(np.nanmean(vec))
+        d = mpd - self.mpd_mean
+        self.mpd_mean += d / self.n
+        self.mpd_m2 += d * (mpd - self.mpd_mean)
+        return mpd
+
+    def merge(self, other):
+        """
+        Combine with another accumulator (Chan et al. parallel update).
+        Returns self.
+        """
+        if other.n == 0:
+            return self
+        if other.n_pairs != self.n_pairs:
+            raise ValueError("Cannot merge accumulators of different RDM sizes")
+        if self.n == 0:
+            self.n = other.n
+            self.mean = other.mean.copy()
+            self.m2 = other.m2.copy()
+            self.mpd_mean, self.mpd_m2 = other.mpd_mean, other.mpd_m2
+            return self
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.n / n)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.n * other.n / n)
+
+        d = other.mpd_mean - self.mpd_mean
+        self.mpd_mean += d * (other.n / n)
+        self.mpd_m2 += other.mpd_m2 + d ** 2 * (self.n * other.n / n)
+
+        self.n = n
+        return self
+
+    def variance(self, ddof=0):
+        """(n_pairs,) per-pair variance across participants."""
+        if self.n - ddof <= 0:
+            return np.full(self.n_pairs, np.nan)
+        return self.m2 / (self.n - ddof)
+
+    def mpd_std(self, ddof=0):
+        """SD of participant MPDs (ddof=0 matches filter_participants_by_mpd)."""
+        if self.n - ddof <= 0:
+            return np.nan
+        return float(np.sqrt(self.mpd_m2 / (self.n - ddof)))
+
+    def mean_rdm(self):
+        """Square (n_words, n_words) group-mean RDM."""
+        return squareform(self.mean)
+
+    def leave_one_out_mean(self, rdm):
+        """
+        Condensed mean of all *other* participants, for one participant
+        already included in this accumulator.
+        """
+        vec = as_condensed(rdm)
+        return (self.n * self.mean - vec) / (self.n - 1)
+
+
+# ---------------------------------------------------------------------
+# Helpers / sources
+# ---------------------------------------------------------------------
+
+def as_condensed(rdm):
+    """Square RDM -> condensed vector (upper triangle); 1-D input is passed through."""
+    rdm = np.asarray(rdm, dtype=np.float64)
+    if rdm.ndim == 1:
+        return rdm
+    return squareform(rdm, checks=False)
+
+
+def iter_mat_files(pattern_or_files, key="estimate_dissimMat_ltv"):
+    """
+    Yields (participant_id, condensed vector) from dismx_<id>.mat files, or
+    one per row of a consolidated file (n x n_pairs + participant_ids).
+    """
+    from scipy.io import loadmat
+
+    files = (sorted(glob.glob(pattern_or_files)) if isinstance(pattern_or_files, str)
+             else list(pattern_or_files))
+    for f in files:
+        data = loadmat(f, variable_names=[key, "participant_ids"])
+        ltv = np.asarray(data[key], dtype=np.float64)
+        if "participant_ids" in data:
+            ids = [str(np.squeeze(p)) for p in np.ravel(data["participant_ids"])]
+            yield from zip(ids, ltv.reshape(len(ids), -1))
+            continue
+        pid = f.replace("\\", "/").rsplit("/", 1)[-1][len("dismx_"):-len(".mat")]
+        yield pid, ltv.ravel()
+
+
+def iter_npy_shards(paths):
+    """
+    Yields (index, rdm) from one or more .npy files holding (k, n, n) or
+    (k, n_pairs) arrays; each shard is memory-mapped, never fully loaded.
+    """
+    if isinstance(paths, str):
+        paths = sorted(glob.glob(paths))
+    i = 0
+    for path in paths:
+        arr = np.load(path, mmap_mode="r")
+        for row in arr:
+            yield i, row
+            i += 1
+
+
+def iter_cleaned_participants(data_folder, equal_weights=True):
+    """Yields (participant_id, rdm) straight from cleaned_*.csv files."""
+    from preprocessing_multiarrangement import iter_participant_rdms
+
+    for pid, rdm, _ in iter_participant_rdms(data_folder, equal_weights=equal_weights):
+        yield pid, rdm
+
+
+def accumulate(source, n_pairs=None):
+    """
+    Consume (id, rdm) pairs one at a time into a new RDMAccumulator.
+    Returns (accumulator, ids, mpd_values).
+    """
+    acc = None
+    ids, mpds = [], []
+    for pid, rdm in source:
+        vec = as_condensed(rdm)
+        if acc is None:
+            acc = RDMAccumulator(n_pairs or vec.shape[0])
+        mpds.append(acc.add(vec))
+        ids.append(pid)
+    if acc is None:
+        raise ValueError("No participants to accumulate.")
+    return acc, ids, np.array(mpds)
+
+
+def _accumulate_mat_chunk(files):
+    return accumulate(iter_mat_files(files))
+
+
+def accumulate_mat_files_parallel(pattern, n_jobs=None):
+    """
+    Split the .mat files across worker processes, accumulate each chunk
+    separately and merge the partial accumulators.
+    Returns (accumulator, ids, mpd_values) in sorted file order.
+    """
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise FileNotFoundError(f"No .mat files match {pattern}")
+    n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, len(files)))
+    chunks = [list(c) for c in np.array_split(np.array(files, dtype=object), n_jobs) if len(c)]
+
+    acc, ids, mpds = None, [], []
+    with ProcessPoolExecutor(max_workers=n_jobs) as ex:
+        for part, part_ids, part_mpds in ex.map(_accumulate_mat_chunk, chunks):
+            acc = part if acc is None else acc.merge(part)
+            ids.extend(part_ids)
+            mpds.extend(part_mpds)
+    return acc, ids, np.array(mpds)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Golden-output regression check for preprocessing and Steps 1-3.
+
+Reruns preprocessing_multiarrangement and data_analysis_multiarrangement
+on the checked-in cleaned data (cleaned/ and explo_data/) with fixed
+seeds, and compares the outputs with the golden copies in golden/:
+
+  all_rdms.npy                 abs. tolerance 1e-10
+  mpd_values_all.csv           abs. tolerance 1e-10
+  participant_info.csv         exact
+  word_order.csv               exact
+  step1 / step2 / step3 stats  rel. 1e-7, abs. 1e-9 (p-values included)
+
+Timing is checked too: no stage (from the run reports, see
+instrument.py) may take longer than --max_slowdown times its golden
+time plus TIME_SLACK_S (sub-second stages are too noisy for a ratio
+alone). Settings (bootstraps, seed, semantic columns) are taken from
+golden/manifest.json, so a check always reruns exactly what the goldens
+were made with. Extra arguments for the
+scripts (e.g. an alternative engine) go through --preprocess_args and
+--analysis_args. Outputs and a JSON report stay in cache/regression.
+
+Usage:
+    python analysis/regression.py                 # check, exit code 1 on any failure
+    python analysis/regression.py --update        # (re)write golden/ from the current code
+    python analysis/regression.py --datasets main --max_slowdown 0     # outputs only
+"""
+
+import os
+import sys
+import json
+import shlex
+import shutil
+import argparse
+import platform
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import preprocessing_multiarrangement
+import data_analysis_multiarrangement
+
+GOLDEN_DIR = "golden"
+WORK_DIR = "cache/regression"
+DATASETS = {"main": "cleaned", "explo": "explo_data"}
+SETTINGS = {
+    "n_bootstraps": 200,
+    "seed": 42,
+    "semantic_file": "Behav_Neural_word_ISC.xlsx",
+    "sem_all_cols": "Mean_Language-Mean_Valence",
+    "sem_sig_cols": "Mean_Language,Mean_Sensory,Mean_Arousal,Mean_Valence",
+}
+
+# output file -> (rtol, atol); None = must match exactly
+TOLERANCES = {
+    "all_rdms.npy": (0.0, 1e-10),
+    "mpd_values_all.csv": (0.0, 1e-10),
+    "participant_info.csv": None,
+    "word_order.csv": None,
+    "step1_subject_bootstrap_stats.csv": (1e-7, 1e-9),
+    "step2_word_bootstrap_stats.csv": (1e-7, 1e-9),
+    "step3_correlation_stats.csv": (1e-7, 1e-9),
+    "step3_regression_beta_stats.csv": (1e-7, 1e-9),
+}
+PREPROCESS_FILES = ["all_rdms.npy", "mpd_values_all.csv", "participant_info.csv", "word_order.csv"]
+MAX_SLOWDOWN = 1.5
+TIME_SLACK_S = 0.5
+
+
+def run_dataset(data_folder, out_dir, settings, preprocess_args=(), analysis_args=()):
+    """
+    Preprocess + Steps 1-3 into out_dir/{preprocessed,results}; returns
+    {stage: wall_s} from the run reports. Script output goes to out_dir/run.log.
+    """
+    pre_dir = os.path.join(out_dir, "preprocessed")
+    res_dir = os.path.join(out_dir, "results")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    pre_report = os.path.join(out_dir, "preprocess_report.json")
+    ana_report = os.path.join(out_dir, "analysis_report.json")
+
+    with open(os.path.join(out_dir, "run.log"), "w", encoding="utf-8") as log, \
+            redirect_stdout(log), redirect_stderr(log):
+        preprocessing_multiarrangement.main(
+            [data_folder, pre_dir, "--mat_export", "none", "--report", pre_report]
+            + list(preprocess_args)
+        )
+        data_analysis_multiarrangement.main([
+            "--preprocessed_file", os.path.join(pre_dir, "all_rdms.npy"),
+            "--output_folder", res_dir,
+            "--n_bootstraps", str(settings["n_bootstraps"]),
+            "--seed", str(settings["seed"]),
+            "--semantic_file", settings["semantic_file"],
+            "--sem_all_cols", settings["sem_all_cols"],
+            "--sem_sig_cols", settings["sem_sig_cols"],
+            "--report", ana_report,
+        ] + list(analysis_args))
+
+    timings = {}
+    for prefix, path in (("preprocess", pre_report), ("analysis", ana_report)):
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        timings[prefix] = report["wall_s"]
+        for stage in report["stages"]:
+            key = f"{prefix}.{stage['stage']}"
+            timings[key] = round(timings.get(key, 0.0) + stage["wall_s"], 4)
+    return timings
+
+
+def output_path(out_dir, name):
+    sub = "preprocessed" if name in PREPROCESS_FILES else "results"
+    return os.path.join(out_dir, sub, name)
+
+
+def _load(path):
+    if path.endswith(".npy"):
+        return np.load(path)
+    if path.endswith(".npz"):
+        with np.load(path) as z:
+            return z["all_rdms"]
+    return pd.read_csv(path, encoding="utf-8-sig")
+
+
+def golden_path(golden_dir, dataset, name):
+    # the RDM tensor is stored compressed
+    if name.endswith(".npy"):
+        name = name[:-4] + ".npz"
+    return os.path.join(golden_dir, dataset, name)
+
+
+def compare_output(new, golden, tol):
+    """(ok, max_abs_diff, message) for two arrays or DataFrames."""
+    if isinstance(golden, pd.DataFrame):
+        if list(new.columns) != list(golden.columns) or len(new) != len(golden):
+            return False, None, (f"shape/columns differ: {new.shape} {list(new.columns)} vs "
+                                 f"{golden.shape} {list(golden.columns)}")
+        numeric = [c for c in golden.columns
+                   if pd.api.types.is_numeric_dtype(golden[c]) and pd.api.types.is_numeric_dtype(new[c])
+                   and not pd.api.types.is_bool_dtype(golden[c])]
+        other = [c for c in golden.columns if c not in numeric]
+        for c in other:
+            if not new[c].astype(str).equals(golden[c].astype(str)):
+                return False, None, f"column {c!r} differs"
+        a = new[numeric].to_numpy(dtype=float)
+        b = golden[numeric].to_numpy(dtype=float)
+    else:
+        if new.shape != golden.shape:
+            return False, None, f"shape {new.shape} vs {golden.shape}"
+        a, b = np.asarray(new, dtype=float), np.asarray(golden, dtype=float)
+
+    if a.size == 0:
+        return True, 0.0, ""
+    both_nan = np.isnan(a) & np.isnan(b)
+    diff = np.where(both_nan, 0.0, np.abs(a - b))
+    max_diff = float(np.nanmax(np.where(np.isnan(diff), np.inf, diff)))
+    if tol is None:
+        ok = max_diff == 0.0
+    else:
+        rtol, atol = tol
+        ok = bool(np.all(both_nan | np.isclose(a, b, rtol=rtol, atol=atol)))
+    return ok, max_diff, "" if ok else f"max |diff| {max_diff:.3g} exceeds tolerance {tol}"
+
+
+def update_golden(datasets, golden_dir, settings, preprocess_args, analysis_args):
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "settings": settings,
+        "timings": {},
+    }
+    for dataset in datasets:
+        out_dir = os.path.join(WORK_DIR, dataset)
+        print(f"[{dataset}] running ...")
+        manifest["timings"][dataset] = run_dataset(
+            DATASETS[dataset], out_dir, settings, preprocess_args, analysis_args)
+        os.makedirs(os.path.join(golden_dir, dataset), exist_ok=True)
+        for name in TOLERANCES:
+            src = output_path(out_dir, name)
+            dst = golden_path(golden_dir, dataset, name)
+            if name.endswith(".npy"):
+                np.savez_compressed(dst, all_rdms=np.load(src))
+            else:
+                shutil.copyfile(src, dst)
+        print(f"[{dataset}] golden outputs written to {os.path.join(golden_dir, dataset)}")
+
+    with open(os.path.join(golden_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def check(datasets, golden_dir, preprocess_args, analysis_args, max_slowdown):
+    """Rerun and compare; returns the list of check records."""
+    with open(os.path.join(golden_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    settings = manifest["settings"]
+
+    checks = []
+    for dataset in datasets:
+        out_dir = os.path.join(WORK_DIR, dataset)
+        print(f"[{dataset}] running ...")
+        timings = run_dataset(DATASETS[dataset], out_dir, settings, preprocess_args, analysis_args)
+
+        for name, tol in TOLERANCES.items():
+            ok, max_diff, message = compare_output(
+                _load(output_path(out_dir, name)), _load(golden_path(golden_dir, dataset, name)), tol)
+            checks.append({"dataset": dataset, "check": name, "ok": ok,
+                           "max_abs_diff": max_diff, "message": message})
+
+        golden_timings = manifest["timings"].get(dataset, {})
+        for stage, golden_s in golden_timings.items():
+            if stage not in timings:
+                continue
+            limit = max_slowdown * golden_s + TIME_SLACK_S
+            ok = max_slowdown <= 0 or timings[stage] <= limit
+            ratio = timings[stage] / golden_s if golden_s > 0 else np.inf
+            checks.append({
+                "dataset": dataset, "check": f"time {stage}", "ok": ok,
+                "seconds": timings[stage], "golden_seconds": golden_s, "ratio": round(ratio, 3),
+                "message": "" if ok else f"{timings[stage]:.2f}s exceeds the limit of {limit:.2f}s",
+            })
+    return checks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare pipeline outputs and timings with golden copies.")
+    parser.add_argument('--update', action='store_true',
+                        help="Rewrite the golden outputs and timings from the current code")
+    parser.add_argument('--datasets', type=str, nargs='+', choices=list(DATASETS), default=list(DATASETS))
+    parser.add_argument('--golden_dir', type=str, default=GOLDEN_DIR)
+    parser.add_argument('--n_bootstraps', type=int, default=SETTINGS["n_bootstraps"],
+                        help="Bootstraps per step for --update (checks use the golden setting)")
+    parser.add_argument('--preprocess_args', type=str, default="",
+                        help="Extra arguments for preprocessing_multiarrangement.py")
+    parser.add_argument('--analysis_args', type=str, default="",
+                        help="Extra arguments for data_analysis_multiarrangement.py")
+    parser.add_argument('--max_slowdown', type=float, default=MAX_SLOWDOWN,
+                        help="Fail if a stage takes more than this many times its golden time "
+                             f"plus {TIME_SLACK_S}s (0 = off)")
+    args = parser.parse_args(argv)
+
+    preprocess_args = shlex.split(args.preprocess_args)
+    analysis_args = shlex.split(args.analysis_args)
+
+    if args.update:
+        settings = dict(SETTINGS, n_bootstraps=args.n_bootstraps)
+        update_golden(args.datasets, args.golden_dir, settings, preprocess_args, analysis_args)
+        return
+
+    checks = check(args.datasets, args.golden_dir, preprocess_args, analysis_args, args.max_slowdown)
+    os.makedirs(WORK_DIR, exist_ok=True)
+    report_path = os.path.join(WORK_DIR, "report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"time": datetime.now().isoformat(timespec="seconds"),
+                   "preprocess_args": preprocess_args, "analysis_args": analysis_args,
+                   "checks": checks}, f, indent=1)
+
+    df = pd.DataFrame(checks)
+    cols = [c for c in ["dataset", "check", "ok", "max_abs_diff", "seconds", "golden_seconds",
+                        "ratio", "message"] if c in df.columns]
+    print(df[cols].to_string(index=False))
+    n_failed = int((~df["ok"]).sum())
+    print(f"\n{len(df) - n_failed}/{len(df)} checks passed; report saved to {report_path}")
+    if n_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Warm local analysis server: load once, answer queries over HTTP/JSON.
+
+The RDM tensor, the word table (word_order.csv + experiment.js through
+word_registry), participant ids and MPD values are loaded once at start;
+the aligned subject maps (embeddings.py, disk-cached) are computed on
+first use and kept in memory. Every query is memoized in an LRU cache
+keyed by its normalized parameters (word and subject selections are
+resolved to sorted, deduplicated indices), so equivalent requests share
+an entry and repeated exploratory queries are answered from memory.
+Queries run one at a time under a lock; /api/reload builds the new
+inputs aside and swaps them in between two queries.
+
+Endpoints (GET, JSON; lists are comma-separated):
+  /api/info                               shapes, input files, cache statistics
+  /api/words                              word table (index, zh, en, category)
+  /api/participants                       ids and MPD of every participant
+  /api/isc?words=&subjects=&columns=      mean Fisher-z ISC per word for a cohort slice;
+                                          columns=all (every other word, as in Step 1)
+                                          or subset (the other selected words only)
+  /api/pairs?k=10&words=&subjects=&order= k closest (or farthest) word pairs in the
+                                          slice's mean RDM
+  /api/map/<participant_id or group>      aligned 2D map
+  /api/mpd?subjects=                      MPD per participant + slice mean/SD
+  /api/what_if?exclude=                   ISC per word without the given participants, and
+                                          its change from the full cohort (incremental_isc.py)
+  /api/reload (POST)                      reload the inputs and clear the caches
+
+words: indices, zh or en words, or category names (e.g. animals); default all.
+subjects: indices or participant ids; default all.
+
+Usage:
+    python analysis/server.py [--rdm_file preprocessed/all_rdms.npy] [--port 5050]
+    curl 'localhost:5050/api/isc?words=animals&subjects=0,1,2,3,4'
+    curl 'localhost:5050/api/pairs?k=5&words=cat,tiger,panda,rabbit'
+
+The AnalysisState class works without Flask too (e.g. from a notebook).
+"""
+
+import time
+import argparse
+import threading
+import functools
+
+import numpy as np
+import pandas as pd
+
+from data_analysis_multiarrangement import load_rdms
+from incremental_isc import IncrementalISC
+from isc_kernels import ENGINES, block_iscs, resolve_engine
+from masked_isc import without_self
+from plot_space import load_words
+from preprocessing_multiarrangement import mpd_statistics
+from word_registry import CATEGORY_WORDS
+
+RDM_FILE = "preprocessed/all_rdms.npy"
+WORD_ORDER_FILE = "preprocessed/word_order.csv"
+PARTICIPANTS_FILE = "preprocessed/participant_info.csv"
+EXPERIMENT_JS_FILE = "experiment.js"
+CACHE_SIZE = 1024          # memoized results per query type
+# block_iscs kernels only; the per-word reference loops cannot answer slice queries
+SERVER_ENGINES = [e for e in ENGINES if e != "reference"]
+QUERIES = ["word_iscs", "pairs", "subject_map", "mpd", "what_if"]
+
+
+class QueryError(ValueError):
+    """Invalid query parameters (answered with HTTP 400)."""
+
+
+def _floats(values):
+    """JSON-safe list of floats (NaN -> None)."""
+    return [float(v) if np.isfinite(v) else None for v in np.asarray(values, dtype=float).ravel()]
+
+
+class AnalysisState:
+    """Inputs kept in memory plus LRU-memoized queries on them."""
+
+    def __init__(self, rdm_file=RDM_FILE, word_order_file=WORD_ORDER_FILE,
+                 participants_file=PARTICIPANTS_FILE, experiment_js=EXPERIMENT_JS_FILE,
+                 cache_size=CACHE_SIZE, engine="auto"):
+        self.rdm_file = rdm_file
+        self.word_order_file = word_order_file
+        self.participants_file = participants_file
+        self.experiment_js = experiment_js
+        self.cache_size = cache_size
+        if engine not in SERVER_ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}; choose from {SERVER_ENGINES}")
+        self.engine = resolve_engine(engine)
+        # held by load() while swapping inputs and by every query (create_app);
+        # reentrant, since queries call _aligned_maps
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """
+        (Re)load the inputs and start with empty caches. Everything is built
+        aside and swapped in under the lock, so a query never sees a mix of
+        old and new inputs.
+        """
+        t0 = time.perf_counter()
+        all_rdms = load_rdms(self.rdm_file)
+        words = load_words(self.word_order_file, self.experiment_js)
+        participant_ids = pd.read_csv(self.participants_file)["participant_id"].astype(str).tolist()
+        if len(participant_ids) != all_rdms.shape[0]:
+            raise ValueError(f"{self.participants_file} has {len(participant_ids)} participants, "
+                             f"{self.rdm_file} {all_rdms.shape[0]}")
+        if len(words) != all_rdms.shape[1]:
+            raise ValueError(f"{self.word_order_file} has {len(words)} words, the RDMs {all_rdms.shape[1]}")
+        mpd_values = mpd_statistics(all_rdms)[0]
+        incremental = IncrementalISC.from_rdms(all_rdms, participant_ids)
+
+        # selection lookups (case-insensitive): index, zh, en, category label
+        # ("animal") or trial category ("animals")
+        word_index = {}
+        for row in words.itertuples():
+            for key in (str(row.word_index), row.word_zh, str(row.word_en)):
+                word_index[key.lower()] = (row.word_index,)
+        for category, group in words.groupby("category"):
+            word_index[str(category).lower()] = tuple(group["word_index"])
+        position = dict(zip(words["word_zh"], words["word_index"]))
+        for category, members in CATEGORY_WORDS.items():
+            word_index[category] = tuple(position[w] for w in members if w in position)
+        subject_index = {pid: i for i, pid in enumerate(participant_ids)}
+        subject_index.update({str(i): i for i in range(len(participant_ids))})
+        queries = {name: functools.lru_cache(maxsize=self.cache_size)(getattr(self, "_" + name))
+                   for name in QUERIES}
+
+        with self._lock:
+            self.all_rdms = all_rdms
+            self.words = words
+            self.participant_ids = participant_ids
+            self.mpd_values = mpd_values
+            self.incremental = incremental
+            self._maps = None
+            self._word_index = word_index
+            self._subject_index = subject_index
+            for name, query in queries.items():
+                setattr(self, name, query)
+            self.loaded_s = round(time.perf_counter() - t0, 3)
+            self.loaded_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    # ---------------- selections ----------------
+
+    def word_selection(self, text):
+        """Sorted word indices for 'cat,dog' / 'animals' / '0,5' (None or '' = all)."""
+        if not text:
+            return tuple(range(len(self.words)))
+        indices = set()
+        for item in text.split(","):
+            key = item.strip().lower()
+            if key not in self._word_index:
+                raise QueryError(f"Unknown word or category: {item.strip()!r}")
+            indices.update(self._word_index[key])
+        return tuple(sorted(indices))
+
+    def subject_selection(self, text):
+        """Sorted subject indices for participant ids or indices (None or '' = all)."""
+        if not text:
+            return tuple(range(len(self.participant_ids)))
+        indices = set()
+        for item in text.split(","):
+            item = item.strip()
+            if item not in self._subject_index:
+                raise QueryError(f"Unknown participant: {item!r}")
+            indices.add(self._subject_index[item])
+        return tuple(sorted(indices))
+
+    def one_subject(self, text):
+        """Index of exactly one participant (id or index)."""
+        if not text:
+            raise QueryError("Expected one participant, got none")
+        selection = self.subject_selection(text)
+        if len(selection) != 1:
+            raise QueryError(f"Expected one participant, got {len(selection)}: {text!r}")
+        return selection[0]
+
+    # ---------------- queries (memoized in load()) ----------------
+
+    def _word_iscs(self, words, subjects, columns="all"):
+        """Mean Fisher-z ISC of each selected word over the selected subjects."""
+        n_words = self.all_rdms.shape[1]
+        rows = np.array(words)
+        if columns == "all":
+            cols = without_self(np.arange(n_words - 1), n_words)[rows]
+        elif columns == "subset":
+            if len(rows) < 3:
+                raise QueryError("columns=subset needs at least 3 words")
+            cols = np.array([[c for c in rows if c != w] for w in rows])
+        else:
+            raise QueryError(f"columns must be 'all' or 'subset', got {columns!r}")
+        isc = block_iscs(self.all_rdms, np.array(subjects)[None], rows[None], cols[None], self.engine)[0]
+        return {
+            "n_subjects": len(subjects),
+            "columns": columns,
+            "words": self.words.iloc[rows][["word_index", "word_zh", "word_en", "category"]]
+                         .to_dict(orient="records"),
+            "isc": _floats(isc),
+            "mean_isc": _floats([np.nanmean(isc)])[0] if np.isfinite(isc).any() else None,
+        }
+
+    def _pairs(self, words, subjects, k=10, order="closest"):
+        """k closest / farthest word pairs of the slice's mean RDM."""
+        if order not in ("closest", "farthest"):
+            raise QueryError(f"order must be 'closest' or 'farthest', got {order!r}")
+        rows = np.array(words)
+        if len(rows) < 2:
+            raise QueryError("pairs needs at least 2 words")
+        mean_rdm = np.nanmean(self.all_rdms[np.array(subjects)][:, rows[:, None], rows[None, :]], axis=0)
+        i, j = np.triu_indices(len(rows), k=1)
+        dist = mean_rdm[i, j]
+        top = np.argsort(dist if order == "closest" else -dist, kind="stable")[:k]
+        labels = self.words["word_en"].to_numpy()
+        return {
+            "n_subjects": len(subjects),
+            "order": order,
+            "pairs": [{"word_1": labels[rows[i[t]]], "word_2": labels[rows[j[t]]],
+                       "word_index_1": int(rows[i[t]]), "word_index_2": int(rows[j[t]]),
+                       "distance": _floats([dist[t]])[0]} for t in top],
+        }
+
+    def _aligned_maps(self):
+        with self._lock:
+            if self._maps is None:
+                from embeddings import compute_aligned_embeddings
+                self._maps = compute_aligned_embeddings(self.all_rdms)
+        return self._maps
+
+    def _subject_map(self, participant):
+        """Aligned 2D coordinates of one participant's map, or of the group-mean map."""
+        coords, group_coords = self._aligned_maps()
+        if participant == "group":
+            xy = group_coords
+        else:
+            xy = coords[self.one_subject(participant)]
+        return {
+            "participant": participant,
+            "words": self.words[["word_index", "word_zh", "word_en", "category"]].to_dict(orient="records"),
+            "x": _floats(xy[:, 0]),
+            "y": _floats(xy[:, 1]),
+        }
+
+    def _mpd(self, subjects):
+        """Per-participant MPD of the slice plus its mean and SD (ddof=0)."""
+        mpd = self.mpd_values[np.array(subjects)]
+        return {
+            "participants": [self.participant_ids[s] for s in subjects],
+            "mpd": _floats(mpd),
+            "mean": float(mpd.mean()),
+            "std": float(mpd.std(ddof=0)),
+        }
+
+    def _what_if(self, excluded):
+        """ISC per word with the excluded participants left out, next to the full cohort's."""
+        base = self.incremental.iscs()
+        isc = self.incremental.what_if(exclude=[self.participant_ids[s] for s in excluded])
+        return {
+            "excluded": [self.participant_ids[s] for s in excluded],
+            "n_subjects": len(self.participant_ids) - len(excluded),
+            "words": self.words[["word_index", "word_zh", "word_en", "category"]].to_dict(orient="records"),
+            "isc": _floats(isc),
+            "isc_all": _floats(base),
+            "delta": _floats(isc - base),
+            "mean_isc": _floats([np.nanmean(isc)])[0] if np.isfinite(isc).any() else None,
+        }
+
+    # ---------------- bookkeeping ----------------
+
+    def cache_stats(self):
+        stats = {}
+        for name in QUERIES:
+            info = getattr(self, name).cache_info()
+            stats[name] = {"hits": info.hits, "misses": info.misses,
+                           "size": info.currsize, "maxsize": info.maxsize}
+        return stats
+
+    def info(self):
+        return {
+            "rdm_file": self.rdm_file,
+            "n_subjects": int(self.all_rdms.shape[0]),
+            "n_words": int(self.all_rdms.shape[1]),
+            "engine": self.engine,
+            "loaded_at": self.loaded_at,
+            "load_s": self.loaded_s,
+            "maps_loaded": self._maps is not None,
+            "cache": self.cache_stats(),
+        }
+
+
+def create_app(state):
+    """Flask app answering the endpoints of the module docstring from state."""
+    from flask import Flask, jsonify, request, g
+
+    app = Flask(__name__)
+    app.json.ensure_ascii = False
+    app.json.sort_keys = False
+    try:
+        from flask_cors import CORS
+        CORS(app)
+    except ImportError:
+        pass
+
+    def locked(view):
+        """Run a view under the state lock, so its selections and query see one load()."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with state._lock:
+                return view(*args, **kwargs)
+        return wrapper
+
+    def memoized(name, *args):
+        """Call a memoized query, noting for the response header whether it was cached."""
+        query = getattr(state, name)
+        hits = query.cache_info().hits
+        result = query(*args)
+        g.cache = "hit" if query.cache_info().hits > hits else "miss"
+        return jsonify(result)
+
+    @app.before_request
+    def start_timer():
+        g.t0 = time.perf_counter()
+        g.cache = None
+
+    @app.after_request
+    def timing_headers(response):
+        response.headers["X-Elapsed-ms"] = f"{(time.perf_counter() - g.t0) * 1000:.2f}"
+        if g.cache:
+            response.headers["X-Cache"] = g.cache
+        return response
+
+    @app.errorhandler(QueryError)
+    def bad_query(e):
+        return jsonify({"error": str(e)}), 400
+
+    @app.get("/api/info")
+    @locked
+    def info():
+        return jsonify(state.info())
+
+    @app.get("/api/words")
+    @locked
+    def words():
+        return jsonify(state.words[["word_index", "word_zh", "word_en", "category"]].to_dict(orient="records"))
+
+    @app.get("/api/participants")
+    @locked
+    def participants():
+        return jsonify([{"index": i, "participant_id": pid, "mpd": float(state.mpd_values[i])}
+                        for i, pid in enumerate(state.participant_ids)])
+
+    @app.get("/api/isc")
+    @locked
+    def isc():
+        return memoized("word_iscs",
+                        state.word_selection(request.args.get("words")),
+                        state.subject_selection(request.args.get("subjects")),
+                        request.args.get("columns", "all"))
+
+    @app.get("/api/pairs")
+    @locked
+    def pairs():
+        k = request.args.get("k", "10")
+        if not k.strip().isdigit() or int(k) < 1:
+            raise QueryError(f"k must be a positive integer, got {k!r}")
+        return memoized("pairs",
+                        state.word_selection(request.args.get("words")),
+                        state.subject_selection(request.args.get("subjects")),
+                        int(k), request.args.get("order", "closest"))
+
+    @app.get("/api/map/<participant>")
+    @locked
+    def subject_map(participant):
+        if participant != "group":
+            # normalize index / id to the participant id, so both share a cache entry
+            participant = state.participant_ids[state.one_subject(participant)]
+        return memoized("subject_map", participant)
+
+    @app.get("/api/mpd")
+    @locked
+    def mpd():
+        return memoized("mpd", state.subject_selection(request.args.get("subjects")))
+
+    @app.get("/api/what_if")
+    @locked
+    def what_if():
+        exclude = request.args.get("exclude")
+        return memoized("what_if", state.subject_selection(exclude) if exclude else ())
+
+    @app.post("/api/reload")
+    def reload():
+        state.load()
+        with state._lock:
+            return jsonify(state.info())
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve interactive analysis queries from warm in-memory data.")
+    parser.add_argument('--rdm_file', type=str, default=RDM_FILE,
+                        help="all_rdms.npy, all_rdms_condensed.npy or all_pairs_sparse.npz")
+    parser.add_argument('--word_order_file', type=str, default=WORD_ORDER_FILE)
+    parser.add_argument('--participants_file', type=str, default=PARTICIPANTS_FILE)
+    parser.add_argument('--experiment_js', type=str, default=EXPERIMENT_JS_FILE)
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--cache_size', type=int, default=CACHE_SIZE,
+                        help="Memoized results kept per query type (least recently used are evicted)")
+    parser.add_argument('--engine', type=str, choices=SERVER_ENGINES, default="auto",
+                        help="ISC kernels (see isc_kernels.py)")
+    parser.add_argument('--warm_maps', action='store_true',
+                        help="Compute the aligned subject maps at start instead of on the first /api/map")
+    args = parser.parse_args(argv)
+
+    state = AnalysisState(args.rdm_file, args.word_order_file, args.participants_file,
+                          args.experiment_js, args.cache_size, args.engine)
+    print(f"Loaded {state.all_rdms.shape[0]} participants x {state.all_rdms.shape[1]} words "
+          f"in {state.loaded_s}s (ISC engine: {state.engine})")
+    # first ISC call compiles numba kernels / warms numpy; not memoized
+    state._word_iscs(state.word_selection(None), state.subject_selection(None))
+    if args.warm_maps:
+        state._aligned_maps()
+        print("Subject maps ready")
+
+    create_app(state).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic multiarrangement cohorts for testing and benchmarking.
+
+Words live in a latent semantic space (category clusters); each
+participant's space is the group space plus individual noise. Every
+createCircleTrial of the experiment (the 90-word arrangement and the five
+category trials) is "arranged" by projecting the trial's words onto their
+first two principal axes, scaling into the circle and adding placement
+jitter. Placements and dissimilarity vectors are then computed exactly
+as in index.html (centre distances, min-max normalized per trial).
+
+Formats:
+  raw      jsPsych exports like data/ (consent, survey, fullscreen, six
+           arrangement rows); only for the 90-word registry vocabulary,
+           since preprocessing.py classifies trials by their word sets
+  cleaned  cleaned_*.csv like cleaned/, for any vocabulary size
+  rdms     preprocessed tensors like preprocessed/ (all_rdms.npy,
+           observed_mask.npy, participant_info.csv, word_order.csv)
+
+missing (cleaned / rdms): fraction of words dropped from each
+participant's full arrangement (cleaned; pairs across categories are
+then never observed, run preprocessing with --vocabulary
+<out>/vocabulary.csv) or fraction of pairs unobserved (rdms).
+outliers: fraction of participants who arrange at random.
+
+Usage:
+    python analysis/synthetic.py synth/raw --participants 30
+    python analysis/synthetic.py synth/cleaned --format cleaned --participants 200 --words 180 --missing 0.2
+    python analysis/synthetic.py synth/rdms --format rdms --participants 1000
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.spatial.distance import pdist, squareform
+
+from word_registry import CATEGORY_WORDS, N_WORDS
+
+FORMATS = ["raw", "cleaned", "rdms"]
+LATENT_DIM = 8
+CATEGORY_SPREAD = 2.0    # SD of category centres in the latent space
+WORD_SPREAD = 1.0        # SD of words around their category centre
+PLACEMENT_JITTER = 0.03  # SD of placement jitter, fraction of circle size
+ENCODING = "utf-8-sig"
+
+
+def vocabulary(n_words=N_WORDS):
+    """
+    (words, categories) for a vocabulary size: the registry's 90 words for
+    N_WORDS, else synthetic words w0000... split into the registry's
+    categories in the same proportions.
+    """
+    names = list(CATEGORY_WORDS)
+    if n_words == N_WORDS:
+        words = [w for ws in CATEGORY_WORDS.values() for w in ws]
+        categories = [name for name, ws in CATEGORY_WORDS.items() for _ in ws]
+        return words, categories
+
+    sizes = np.array([len(ws) for ws in CATEGORY_WORDS.values()], dtype=float)
+    bounds = np.round(np.cumsum(sizes) / sizes.sum() * n_words).astype(int)
+    counts = np.diff(np.r_[0, bounds])
+    if (counts < 2).any():
+        raise ValueError(f"Vocabulary of {n_words} words is too small for {len(names)} categories")
+    words = [f"w{i:04d}" for i in range(n_words)]
+    categories = [name for name, k in zip(names, counts) for _ in range(k)]
+    return words, categories
+
+
+def group_space(categories, rng):
+    """(n_words, LATENT_DIM) group coordinates: category clusters."""
+    names, codes = np.unique(categories, return_inverse=True)
+    centres = rng.normal(0, CATEGORY_SPREAD, size=(len(names), LATENT_DIM))
+    return centres[codes] + rng.normal(0, WORD_SPREAD, size=(len(codes), LATENT_DIM))
+
+
+def participant_space(group, noise, outlier, rng):
+    """A participant's latent coordinates (random ones for outliers)."""
+    if outlier:
+        return rng.normal(0, group.std(), size=group.shape)
+    return group + rng.normal(0, noise * WORD_SPREAD, size=group.shape)
+
+
+def circle_size(n):
+    """Drop-zone diameter used by createCircleTrial for n words."""
+    if n <= 15:
+        return 500
+    if n <= 25:
+        return 600
+    return 700
+
+
+def arrange(coords, rng):
+    """
+    Screen positions (cx, cy) of one trial: first two principal axes of the
+    trial's latent coordinates, scaled into the circle, plus jitter.
+    """
+    size = circle_size(len(coords))
+    centred = coords - coords.mean(axis=0)
+    u, s, _ = np.linalg.svd(centred, full_matrices=False)
+    xy = u[:, :2] * s[:2]
+    xy *= 0.45 * size / max(np.linalg.norm(xy, axis=1).max(), 1e-12)
+    xy += rng.normal(0, PLACEMENT_JITTER * size, size=xy.shape)
+    # keep every word inside the circle
+    r = np.linalg.norm(xy, axis=1, keepdims=True)
+    xy *= np.minimum(1.0, 0.49 * size / np.maximum(r, 1e-12))
+    return np.round(xy + size / 2, 1)
+
+
+def trial_payload(words, cxy):
+    """placements / distance_matrix / dissimilarity_vector as index.html computes them."""
+    size = circle_size(len(words))
+    dx, dy = cxy[:, 0] - size / 2, cxy[:, 1] - size / 2
+    angle = np.arctan2(dy, dx)
+    placements = [
+        {"word": w, "x": round(cx - 20, 1), "y": round(cy - 17.4, 1), "cx": cx, "cy": cy,
+         "angle_rad": round(a, 3), "angle_deg": round((np.degrees(a) + 360) % 360, 1)}
+        for w, (cx, cy), a in zip(words, cxy.tolist(), angle.tolist())
+    ]
+    d = pdist(cxy)
+    lo, hi = d.min(), d.max()
+    vec = (d - lo) / (hi - lo) if hi > lo else np.zeros_like(d)
+    return {
+        "placements": placements,
+        "n_words": len(words),
+        "words": list(words),
+        "distance_matrix": squareform(vec).tolist(),
+        "dissimilarity_vector": vec.tolist(),
+    }
+
+
+def participant_trials(space, words, categories, missing, rng):
+    """(trial_category, payload) for the full trial and the five category trials."""
+    words = np.asarray(words)
+    categories = np.asarray(categories)
+    full = np.arange(len(words))
+    if missing > 0:
+        full = full[rng.random(len(words)) >= missing]
+        if len(full) < 2:
+            full = rng.choice(len(words), 2, replace=False)
+            full.sort()
+
+    trials = [("all_words", full)]
+    trials += [(name, np.flatnonzero(categories == name)) for name in CATEGORY_WORDS]
+    return [(name, trial_payload(words[idx], arrange(space[idx], rng))) for name, idx in trials]
+
+
+def _metadata(rng):
+    return {
+        "mandarin_proficiency": str(rng.integers(3, 6)),
+        "age": str(rng.integers(18, 30)),
+        "gender": str(rng.choice(["female", "male"])),
+    }
+
+
+def raw_export(pid, trials, rng):
+    """One participant's jsPsych export (rows as in data/*.csv)."""
+    rows = [
+        {"trial_id": "consent_form", "response": "0", "trial_type": "html-button-response"},
+        {"response": json.dumps({"participant_date": "01/01/2026", "participant_time": "10:00AM"}),
+         "trial_type": "survey-html-form"},
+        {"response": json.dumps(_metadata(rng)), "trial_type": "survey-html-form"},
+        {"trial_type": "fullscreen", "success": True},
+    ]
+    for name, payload in trials:
+        rows.append({
+            "trial_type": "html-keyboard-response",
+            "raw_payload": json.dumps(payload, ensure_ascii=False),
+            "placements": json.dumps(payload["placements"], ensure_ascii=False),
+            "dissimilarity_vector": json.dumps(payload["dissimilarity_vector"]),
+            "n_words": float(payload["n_words"]),
+            "trial_category": name,
+            "distance_matrix": json.dumps(payload["distance_matrix"]),
+        })
+    rows.append({"trial_type": "call-function", "value": "null"})
+
+    df = pd.DataFrame(rows)
+    df["trial_index"] = np.arange(len(df))
+    df["plugin_version"] = "2.1.0"
+    df["time_elapsed"] = np.cumsum(rng.integers(2_000, 300_000, size=len(df)))
+    df["participant_number"] = pid
+    columns = ["trial_id", "rt", "stimulus", "response", "trial_type", "trial_index",
+               "plugin_version", "time_elapsed", "participant_number", "success", "raw_payload",
+               "placements", "dissimilarity_vector", "n_words", "trial_category",
+               "distance_matrix", "value"]
+    return df.reindex(columns=columns)
+
+
+def cleaned_export(pid, trials, rng):
+    """One participant's cleaned file (rows as in cleaned/cleaned_*.csv)."""
+    meta = _metadata(rng)
+    return pd.DataFrame([{
+        "participant_number": pid,
+        "trial_category": name,
+        "n_words": payload["n_words"],
+        "placements": json.dumps(payload["placements"], ensure_ascii=False),
+        "dissimilarity_vector": json.dumps(payload["dissimilarity_vector"]),
+        "distance_matrix": json.dumps(payload["distance_matrix"]),
+        "time_elapsed_sec": float(rng.integers(900, 2400)),
+        **meta,
+    } for name, payload in trials])
+
+
+def _participant_ids(n, rng):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789"))
+    return [f"syn{i:05d}_{''.join(rng.choice(letters, 6))}" for i in range(n)]
+
+
+def _outliers(n_participants, outliers, rng):
+    flags = np.zeros(n_participants, dtype=bool)
+    n_out = int(round(outliers * n_participants))
+    flags[rng.choice(n_participants, n_out, replace=False)] = True
+    return flags
+
+
+def make_rdms(n_participants=30, n_words=N_WORDS, noise=1.5, missing=0.0, outliers=0.0, seed=0):
+    """
+    Preprocessed-style RDM tensor.
+
+    Returns
+    -------
+    all_rdms : np.ndarray
+        (n_participants, n_words, n_words), each scaled to max 1;
+        unobserved pairs filled with the participant's observed mean.
+    mask : np.ndarray of bool
+        Same shape, True = observed pair (diagonal False).
+    participant_ids : list of str
+    words : list of str
+    """
+    rng = np.random.default_rng(seed)
+    words, categories = vocabulary(n_words)
+    group = group_space(categories, rng)
+    flags = _outliers(n_participants, outliers, rng)
+    iu = np.triu_indices(n_words, k=1)
+
+    all_rdms = np.zeros((n_participants, n_words, n_words))
+    mask = np.zeros((n_participants, n_words, n_words), dtype=bool)
+    for s in range(n_participants):
+        d = pdist(participant_space(group, noise, flags[s], rng))
+        d /= d.max()
+        observed = rng.random(len(d)) >= missing
+        if observed.any():
+            d[~observed] = d[observed].mean()
+        all_rdms[s] = squareform(d)
+        mask[s][iu] = observed
+        mask[s] |= mask[s].T
+    return all_rdms, mask, _participant_ids(n_participants, rng), words
+
+
+def make_cohort(output_folder, n_participants=30, n_words=N_WORDS, noise=1.5, missing=0.0,
+                outliers=0.0, seed=0, fmt="raw"):
+    """
+    Write a synthetic cohort to output_folder; returns the participant ids.
+    See the module docstring for the formats.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; choose from {FORMATS}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    if fmt == "rdms":
+        all_rdms, mask, ids, words = make_rdms(n_participants, n_words, noise, missing, outliers, seed)
+        np.save(os.path.join(output_folder, "all_rdms.npy"), all_rdms)
+        np.save(os.path.join(output_folder, "observed_mask.npy"), mask)
+        pd.DataFrame({"participant_id": ids}).to_csv(
+            os.path.join(output_folder, "participant_info.csv"), index=False)
+        pd.DataFrame({"word": words}).to_csv(
+            os.path.join(output_folder, "word_order.csv"), index=False, encoding=ENCODING)
+        return ids
+
+    if fmt == "raw" and n_words != N_WORDS:
+        raise ValueError(f"Raw exports need the {N_WORDS}-word registry vocabulary "
+                         "(preprocessing.py classifies trials by word set); use --format cleaned")
+    if fmt == "raw" and missing > 0:
+        raise ValueError("preprocessing.py drops incomplete full trials; "
+                         "use --format cleaned for missing pairs")
+
+    rng = np.random.default_rng(seed)
+    words, categories = vocabulary(n_words)
+    group = group_space(categories, rng)
+    flags = _outliers(n_participants, outliers, rng)
+    ids = _participant_ids(n_participants, rng)
+
+    for pid, outlier in zip(ids, flags):
+        space = participant_space(group, noise, outlier, rng)
+        trials = participant_trials(space, words, categories, missing, rng)
+        if fmt == "raw":
+            df = raw_export(pid, trials, rng)
+            path = os.path.join(output_folder, f"{pid.split('_')[0]}.csv")
+        else:
+            df = cleaned_export(pid, trials, rng)
+            path = os.path.join(output_folder, f"cleaned_{pid.split('_')[0]}.csv")
+        df.to_csv(path, index=False, encoding=ENCODING)
+
+    pd.DataFrame({"word": words}).to_csv(
+        os.path.join(output_folder, "vocabulary.csv"), index=False, encoding=ENCODING)
+    return ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic multiarrangement cohort.")
+    parser.add_argument('output_folder', type=str)
+    parser.add_argument('--format', type=str, choices=FORMATS, default="raw")
+    parser.add_argument('--participants', type=int, default=30)
+    parser.add_argument('--words', type=int, default=N_WORDS,
+                        help="Vocabulary size (raw exports: %(default)s only)")
+    parser.add_argument('--noise', type=float, default=1.5,
+                        help="Individual deviation from the group space, in word-spread SDs "
+                             "(default %(default)s gives word ISCs like the real cohort)")
+    parser.add_argument('--missing', type=float, default=0.0,
+                        help="cleaned: fraction of words left out of the full arrangement; "
+                             "rdms: fraction of unobserved pairs")
+    parser.add_argument('--outliers', type=float, default=0.0,
+                        help="Fraction of participants arranging at random")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    ids = make_cohort(args.output_folder, args.participants, args.words, args.noise,
+                      args.missing, args.outliers, args.seed, args.format)
+    print(f"Wrote {len(ids)} synthetic participants ({args.format}, {args.words} words) "
+          f"to {args.output_folder}")
+
+
+if __name__ == "__main__":
+    main()
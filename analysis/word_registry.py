@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single source of truth for the 90 experiment words.
+
+- Category word lists (zh), in the order they appear in experiment.js
+- Stable integer word ids (0-89, category by category) and category codes
+- zh -> en translations parsed from experiment.js, cached in
+  cache/registry/ and keyed by the file's size and mtime
+- Vectorized id <-> word <-> category lookups, so later stages can work
+  with integer NumPy arrays instead of string sets and .map/.apply
+- Trial classification: a trial's word set is reduced to a canonical
+  signature (sorted unique word ids as bytes) and looked up in a
+  precomputed signature -> trial_category table
+
+Usage:
+    import word_registry as wr
+    ids = wr.word_ids(["猫", "椅子"])        # array([1, 25])
+    wr.CATEGORY_LABELS[wr.category_codes(ids)]
+    wr.word_table(["猫", "椅子"])             # DataFrame with labels/categories
+"""
+
+import os
+import re
+import json
+
+import numpy as np
+import pandas as pd
+
+EXPERIMENT_JS_FILE = "experiment.js"
+CACHE_DIR = "cache/registry"
+
+# -------- CATEGORY WORD LISTS (from experiment.js, zh only) --------
+# Keys are the trial_category names used by preprocessing.py.
+CATEGORY_WORDS = {
+    "animals": (
+        "蚂蚁","猫","大象","长颈鹿","熊猫","兔子","老鼠","麻雀","老虎","乌龟",
+    ),
+    "body_parts": (
+        "脚踝","胳膊","耳朵","眼睛","手指","膝盖","嘴唇","鼻子","肩膀","大腿",
+    ),
+    "artifacts": (
+        "空调","斧头","床","扫帚","柜子","椅子","筷子","鼠标","锤子","钥匙",
+        "微波炉","铅笔","冰箱","剪刀","沙发","勺子","桌子","电视","牙刷","洗衣机",
+    ),
+    "emotional_nonobject": (
+        "愤怒","反感","冷漠","慈善","舒心","死亡","债务","沮丧","疾病","纠纷",
+        "错误","兴奋","缘分","过失","恐惧","骗局","友情","快乐","天堂","敌意",
+        "爱心","魔力","婚姻","奇迹","骄傲","难过","风景","光彩","创伤","暴力",
+    ),
+    "nonemotional_nonobject": (
+        "协议","买卖","性质","概念","内容","数据","纪律","作用","身份","方法",
+        "义务","现象","过程","原因","关系","结果","社会","地位","制度","团队",
+    ),
+}
+
+# Display labels; category code = position in this array
+CATEGORY_LABELS = np.array([
+    "Animal",
+    "Face/Body Part",
+    "Artifact",
+    "Emotional Nonobject",
+    "Nonemotional Nonobject",
+    "Unknown",
+])
+UNKNOWN = len(CATEGORY_LABELS) - 1
+
+CATEGORY_COLORS = {
+    "Animal": "#b2182b",
+    "Face/Body Part": "#ef8a62",
+    "Artifact": "#fddbc7",
+    "Emotional Nonobject": "#4393c3",
+    "Nonemotional Nonobject": "#2166ac",
+    "Unknown": "#999999",
+}
+
+# -------- Derived arrays (word id = row) --------
+WORDS_ZH = np.array([w for words in CATEGORY_WORDS.values() for w in words])
+WORD_CATEGORY_CODES = np.concatenate([
+    np.full(len(words), code, dtype=np.int8)
+    for code, words in enumerate(CATEGORY_WORDS.values())
+])
+N_WORDS = len(WORDS_ZH)
+
+_WORD_INDEX = pd.Index(WORDS_ZH)
+WORD_ID = {w: i for i, w in enumerate(WORDS_ZH.tolist())}
+
+# Sets, for code that still wants membership tests
+animals_zh = frozenset(CATEGORY_WORDS["animals"])
+body_parts_zh = frozenset(CATEGORY_WORDS["body_parts"])
+artifacts_zh = frozenset(CATEGORY_WORDS["artifacts"])
+emotional_zh = frozenset(CATEGORY_WORDS["emotional_nonobject"])
+nonemotional_zh = frozenset(CATEGORY_WORDS["nonemotional_nonobject"])
+all_words_zh = frozenset(WORDS_ZH.tolist())
+
+
+# ---------------------------------------------------------------------
+# Vectorized lookups
+# ---------------------------------------------------------------------
+
+def word_ids(words):
+    """Array of word ids for an iterable of zh words (-1 if unknown)."""
+    return _WORD_INDEX.get_indexer(np.asarray(list(words), dtype=object))
+
+
+def category_codes(ids):
+    """Category codes for word ids; unknown ids (-1) map to UNKNOWN."""
+    ids = np.asarray(ids)
+    codes = np.full(ids.shape, UNKNOWN, dtype=np.int8)
+    known = ids >= 0
+    codes[known] = WORD_CATEGORY_CODES[ids[known]]
+    return codes
+
+
+def get_category(word_zh):
+    """Display category of a single zh word ("Unknown" if not registered)."""
+    return CATEGORY_LABELS[category_codes(word_ids([word_zh]))[0]]
+
+
+# ---------------------------------------------------------------------
+# Trial classification
+# ---------------------------------------------------------------------
+
+def trial_signature(ids):
+    """Canonical key of a trial's word set: sorted unique word ids as bytes."""
+    return np.unique(np.asarray(ids, dtype=np.int32)).tobytes()
+
+
+# signature -> (trial_category, n_words); add new trial variants here
+TRIAL_TYPES = {
+    trial_signature(np.arange(N_WORDS)): ("all_words", N_WORDS),
+    **{
+        trial_signature(word_ids(words)): (name, len(words))
+        for name, words in CATEGORY_WORDS.items()
+    },
+}
+
+
+def classify_trial(words):
+    """
+    (trial_category, n_unique_words) for a trial's list of zh words.
+    Unregistered word sets give ("unknown_<n>", n).
+    """
+    ids = [WORD_ID.get(w, -1) for w in words]
+    hit = TRIAL_TYPES.get(trial_signature(ids))
+    if hit is not None:
+        return hit
+    n = len(set(words))
+    return f"unknown_{n}", n
+
+
+# ---------------------------------------------------------------------
+# Translations (experiment.js)
+# ---------------------------------------------------------------------
+
+def _parse_zh_en(js_path):
+    with open(js_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    # regex: { zh: "xxxx", en: "yyyy" }
+    pairs = re.findall(r'\{\s*zh:\s*"([^"]+)"\s*,\s*en:\s*"([^"]+)"\s*\}', text)
+    return {zh: en for zh, en in pairs}
+
+
+def load_translations(js_path=EXPERIMENT_JS_FILE, cache_dir=CACHE_DIR):
+    """
+    { zh: en } from experiment.js. The parsed mapping is cached as JSON,
+    keyed by the file's size and mtime, so the regex runs once per edit.
+    """
+    st = os.stat(js_path)
+    key = f"{st.st_size}_{st.st_mtime_ns}"
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"zh_en_{key}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+    mapping = _parse_zh_en(js_path)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(mapping, f, ensure_ascii=False)
+    return mapping
+
+
+def english_labels(js_path=EXPERIMENT_JS_FILE, cache_dir=CACHE_DIR):
+    """Array of English labels in word-id order (zh word if untranslated)."""
+    zh2en = load_translations(js_path, cache_dir)
+    return np.array([zh2en.get(w, w) for w in WORDS_ZH], dtype=object)
+
+
+def word_table(words_zh, js_path=EXPERIMENT_JS_FILE, cache_dir=CACHE_DIR):
+    """
+    Table for a word order (e.g. word_order.csv), one row per position:
+    word_index, word_id, word_zh, word_en, category_code, category.
+    word_en is NaN for words without a translation.
+    """
+    ids = word_ids(words_zh)
+    codes = category_codes(ids)
+    zh2en = load_translations(js_path, cache_dir)
+    words_zh = list(words_zh)
+    return pd.DataFrame({
+        "word_index": np.arange(len(words_zh)),
+        "word_id": ids,
+        "word_zh": words_zh,
+        "word_en": [zh2en.get(w, np.nan) for w in words_zh],
+        "category_code": codes,
+        "category": CATEGORY_LABELS[codes],
+    })